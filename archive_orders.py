@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+"""
+Move completed orders older than ARCHIVE_AFTER_DAYS (default 30) from orders
+to orders_archive, in batches
+The employee service does this in the background every hour; this runs the
+same job once, e.g. after lowering the age or before a migration. Safe to run
+at any time, including while the services are up.
+
+Run with --days N to archive orders completed more than N days ago
+"""
+
+import sys
+
+from ordering_core.config import database
+from ordering_core.order_archive import ARCHIVE_COLLECTION, archiver_from_env
+
+# Connect to MongoDB
+db = database()
+
+archiver = archiver_from_env(db)
+if '--days' in sys.argv[1:]:
+    archiver.age_days = float(sys.argv[sys.argv.index('--days') + 1])
+
+print(f"📦 Archiving orders completed more than {archiver.age_days:g} days ago...")
+total = archiver.run_once(progress=lambda done: print(f"   {done} orders"))
+run = archiver.last_run
+print(f"\n✨ Archived {total} orders in {run['seconds']}s"
+      + (f" ({run['orders_per_second']} orders/s)" if total else ""))
+print(f"   {db.orders.estimated_document_count()} orders remain in orders, "
+      f"{db[ARCHIVE_COLLECTION].estimated_document_count()} in {ARCHIVE_COLLECTION}")
+db.client.close()
@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+"""
+Roll up existing completed orders into the analytics_rollups collection
+Orders completed from now on are rolled up by the employee service as they
+complete; this covers the history before that. Safe to run again: orders that
+are already rolled up are skipped.
+
+Run with --rebuild to drop every rollup and recount all completed orders
+"""
+
+import sys
+
+from ordering_core import analytics
+from ordering_core.config import database
+
+# Connect to MongoDB
+db = database()
+
+if '--rebuild' in sys.argv[1:]:
+    print("🧹 Dropping existing rollups...")
+    analytics.reset(db)
+
+print("📊 Rolling up completed orders...")
+total = analytics.backfill(db, progress=lambda done: print(f"   {done} orders"))
+print(f"\n✨ Rolled up {total} orders!")
+db.client.close()
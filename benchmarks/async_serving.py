@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+Open live feeds and status updates under the threaded and the async serving mode
+
+Serves employee_service under gunicorn with one worker, first threaded
+(SERVING_MODE=sync: app.py on --threads gthread threads), then async
+(SERVING_MODE=async: asgi.py on a uvicorn worker), and against each:
+
+  - opens --streams Server-Sent Events connections to /api/orders/stream and
+    counts how many get their snapshot within --connect-timeout
+  - for --duration seconds runs --writers kitchen clients moving orders between
+    pending and in_progress through /orders/<order_id>/status, --rate updates
+    a second between them
+  - twice a second flips a marker order and times its arrival on every open feed
+
+Prints the feeds held, status update throughput, latency and errors, marker
+delivery percentiles and the worker's threads and memory for each mode.
+
+    python benchmarks/async_serving.py --mock --streams 1000 --duration 10
+
+Without --mock the server uses MONGO_URI; its orders, menu_items, counters and
+sms_outbox collections are dropped first.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from harness import ROOT, percentile
+
+HOST = '127.0.0.1'
+
+
+def raise_file_limit():
+    # Every open feed is a socket on both ends
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def serve(args):
+    """The server process: employee_service under gunicorn in --mode, with seeded orders"""
+    from gunicorn.app.base import BaseApplication
+
+    class Server(BaseApplication):
+        def load_config(self):
+            settings = {
+                'bind': f'{HOST}:{args.port}', 'workers': 1, 'threads': args.threads, 'backlog': 4096,
+                'worker_connections': args.streams * 2 + 100, 'timeout': 60, 'graceful_timeout': 2,
+                'accesslog': None, 'errorlog': '-', 'loglevel': 'warning',
+                'worker_class': 'uvicorn_worker.UvicornWorker' if args.mode == 'async' else 'gthread'
+            }
+            for key, value in settings.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            # In the worker, after the fork, as the services' gunicorn.conf.py requires
+            from harness import load_asgi, load_services
+            from lifecycle import seed_menu
+            services = load_services(mock=args.mock, services=['customer_service', 'employee_service'])
+            db = services['customer_service'].mongo.db
+            for collection in ('orders', 'menu_items', 'counters', 'sms_outbox'):
+                db.drop_collection(collection)
+            seed_menu(db)
+            customer = services['customer_service'].app.test_client()
+            menu = customer.get('/api/menu_items').get_json()
+            for n in range(args.orders):
+                customer.post('/place_order', data={
+                    'customer_name': f'Feed {n}', 'customer_phone': '',
+                    'order_items': json.dumps([{'id': menu[n % len(menu)]['_id'], 'quantity': 1}])})
+            employee = services['employee_service']
+            employee.active_orders.wait_until_ready()
+            if args.mode == 'async':
+                return load_asgi({'employee_service': employee})['employee_service'].app
+            return employee.app
+
+    raise_file_limit()
+    sys.argv = sys.argv[:1]
+    Server().run()
+
+
+class Connection:
+    """Minimal keep-alive HTTP/1.1 client (asyncio streams), enough for JSON and chunked SSE responses"""
+
+    def __init__(self, port):
+        self.port = port
+        self.reader = self.writer = None
+
+    async def open(self):
+        self.reader, self.writer = await asyncio.open_connection(HOST, self.port)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+    async def send(self, method, path, body=b''):
+        self.writer.write(f'{method} {path} HTTP/1.1\r\nHost: {HOST}\r\nContent-Length: {len(body)}\r\n'
+                          f'Content-Type: application/json\r\n\r\n'.encode() + body)
+        await self.writer.drain()
+        head = (await self.reader.readuntil(b'\r\n\r\n')).decode('latin-1').split('\r\n')
+        headers = dict(line.split(': ', 1) for line in head[1:] if ': ' in line)
+        return int(head[0].split()[1]), {name.lower(): value for name, value in headers.items()}
+
+    async def chunks(self):
+        """The decoded chunks of a chunked response body"""
+        while True:
+            size = int((await self.reader.readuntil(b'\r\n')).split(b';')[0], 16)
+            chunk = await self.reader.readexactly(size + 2)
+            if not size:
+                return
+            yield chunk[:-2]
+
+    async def request(self, method, path, body=b''):
+        status, headers = await self.send(method, path, body)
+        if 'content-length' in headers:
+            return status, await self.reader.readexactly(int(headers['content-length']))
+        return status, b''.join([chunk async for chunk in self.chunks()])
+
+
+class Feed:
+    """One open /api/orders/stream connection, timing the marker's changes"""
+
+    def __init__(self, port, marker):
+        self.connection = Connection(port)
+        self.marker = marker.encode()
+        self.connected = asyncio.get_running_loop().create_future()
+        self.seen = {}
+
+    async def run(self, flips):
+        try:
+            await self.connection.open()
+            status, _ = await self.connection.send('GET', '/api/orders/stream')
+            if status != 200:
+                raise ConnectionError(status)
+            buffer = b''
+            async for chunk in self.connection.chunks():
+                buffer += chunk
+                *frames, buffer = buffer.split(b'\n\n')
+                for frame in frames:
+                    if not self.connected.done():
+                        self.connected.set_result(time.perf_counter())
+                    elif frame.startswith(b'event: upsert') and self.marker in frame:
+                        data = json.loads(frame.split(b'data: ', 1)[1])
+                        if data['status'] in flips and data['status'] not in self.seen:
+                            self.seen[data['status']] = time.perf_counter()
+        except (OSError, ValueError, asyncio.IncompleteReadError) as e:
+            if not self.connected.done():
+                self.connected.set_exception(e)
+
+
+async def writer(port, order_ids, interval, stop, latencies, counts):
+    connection = Connection(port)
+    await connection.open()
+    while not stop.is_set():
+        order_id = random.choice(order_ids)
+        body = json.dumps({'status': random.choice(['pending', 'in_progress'])}).encode()
+        start = time.perf_counter()
+        try:
+            status, _ = await asyncio.wait_for(connection.request('POST', f'/orders/{order_id}/status', body), 5)
+            counts['errors' if status >= 400 else 'ok'] += 1
+        except (OSError, ValueError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+            counts['errors'] += 1
+            connection.close()
+            connection = Connection(port)
+            try:
+                await connection.open()
+            except OSError:
+                await asyncio.sleep(0.1)
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(max(0.0, interval - latencies[-1]))
+    connection.close()
+
+
+def worker_stats(master_pid):
+    """Threads and resident memory (MB) of the gunicorn worker"""
+    for pid in os.listdir('/proc'):
+        try:
+            with open(f'/proc/{pid}/stat') as f:
+                if pid.isdigit() and int(f.read().rsplit(')', 1)[1].split()[1]) == master_pid:
+                    with open(f'/proc/{pid}/status') as status:
+                        fields = dict(line.split(':', 1) for line in status)
+                    return int(fields['Threads']), round(int(fields['VmRSS'].split()[0]) / 1024, 1)
+        except (OSError, ValueError, IndexError):
+            continue
+    return None, None
+
+
+async def wait_for_server(port, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        connection = Connection(port)
+        try:
+            await connection.open()
+            status, body = await connection.request('GET', '/orders')
+            if status == 200:
+                return json.loads(body)
+        except (OSError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            connection.close()
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f'service did not start on port {port}')
+
+
+async def drive(args, server):
+    orders = await wait_for_server(args.port)
+    marker, order_ids = orders[0]['_id'], [order['_id'] for order in orders[1:]]
+    flips = ['pending', 'in_progress']
+
+    opened = time.perf_counter()
+    feeds = [Feed(args.port, marker) for _ in range(args.streams)]
+    tasks = [asyncio.ensure_future(feed.run(flips)) for feed in feeds]
+    await asyncio.wait([feed.connected for feed in feeds], timeout=args.connect_timeout)
+    held = [feed for feed in feeds if feed.connected.done() and not feed.connected.exception()]
+    connect_times = sorted(feed.connected.result() - opened for feed in held)
+
+    stop = asyncio.Event()
+    latencies, counts = [], {'ok': 0, 'errors': 0}
+    writers = [asyncio.ensure_future(writer(args.port, order_ids, args.writers / args.rate, stop, latencies, counts))
+               for _ in range(args.writers)]
+    delays, missed, peak = [], 0, (None, None)
+    control = Connection(args.port)
+    await control.open()
+    started = time.perf_counter()
+    while time.perf_counter() - started < args.duration:
+        status = flips[0]
+        for feed in held:
+            feed.seen.pop(status, None)
+        flipped = time.perf_counter()
+        try:
+            await asyncio.wait_for(control.request('POST', f'/orders/{marker}/status',
+                                                   json.dumps({'status': status}).encode()), 5)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+            control.close()
+            control = Connection(args.port)
+            await control.open()
+        await asyncio.sleep(0.5)
+        for feed in held:
+            if status in feed.seen:
+                delays.append(feed.seen[status] - flipped)
+            else:
+                missed += 1
+        flips.reverse()
+        stats = worker_stats(server.pid)
+        if stats[0] is not None and (peak[0] is None or stats[0] > peak[0]):
+            peak = stats
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await asyncio.wait(writers, timeout=10)
+    control.close()
+    for feed in feeds:
+        feed.connection.close()
+    for task in tasks + writers:
+        task.cancel()
+    await asyncio.gather(*tasks, *writers, return_exceptions=True)
+
+    latencies.sort()
+    delays.sort()
+    return {
+        'feeds held': f'{len(held)}/{args.streams}',
+        'feed connect p99 ms': round(percentile(connect_times, 99) * 1000, 1) if connect_times else None,
+        'status updates/s': round(counts['ok'] / elapsed, 1),
+        'status p50 ms': round(percentile(latencies, 50) * 1000, 2) if latencies else None,
+        'status p99 ms': round(percentile(latencies, 99) * 1000, 2) if latencies else None,
+        'status errors': counts['errors'],
+        'marker delivery p50 ms': round(percentile(delays, 50) * 1000, 1) if delays else None,
+        'marker delivery p99 ms': round(percentile(delays, 99) * 1000, 1) if delays else None,
+        'marker deliveries missed': missed,
+        'worker threads': peak[0],
+        'worker RSS MB': peak[1]
+    }
+
+
+def run_mode(args, mode):
+    command = [sys.executable, os.path.abspath(__file__), '--serve', '--mode', mode, '--port', str(args.port),
+               '--threads', str(args.threads), '--streams', str(args.streams), '--orders', str(args.orders)]
+    env = dict(os.environ, GUNICORN_THREADS=str(args.threads))
+    server = subprocess.Popen(command + (['--mock'] if args.mock else []), cwd=ROOT, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        return asyncio.run(drive(args, server))
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mock', action='store_true', help='use in-process mongomock instead of MONGO_URI')
+    parser.add_argument('--streams', type=int, default=1000, help='open live feed connections')
+    parser.add_argument('--writers', type=int, default=8, help='concurrent kitchen clients')
+    parser.add_argument('--rate', type=float, default=10.0, help='status updates a second, all writers together')
+    parser.add_argument('--orders', type=int, default=20, help='active orders to seed')
+    parser.add_argument('--threads', type=int, default=8, help='gunicorn threads (the Flask pool in async mode)')
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--connect-timeout', type=float, default=10.0)
+    parser.add_argument('--port', type=int, default=5098)
+    parser.add_argument('--modes', default='sync,async')
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--mode', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        serve(args)
+        return
+
+    raise_file_limit()
+    modes = args.modes.split(',')
+    results = {}
+    for mode in modes:
+        print(f"🏁 {mode}: {args.streams} live feeds, {args.writers} kitchen clients, {args.duration:.0f}s...")
+        results[mode] = run_mode(args, mode)
+
+    print(f"\n   {'':<26}" + ''.join(f'{mode:>12}' for mode in modes))
+    for key in results[modes[0]]:
+        print(f"   {key:<26}" + ''.join(f'{results[mode][key]!s:>12}' for mode in modes))
+
+
+if __name__ == '__main__':
+    main()
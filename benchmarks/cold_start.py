@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Cold start of each service: time to import app.py, then the first and a warm
+request to its page and its main API route
+
+Each import and each set of requests runs in a fresh interpreter, as a new
+container or gunicorn worker would, and --runs runs per service are
+summarised by their median. Also lists how many modules the import loaded and
+which optional heavy ones among them (an SMS provider client, the asyncio
+stack) a threaded worker does not need.
+
+The import needs no database: the client connects lazily, and with --mock it
+is pointed at an unreachable address so mongomock's own imports are not
+counted. The requests then run on mongomock with a seeded menu. Without
+--mock the services connect to MONGO_URI, which should already hold a menu
+(seed_menu_items.py).
+
+All runs share one fresh TEMPLATE_CACHE_DIR, as the workers of a container
+do, so only the first run of each service compiles its templates.
+
+    python benchmarks/cold_start.py --mock --runs 5
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from harness import SERVICES, load_services
+
+ROUTES = {
+    'customer_service': ['/', '/api/menu_items'],
+    'employee_service': ['/worker', '/orders'],
+    'display_service': ['/', '/api/display/orders']
+}
+OPTIONAL_MODULES = ['twilio', 'asyncio', 'motor', 'a2wsgi']
+WARM_REQUESTS = 20
+UNREACHABLE_URI = 'mongodb://127.0.0.1:9/cold_start'
+
+
+def time_import(args):
+    """Import the service in this (fresh) process; prints the time and modules as JSON"""
+    before = set(sys.modules)
+    start = time.perf_counter()
+    load_services(services=[args.service])
+    loaded = set(sys.modules) - before
+    print(json.dumps({'import ms': (time.perf_counter() - start) * 1000,
+                      'modules': len(loaded),
+                      'optional': [name for name in OPTIONAL_MODULES if name in loaded]}))
+    # The services' background threads would keep the process alive
+    sys.stdout.flush()
+    os._exit(0)
+
+
+def time_requests(args):
+    """First and warm requests of the service imported in this (fresh) process, as JSON"""
+    service = load_services(mock=args.mock, services=[args.service])[args.service]
+    if args.mock:
+        from lifecycle import seed_menu
+        seed_menu(service.mongo.db)
+    client = service.app.test_client()
+    result = {}
+    for path in ROUTES[args.service]:
+        start = time.perf_counter()
+        status = client.get(path).status_code
+        result[f'first {path} ms'] = (time.perf_counter() - start) * 1000
+        if status != 200:
+            raise SystemExit(f'{args.service} {path}: HTTP {status}')
+        timings = []
+        for _ in range(WARM_REQUESTS):
+            start = time.perf_counter()
+            client.get(path)
+            timings.append(time.perf_counter() - start)
+        result[f'warm {path} ms'] = statistics.median(timings) * 1000
+    print(json.dumps(result))
+    sys.stdout.flush()
+    os._exit(0)
+
+
+def child(args, phase, name):
+    command = [sys.executable, os.path.abspath(__file__), f'--phase={phase}', f'--service={name}']
+    env = dict(os.environ)
+    if args.mock:
+        command.append('--mock')
+        # Importing only builds the (lazily connecting) client, so point it at nothing
+        if phase == 'import':
+            env['MONGO_URI'] = UNREACHABLE_URI
+    output = subprocess.run(command, env=env, capture_output=True, text=True)
+    if output.returncode:
+        print(output.stdout, output.stderr)
+        sys.exit(output.returncode)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mock', action='store_true', help='use in-process mongomock instead of MONGO_URI')
+    parser.add_argument('--runs', type=int, default=5, help='fresh processes per service')
+    parser.add_argument('--services', nargs='+', default=SERVICES, choices=SERVICES)
+    parser.add_argument('--service', help=argparse.SUPPRESS)
+    parser.add_argument('--phase', choices=['import', 'requests'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.phase == 'import':
+        time_import(args)
+    elif args.phase == 'requests':
+        time_requests(args)
+
+    os.environ['TEMPLATE_CACHE_DIR'] = tempfile.mkdtemp(prefix='cold-start-')
+    for name in args.services:
+        print(f"🧊 {name}: {args.runs} cold starts...")
+        runs = [{**child(args, 'import', name), **child(args, 'requests', name)} for _ in range(args.runs)]
+        for key in runs[0]:
+            if key == 'optional':
+                value = ', '.join(sorted(set().union(*(run[key] for run in runs)))) or 'none'
+            else:
+                value = f"{statistics.median(run[key] for run in runs):.1f}".removesuffix('.0')
+            print(f"   {key:<32} {value:>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""Shared helpers for the benchmarks: load the three Flask apps in-process and
+count MongoDB operations per route.
+
+With ``mock=True`` every service talks to one shared mongomock client
+(``pip install mongomock``); otherwise they connect to MONGO_URI as usual, so
+point it at a scratch database.
+"""
+import importlib.util
+import os
+import sys
+import threading
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVICES = ['customer_service', 'employee_service', 'display_service']
+
+MOCK_OPERATIONS = [
+    'find', 'find_one', 'insert_one', 'insert_many', 'update_one', 'update_many', 'delete_one',
+    'delete_many', 'find_one_and_update', 'bulk_write', 'count_documents', 'aggregate', 'create_index'
+]
+
+_current = threading.local()
+_mock_client = None
+
+
+def set_label(label):
+    """Attribute the Mongo operations this thread issues from now on to ``label``"""
+    _current.label = label
+
+
+class OpCounter:
+    """Mongo operations per label; threads without a label count as 'background'.
+
+    With ``by_thread`` they count as ``background:<thread name>`` instead.
+    """
+
+    def __init__(self, by_thread=False):
+        self.counts = Counter()
+        self.by_thread = by_thread
+        self._lock = threading.Lock()
+
+    def record(self):
+        label = getattr(_current, 'label', None)
+        if label is None:
+            label = f'background:{threading.current_thread().name}' if self.by_thread else 'background'
+        with self._lock:
+            self.counts[label] += 1
+
+
+def _install_listener(counter):
+    from pymongo import monitoring
+
+    class Listener(monitoring.CommandListener):
+        def started(self, event):
+            if event.command_name not in ('hello', 'isMaster', 'ping', 'endSessions'):
+                counter.record()
+
+        def succeeded(self, event):
+            pass
+
+        def failed(self, event):
+            pass
+
+    monitoring.register(Listener())
+
+
+def _install_mock(counter):
+    global _mock_client
+    import flask_pymongo
+    import mongomock
+    from pymongo.errors import OperationFailure
+    client = _mock_client = mongomock.MongoClient()
+    flask_pymongo.MongoClient = lambda *args, **kwargs: client
+
+    # mongomock has no change streams; behave like a standalone server so watchers poll
+    def watch(self, *args, **kwargs):
+        raise OperationFailure('The $changeStream stage is only supported on replica sets')
+    mongomock.collection.Collection.watch = watch
+    for name in MOCK_OPERATIONS:
+        original = getattr(mongomock.collection.Collection, name)
+
+        def counted(self, *args, _original=original, **kwargs):
+            # mongomock implements some operations on top of others; count only the outermost call
+            if getattr(_current, 'in_op', False):
+                return _original(self, *args, **kwargs)
+            counter.record()
+            _current.in_op = True
+            try:
+                return _original(self, *args, **kwargs)
+            finally:
+                _current.in_op = False
+        setattr(mongomock.collection.Collection, name, counted)
+
+
+def load_services(mock=False, counter=None, services=SERVICES, replicas=1):
+    """Import each service's app.py under its own module name; returns {name: module}.
+
+    With ``replicas`` above 1 each service is imported that many times, as
+    separate processes would run it; the extra copies are keyed ``name#2``,
+    ``name#3``, ...
+    """
+    os.environ.setdefault('SMS_PROVIDER', 'fake')
+    os.environ.setdefault('SMS_FAKE_LATENCY', '0')
+    if counter is not None and not mock:
+        _install_listener(counter)
+    if mock:
+        _install_mock(counter or OpCounter())
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    modules = {}
+    for name in services:
+        for replica in range(1, replicas + 1):
+            key, module_name = (name, f'{name}_app') if replica == 1 else (f'{name}#{replica}', f'{name}_app_{replica}')
+            path = os.path.join(ROOT, name, 'app.py')
+            spec = importlib.util.spec_from_file_location(module_name, path)
+            module = importlib.util.module_from_spec(spec)
+            # Flask finds templates relative to the module registered under the app's import name
+            sys.modules[spec.name] = module
+            spec.loader.exec_module(module)
+            module.app.config['TESTING'] = True
+            modules[key] = module
+    return modules
+
+
+def load_asgi(services):
+    """Import the asgi.py of each service returned by load_services; returns {name: module}.
+
+    Each asgi.py wraps the app.py module already loaded, as ``import app``
+    would inside the service directory. After load_services(mock=True) their
+    Motor clients share the mongomock client (``pip install mongomock-motor``).
+    """
+    if _mock_client is not None:
+        from mongomock_motor import AsyncMongoMockClient
+        from ordering_core import async_serving
+        async_serving.AsyncIOMotorClient = lambda *args, **kwargs: AsyncMongoMockClient(mock_mongo_client=_mock_client)
+    modules = {}
+    for name, service in services.items():
+        if '#' in name:
+            continue
+        spec = importlib.util.spec_from_file_location(f'{name}_asgi', os.path.join(ROOT, name, 'asgi.py'))
+        module = importlib.util.module_from_spec(spec)
+        previous = sys.modules.get('app')
+        sys.modules['app'] = service
+        try:
+            spec.loader.exec_module(module)
+        finally:
+            if previous is None:
+                del sys.modules['app']
+            else:
+                sys.modules['app'] = previous
+        modules[name] = module
+    return modules
+
+
+def percentile(values, pct):
+    """``pct`` percentile of an already sorted list"""
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+CPU per request and bytes sent for the order and menu JSON routes, per JSON
+backend and content encoding
+
+Runs the three services in-process with --orders active orders and, for each
+route, times --requests sequential requests with the CPU clock of the calling
+thread (the test client runs the app on the same thread, so this is the CPU
+one request costs). Each JSON backend (serialization.py, JSON_BACKEND=json or
+orjson) runs in a fresh subprocess; within it every route is requested
+without compression and with each encoding the client accepts.
+
+    python benchmarks/json_serialization.py --mock --orders 150
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from harness import load_services
+
+ROUTES = [
+    ('customer_service', '/api/menu_items'),
+    ('customer_service', '/orders'),
+    ('employee_service', '/orders'),
+    ('employee_service', '/api/orders'),
+    ('display_service', '/api/display/orders')
+]
+ENCODINGS = {'identity': '', 'gzip': 'gzip', 'br': 'br, gzip'}
+
+
+def place_orders(customer, count):
+    client = customer.app.test_client()
+    menu = client.get('/api/menu_items').get_json()
+    for i in range(count):
+        lines = [{'id': item['_id'], 'quantity': random.randint(1, 3),
+                  'customization_ids': [c['id'] for c in item['customizations'] if random.random() < 0.3]}
+                 for item in random.sample(menu, k=random.randint(1, 3))]
+        client.post('/place_order', data={'customer_name': f'Customer {i}', 'customer_phone': '555-0100',
+                                          'order_items': json.dumps(lines)})
+
+
+def run(args):
+    """One backend in this process; prints {route: {encoding: [cpu ms, bytes]}} as JSON"""
+    from lifecycle import seed_menu
+    services = load_services(mock=args.mock)
+    from ordering_core import serialization
+    db = services['customer_service'].mongo.db
+    for collection in ('orders', 'menu_items', 'counters', 'sms_outbox'):
+        db.drop_collection(collection)
+    seed_menu(db)
+    random.seed(1)
+    place_orders(services['customer_service'], args.orders)
+    for service in services.values():
+        service.active_orders.wait_until_ready()
+    # Let every cache's watcher pick up the orders the customer service placed
+    time.sleep(services['display_service'].active_orders.poll_interval + 0.5)
+
+    result = {'backend': serialization.BACKEND}
+    for name, path in ROUTES:
+        client = services[name].app.test_client()
+        timings = result[f'{name} {path}'] = {}
+        for encoding in args.encodings:
+            if encoding == 'br' and serialization.brotli is None:
+                continue
+            headers = {'Accept-Encoding': ENCODINGS[encoding]}
+            size = len(client.get(path, headers=headers).data)
+            start = time.thread_time()
+            for _ in range(args.requests):
+                client.get(path, headers=headers)
+            timings[encoding] = [(time.thread_time() - start) / args.requests * 1000, size]
+    print(json.dumps(result))
+    os._exit(0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mock', action='store_true', help='use in-process mongomock instead of MONGO_URI')
+    parser.add_argument('--orders', type=int, default=150, help='active orders')
+    parser.add_argument('--requests', type=int, default=200, help='requests per route and encoding')
+    parser.add_argument('--backends', nargs='+', default=['json', 'orjson'])
+    parser.add_argument('--encodings', nargs='+', default=list(ENCODINGS), choices=list(ENCODINGS))
+    parser.add_argument('--run', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run:
+        run(args)
+        return
+
+    results = {}
+    for backend in args.backends:
+        print(f"🏁 {backend}: {args.orders} active orders, {args.requests} requests per route and encoding...")
+        command = [sys.executable, os.path.abspath(__file__), '--run', f'--orders={args.orders}',
+                   f'--requests={args.requests}', '--encodings', *args.encodings] + (['--mock'] if args.mock else [])
+        output = subprocess.run(command, env=dict(os.environ, JSON_BACKEND=backend), capture_output=True, text=True)
+        if output.returncode:
+            print(output.stdout, output.stderr)
+            sys.exit(output.returncode)
+        results[backend] = json.loads(output.stdout.strip().splitlines()[-1])
+        if results[backend].pop('backend') != backend:
+            print(f"   {backend} is not installed, skipped")
+            del results[backend]
+
+    columns = [(backend, encoding) for backend in results for encoding in args.encodings
+               if encoding in next(iter(results[backend].values()))]
+    print("\n   CPU ms per request (bytes sent)")
+    print(f"   {'route':<40}" + ''.join(f"{f'{backend} {encoding}':>22}" for backend, encoding in columns))
+    for route in next(iter(results.values())):
+        cells = []
+        for backend, encoding in columns:
+            cpu, size = results[backend][route][encoding]
+            cells.append(f"{cpu:.3f} ({size})")
+        print(f"   {route:<40}" + ''.join(f"{cell:>22}" for cell in cells))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Load test covering the full order lifecycle
+
+Runs the three services in-process and drives them concurrently for
+--duration seconds with:
+  - menu clients loading / and /api/menu_items
+  - customers placing orders through /place_order
+  - a kitchen moving orders pending -> in_progress -> completed via /orders/<order_id>/status
+  - N pollers fetching deltas from /api/orders and /api/display/orders
+
+Reports throughput, p50/p95/p99 latency and Mongo operations per request for
+every route. Save a run with --output and compare a later one against it with
+--compare to catch regressions between commits.
+
+    python benchmarks/lifecycle.py --mock --duration 20 --output before.json
+    python benchmarks/lifecycle.py --mock --duration 20 --compare before.json
+
+Without --mock the services use MONGO_URI; its orders, menu_items, counters
+and sms_outbox collections are dropped first.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from harness import OpCounter, load_services, percentile, set_label
+
+MENU = [
+    ('Classic Burger', 'main', 12.99, [('Extra Cheese', 1.50), ('Bacon', 2.00)]),
+    ('Margherita Pizza', 'main', 14.99, [('Pepperoni', 2.50), ('Olives', 1.00)]),
+    ('Caesar Salad', 'appetizer', 8.99, [('Grilled Chicken', 3.50)]),
+    ('French Fries', 'side', 4.99, [('Cheese Sauce', 1.50), ('Cajun Seasoning', 0.50)]),
+    ('Coca-Cola', 'drink', 2.99, [('Large', 1.00), ('No Ice', 0.00)]),
+    ('Chocolate Cake', 'dessert', 6.99, [('Ice Cream', 2.00)]),
+]
+
+
+class Recorder:
+    def __init__(self, counter):
+        self.counter = counter
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def call(self, label, fn):
+        set_label(label)
+        start = time.perf_counter()
+        try:
+            response = fn()
+            ok = response.status_code < 400
+        except Exception:
+            response, ok = None, False
+        elapsed = time.perf_counter() - start
+        set_label(None)
+        with self._lock:
+            self.latencies[label].append(elapsed)
+            if not ok:
+                self.errors[label] += 1
+        return response
+
+    def report(self, duration):
+        routes = {}
+        for label, values in sorted(self.latencies.items()):
+            values.sort()
+            routes[label] = {
+                'requests': len(values),
+                'errors': self.errors[label],
+                'throughput_rps': round(len(values) / duration, 2),
+                'p50_ms': round(percentile(values, 50) * 1000, 3),
+                'p95_ms': round(percentile(values, 95) * 1000, 3),
+                'p99_ms': round(percentile(values, 99) * 1000, 3),
+                'mongo_ops_per_request': round(self.counter.counts[label] / len(values), 3)
+            }
+        return {
+            'duration_s': duration,
+            'total_requests': sum(r['requests'] for r in routes.values()),
+            'background_mongo_ops': self.counter.counts['background'],
+            'routes': routes
+        }
+
+
+def seed_menu(db):
+    for name, category, price, customizations in MENU:
+        db.menu_items.insert_one({
+            'name': name, 'category': category, 'description': '', 'base_price': price, 'image_url': '',
+            'customizations': [{'id': f'c{i}', 'name': n, 'price': p} for i, (n, p) in enumerate(customizations, 1)],
+            'active': True
+        })
+    db.counters.update_one({'_id': 'menu_version'}, {'$inc': {'value': 1}}, upsert=True)
+
+
+def menu_client(rec, customer, stop):
+    while not stop.is_set():
+        rec.call('GET /', lambda: customer.get('/'))
+        rec.call('GET /api/menu_items', lambda: customer.get('/api/menu_items'))
+
+
+def customer_client(rec, customer, menu, stop, think_time):
+    i = 0
+    while not stop.is_set():
+        cart = []
+        for item in random.sample(menu, k=random.randint(1, 3)):
+            chosen = [c['id'] for c in item['customizations'] if random.random() < 0.3]
+            cart.append({'id': item['_id'], 'name': item['name'], 'quantity': random.randint(1, 3),
+                         'customization_ids': chosen})
+        i += 1
+        rec.call('POST /place_order', lambda: customer.post('/place_order', data={
+            'customer_name': f'Load {i}', 'customer_phone': '', 'order_items': json.dumps(cart)}))
+        stop.wait(think_time)
+
+
+def kitchen(rec, employee, stop, think_time):
+    next_status = {'pending': 'in_progress', 'in_progress': 'completed'}
+    while not stop.is_set():
+        response = rec.call('GET /orders', lambda: employee.get('/orders'))
+        orders = response.get_json() if response is not None and response.status_code == 200 else []
+        for order in orders[:5]:
+            rec.call('POST /orders/<order_id>/status', lambda: employee.post(
+                f"/orders/{order['_id']}/status", json={'status': next_status[order['status']]}))
+        stop.wait(think_time)
+
+
+def poller(rec, employee, display, stop, interval):
+    # Polls like the dashboards do: a full list once, then only the changes since the last cursor
+    cursors = {'/api/orders': '', '/api/display/orders': ''}
+    while not stop.is_set():
+        for path, client in (('/api/orders', employee), ('/api/display/orders', display)):
+            response = rec.call(f'GET {path}', lambda: client.get(path, query_string={'since': cursors[path]}))
+            if response is not None and response.status_code == 200:
+                cursors[path] = response.get_json()['cursor']
+        stop.wait(interval)
+
+
+def compare(result, baseline_path, threshold):
+    """Print per-route changes against a saved run; returns the regressed routes"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)['routes']
+    regressions = []
+    print(f"\n📊 Compared with {baseline_path} (regression threshold {threshold:.0%})")
+    for label, now in result['routes'].items():
+        before = baseline.get(label)
+        if not before:
+            continue
+        p95_change = (now['p95_ms'] - before['p95_ms']) / before['p95_ms'] if before['p95_ms'] else 0
+        ops_change = now['mongo_ops_per_request'] - before['mongo_ops_per_request']
+        flag = ''
+        if p95_change > threshold or ops_change > 0.5:
+            flag = '  ❌'
+            regressions.append(label)
+        print(f"   {label:<32} p95 {before['p95_ms']:>8.2f} -> {now['p95_ms']:>8.2f} ms ({p95_change:+.0%})"
+              f"  ops/req {before['mongo_ops_per_request']:.2f} -> {now['mongo_ops_per_request']:.2f}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mock', action='store_true', help='use in-process mongomock instead of MONGO_URI')
+    parser.add_argument('--duration', type=float, default=20.0)
+    parser.add_argument('--menu-clients', type=int, default=4)
+    parser.add_argument('--customers', type=int, default=4)
+    parser.add_argument('--pollers', type=int, default=12, help='display/worker screens')
+    parser.add_argument('--poll-interval', type=float, default=1.0)
+    parser.add_argument('--think-time', type=float, default=0.2)
+    parser.add_argument('--output', help='write the results as JSON')
+    parser.add_argument('--compare', help='baseline JSON from an earlier --output')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed p95 increase when comparing')
+    args = parser.parse_args()
+
+    random.seed(42)
+    counter = OpCounter()
+    services = load_services(mock=args.mock, counter=counter)
+    customer = services['customer_service']
+    db = customer.mongo.db
+    for collection in ('orders', 'menu_items', 'counters', 'sms_outbox'):
+        db.drop_collection(collection)
+    seed_menu(db)
+
+    customer_client_ = customer.app.test_client()
+    employee_client_ = services['employee_service'].app.test_client()
+    display_client_ = services['display_service'].app.test_client()
+    menu = customer_client_.get('/api/menu_items').get_json()
+
+    rec = Recorder(counter)
+    counter.counts.clear()
+    stop = threading.Event()
+    actors = (
+        [threading.Thread(target=menu_client, args=(rec, customer_client_, stop)) for _ in range(args.menu_clients)]
+        + [threading.Thread(target=customer_client, args=(rec, customer_client_, menu, stop, args.think_time))
+           for _ in range(args.customers)]
+        + [threading.Thread(target=kitchen, args=(rec, employee_client_, stop, args.think_time))]
+        + [threading.Thread(target=poller, args=(rec, employee_client_, display_client_, stop, args.poll_interval))
+           for _ in range(args.pollers)]
+    )
+    print(f"🏁 Running the order lifecycle for {args.duration:.0f}s "
+          f"({args.menu_clients} menu clients, {args.customers} customers, {args.pollers} pollers)...")
+    for actor in actors:
+        actor.start()
+    time.sleep(args.duration)
+    stop.set()
+    for actor in actors:
+        actor.join()
+
+    result = rec.report(args.duration)
+    print(f"\n   {'route':<32} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'ops/req':>8} {'errors':>7}")
+    for label, r in result['routes'].items():
+        print(f"   {label:<32} {r['throughput_rps']:>8.1f} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} "
+              f"{r['p99_ms']:>8.2f} {r['mongo_ops_per_request']:>8.2f} {r['errors']:>7}")
+    print(f"   background Mongo ops: {result['background_mongo_ops']}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"\n💾 Saved to {args.output}")
+    if args.compare and compare(result, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Checkout latency through MongoDB stalls, with and without the order journal
+
+Runs customer_service and employee_service in-process and adds --latency-ms to
+every MongoDB operation, plus a stall of --stall seconds every --stall-every
+seconds during which operations wait for the stall to end. For --duration
+seconds --customers clients place orders while the kitchen polls the employee
+service's /orders. Each configuration runs in a fresh subprocess:
+
+  - inline:  place_order inserts into MongoDB (ORDER_JOURNAL_DIR unset)
+  - journal: place_order journals the order and the flusher inserts it
+
+Prints checkout latency percentiles and errors, how long placed orders take to
+show on the kitchen's /orders, and whether every order the customer saw
+confirmed reached MongoDB once the run ended.
+
+    python benchmarks/order_journal.py --mock --duration 20
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from harness import MOCK_OPERATIONS, load_services, percentile
+
+STALLED_OPERATIONS = MOCK_OPERATIONS + ['find_one_and_replace', 'replace_one', 'estimated_document_count']
+
+
+class SlowMongo:
+    """Adds latency and periodic stalls to every operation of a collection class"""
+
+    def __init__(self, collection_class, latency, stall, every):
+        self.latency = latency
+        self.stall = stall
+        self.every = every
+        self.stalled_until = 0.0
+        self.stop = threading.Event()
+        for name in STALLED_OPERATIONS:
+            original = getattr(collection_class, name, None)
+            if original is None:
+                continue
+
+            def slow(collection, *args, _original=original, **kwargs):
+                time.sleep(self.latency)
+                while time.monotonic() < self.stalled_until:
+                    time.sleep(self.stalled_until - time.monotonic())
+                return _original(collection, *args, **kwargs)
+            setattr(collection_class, name, slow)
+
+    def run(self):
+        while not self.stop.wait(self.every):
+            self.stalled_until = time.monotonic() + self.stall
+
+
+def run(args):
+    """One configuration in this process; prints its result as JSON"""
+    from lifecycle import seed_menu
+    services = load_services(mock=args.mock, services=['customer_service', 'employee_service'])
+    customer_service, employee_service = services['customer_service'], services['employee_service']
+    db = customer_service.mongo.db
+    for collection in ('orders', 'menu_items', 'counters', 'sms_outbox'):
+        db.drop_collection(collection)
+    seed_menu(db)
+    menu = customer_service.app.test_client().get('/api/menu_items').get_json()
+    employee_service.app.test_client().get('/orders')
+    employee_service.active_orders.wait_until_ready()
+
+    slow = SlowMongo(type(db.orders), args.latency_ms / 1000, args.stall, args.stall_every)
+    threading.Thread(target=slow.run, daemon=True).start()
+
+    confirmed, latencies, errors, seen = {}, [], [0], {}
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def customer(n):
+        client = customer_service.app.test_client()
+        i = 0
+        while not stop.is_set():
+            i += 1
+            name = f'Journal {n}-{i}'
+            start = time.perf_counter()
+            response = client.post('/place_order', data={
+                'customer_name': name, 'customer_phone': '',
+                'order_items': json.dumps([{'id': menu[i % len(menu)]['_id'], 'quantity': 1}])})
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                if response.status_code == 200:
+                    confirmed[name] = time.perf_counter()
+                else:
+                    errors[0] += 1
+            time.sleep(args.think_time)
+
+    def kitchen():
+        client = employee_service.app.test_client()
+        while not stop.is_set():
+            now = time.perf_counter()
+            for order in client.get('/orders').get_json():
+                seen.setdefault(order['customer_name'], now)
+            time.sleep(0.05)
+
+    threads = [threading.Thread(target=customer, args=(n,)) for n in range(args.customers)]
+    threads.append(threading.Thread(target=kitchen))
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    # Let the flusher catch up, then check every confirmed order made it
+    slow.stop.set()
+    slow.stalled_until = 0.0
+    deadline = time.time() + 30
+    names = set(confirmed)
+    while time.time() < deadline:
+        stored = {o['customer_name'] for o in db.orders.find({'customer_name': {'$in': list(names)}},
+                                                             {'customer_name': 1})}
+        if stored >= names:
+            break
+        time.sleep(0.2)
+    latencies.sort()
+    visible = sorted(max(0.0, seen[name] - at) for name, at in confirmed.items() if name in seen)
+    print(json.dumps({
+        'orders confirmed': len(confirmed),
+        'checkout errors': errors[0],
+        'checkout p50 ms': round(percentile(latencies, 50) * 1000, 1),
+        'checkout p99 ms': round(percentile(latencies, 99) * 1000, 1),
+        'checkout max ms': round(latencies[-1] * 1000, 1),
+        'kitchen sees p50 ms': round(percentile(visible, 50) * 1000, 1) if visible else None,
+        'kitchen sees p99 ms': round(percentile(visible, 99) * 1000, 1) if visible else None,
+        'confirmed, not in MongoDB': len(names - stored)
+    }))
+    os._exit(0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mock', action='store_true', help='use in-process mongomock instead of MONGO_URI')
+    parser.add_argument('--duration', type=float, default=20.0)
+    parser.add_argument('--customers', type=int, default=4)
+    parser.add_argument('--think-time', type=float, default=0.05)
+    parser.add_argument('--latency-ms', type=float, default=2.0, help='added to every MongoDB operation')
+    parser.add_argument('--stall', type=float, default=2.0, help='seconds MongoDB stalls for')
+    parser.add_argument('--stall-every', type=float, default=6.0, help='seconds between stalls')
+    parser.add_argument('--run', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run:
+        run(args)
+        return
+
+    results = {}
+    for mode in ('inline', 'journal'):
+        print(f"🏁 {mode}: {args.customers} customers, {args.stall:.0f}s stall every {args.stall_every:.0f}s, "
+              f"{args.duration:.0f}s...")
+        directory = tempfile.mkdtemp(prefix='order-journal-') if mode == 'journal' else ''
+        env = dict(os.environ, ORDER_JOURNAL_DIR=directory)
+        command = [sys.executable, os.path.abspath(__file__), '--run'] + [
+            f'--{name.replace("_", "-")}={value}' for name, value in vars(args).items()
+            if name not in ('mock', 'run')] + (['--mock'] if args.mock else [])
+        output = subprocess.run(command, env=env, capture_output=True, text=True)
+        if directory:
+            shutil.rmtree(directory, ignore_errors=True)
+        if output.returncode:
+            print(output.stdout, output.stderr)
+            sys.exit(output.returncode)
+        results[mode] = json.loads(output.stdout.strip().splitlines()[-1])
+
+    print(f"\n   {'':<28} {'inline':>12} {'journal':>12}")
+    for key in results['inline']:
+        print(f"   {key:<28} {results['inline'][key]!s:>12} {results['journal'][key]!s:>12}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Concurrency stress test for the order number allocator
+
+Simulates several gunicorn workers (processes, each with its own allocator)
+with several request threads each, all inserting orders at once, then checks
+that every order got a distinct number.
+
+    python benchmarks/order_number_stress.py --processes 4 --threads 8 --orders 500
+    python benchmarks/order_number_stress.py --mock   # in-process mongomock (pip install mongomock), threads only
+
+Against a real server, point MONGO_URI at a scratch database; the orders and
+counters collections there are dropped first.
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Pool
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ordering_core.indexes import ensure_indexes
+from ordering_core.order_numbers import OrderNumberAllocator, insert_order
+
+MONGO_URI = os.environ.get('MONGO_URI', 'mongodb://localhost:27017/ordering_stress')
+
+
+def place_orders(db, allocator, count):
+    for i in range(count):
+        insert_order(db.orders, {'customer_name': f'stress-{i}', 'status': 'pending'}, allocator)
+
+
+def run_worker(args):
+    """One simulated gunicorn worker: its own client, allocator and thread pool"""
+    threads, orders_per_thread, block_size = args
+    from pymongo import MongoClient
+    client = MongoClient(MONGO_URI)
+    db = client.get_database()
+    allocator = OrderNumberAllocator(db.counters, block_size=block_size)
+    with ThreadPoolExecutor(threads) as pool:
+        for future in [pool.submit(place_orders, db, allocator, orders_per_thread) for _ in range(threads)]:
+            future.result()
+    client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--orders', type=int, default=250, help='orders per thread')
+    parser.add_argument('--block-size', type=int, default=50)
+    parser.add_argument('--mock', action='store_true', help='use mongomock in this process instead of MONGO_URI')
+    args = parser.parse_args()
+
+    if args.mock:
+        import mongomock
+        db = mongomock.MongoClient().db
+    else:
+        from pymongo import MongoClient
+        db = MongoClient(MONGO_URI).get_database()
+    db.orders.drop()
+    db.counters.drop()
+    ensure_indexes(db)
+
+    total = args.processes * args.threads * args.orders
+    print(f"🔢 Placing {total} orders from {args.processes} worker(s) x {args.threads} thread(s)...")
+    start = time.perf_counter()
+    if args.mock:
+        allocators = [OrderNumberAllocator(db.counters, block_size=args.block_size) for _ in range(args.processes)]
+        with ThreadPoolExecutor(args.threads * args.processes) as pool:
+            futures = [pool.submit(place_orders, db, allocators[i % args.processes], args.orders)
+                       for i in range(args.threads * args.processes)]
+            for future in futures:
+                future.result()
+    else:
+        with Pool(args.processes) as pool:
+            pool.map(run_worker, [(args.threads, args.orders, args.block_size)] * args.processes)
+    elapsed = time.perf_counter() - start
+
+    numbers = [order['order_number'] for order in db.orders.find({}, {'order_number': 1})]
+    distinct = len(set(numbers))
+    print(f"   {len(numbers)} orders, {distinct} distinct numbers in {elapsed:.2f}s ({len(numbers) / elapsed:.0f} orders/s)")
+    if len(numbers) != total or distinct != total:
+        print("❌ Duplicate or missing order numbers")
+        sys.exit(1)
+    print("✅ Every order got a unique number")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for the order pricing engine
+
+Prices a 50-line catering order against a synthetic menu and reports the time
+per order. Needs no database.
+
+    python benchmarks/pricing_bench.py --lines 50 --iterations 20000
+"""
+
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ordering_core.pricing import PriceIndex
+
+
+def build_menu(items, customizations):
+    return [{
+        '_id': f'item{i}',
+        'name': f'Item {i}',
+        'base_price': round(random.uniform(2, 20), 2),
+        'customizations': [{'id': f'c{j}', 'name': f'Extra {j}', 'price': round(random.uniform(0, 3), 2)}
+                           for j in range(customizations)]
+    } for i in range(items)]
+
+
+def build_order(menu, lines):
+    order = []
+    for _ in range(lines):
+        item = random.choice(menu)
+        chosen = random.sample([c['id'] for c in item['customizations']], k=2)
+        order.append({'id': item['_id'], 'quantity': random.randint(1, 20), 'customization_ids': chosen})
+    return order
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=40, help='menu items')
+    parser.add_argument('--customizations', type=int, default=5, help='customizations per item')
+    parser.add_argument('--lines', type=int, default=50, help='lines per order')
+    parser.add_argument('--iterations', type=int, default=20000)
+    args = parser.parse_args()
+
+    random.seed(7)
+    menu = build_menu(args.items, args.customizations)
+    order = build_order(menu, args.lines)
+
+    build_us = timeit.timeit(lambda: PriceIndex(menu), number=100) / 100 * 1e6
+    index = PriceIndex(menu)
+    price_us = timeit.timeit(lambda: index.price(order), number=args.iterations) / args.iterations * 1e6
+    _, total_cents = index.price(order)
+
+    print(f"💲 Index build ({args.items} items): {build_us:.1f} µs")
+    print(f"   Price {args.lines}-line order: {price_us:.1f} µs per order (total ${total_cents / 100:.2f})")
+
+
+if __name__ == '__main__':
+    main()
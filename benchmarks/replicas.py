@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+MongoDB load of N customer_service replicas, with and without shared state
+
+Imports customer_service --replicas times in one process, as separate
+processes behind a load balancer would run it, and for --duration seconds
+spreads menu and active-order reads across the replicas while one customer
+places an order every --order-interval seconds. Each configuration runs in a
+fresh subprocess:
+
+  - isolated: every replica keeps its own caches (SHARED_STATE_URL unset)
+  - shared:   the replicas share state through a Redis-protocol server (the
+              stand-in from resp_server.py unless --shared-state-url is given)
+
+Prints Mongo operations per second for the read routes and for each kind of
+background thread, and how long an order placed on the first replica takes to
+appear in the last replica's /orders.
+
+    python benchmarks/replicas.py --mock --replicas 4 --duration 10
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from harness import OpCounter, load_services, percentile, set_label
+
+READ_ROUTES = ['GET /', 'GET /api/menu_items', 'GET /orders']
+
+
+def reader(clients, stop, counts):
+    i = 0
+    while not stop.is_set():
+        client = clients[i % len(clients)]
+        for path in ('/', '/api/menu_items', '/orders'):
+            set_label(f'GET {path}')
+            client.get(path)
+            set_label(None)
+            counts[f'GET {path}'] += 1
+        i += 1
+
+
+def place(client, menu, n):
+    set_label('POST /place_order')
+    response = client.post('/place_order', data={
+        'customer_name': f'Replica {n}', 'customer_phone': '',
+        'order_items': json.dumps([{'id': menu[n % len(menu)]['_id'], 'quantity': 1}])})
+    set_label(None)
+    return response
+
+
+def propagation(first, last, menu, n, timeout=10.0):
+    """Seconds until an order placed on ``first`` shows in ``last``'s /orders"""
+    place(first, menu, n)
+    name = f'Replica {n}'
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        set_label('propagation check')
+        orders = last.get('/orders').get_json()
+        set_label(None)
+        if any(order['customer_name'] == name for order in orders):
+            return time.perf_counter() - start
+        time.sleep(0.005)
+    return None
+
+
+def run(args):
+    """One configuration in this process; prints its result as JSON"""
+    from lifecycle import seed_menu
+    counter = OpCounter(by_thread=True)
+    services = load_services(mock=args.mock, counter=counter, services=['customer_service'],
+                             replicas=args.replicas)
+    replicas = [services['customer_service']] + [services[f'customer_service#{i}']
+                                                 for i in range(2, args.replicas + 1)]
+    db = replicas[0].mongo.db
+    for collection in ('orders', 'menu_items', 'counters', 'sms_outbox'):
+        db.drop_collection(collection)
+    seed_menu(db)
+    clients = [replica.app.test_client() for replica in replicas]
+    menu = clients[0].get('/api/menu_items').get_json()
+    for replica in replicas:
+        replica.active_orders.wait_until_ready()
+    # Let the watchers settle (elect a leader) before counting
+    time.sleep(3)
+
+    counter.counts.clear()
+    counts = defaultdict(int)
+    stop = threading.Event()
+    readers = [threading.Thread(target=reader, args=(clients, stop, counts)) for _ in range(args.readers)]
+    for thread in readers:
+        thread.start()
+    started = time.time()
+    n = 0
+    while time.time() - started < args.duration:
+        n += 1
+        place(clients[n % len(clients)], menu, n)
+        time.sleep(args.order_interval)
+    stop.set()
+    for thread in readers:
+        thread.join()
+    elapsed = time.time() - started
+    ops = dict(counter.counts)
+
+    delays = sorted(d for d in (propagation(clients[0], clients[-1], menu, 10000 + i) for i in range(5))
+                    if d is not None)
+    background = defaultdict(int)
+    for label, count in ops.items():
+        if label.startswith('background:'):
+            # Thread names end in a worker number; group them by kind
+            background[label.split(':', 1)[1].rstrip('-0123456789')] += count
+    print(json.dumps({
+        'requests': sum(counts.values()),
+        'read_ops_per_s': round(sum(ops.get(label, 0) for label in READ_ROUTES) / elapsed, 2),
+        'order_ops_per_s': round(ops.get('POST /place_order', 0) / elapsed, 2),
+        'background_ops_per_s': {kind: round(count / elapsed, 2) for kind, count in sorted(background.items())},
+        'propagation_p50_ms': round(percentile(delays, 50) * 1000, 1) if delays else None,
+        'leaders': sum(1 for replica in replicas if replica.active_orders.leader)
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mock', action='store_true', help='use in-process mongomock instead of MONGO_URI')
+    parser.add_argument('--replicas', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--order-interval', type=float, default=0.5)
+    parser.add_argument('--shared-state-url', help='Redis-protocol server to use instead of the stand-in')
+    parser.add_argument('--run', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run:
+        run(args)
+        return
+
+    server = None
+    url = args.shared_state_url
+    if url is None:
+        import resp_server
+        server = resp_server.start()
+        url = f'redis://127.0.0.1:{server.server_address[1]}/0'
+
+    results = {}
+    for mode, shared_state_url in (('isolated', ''), ('shared', url)):
+        print(f"🏁 {args.replicas} replicas, {mode} state, {args.duration:.0f}s...")
+        env = dict(os.environ, SHARED_STATE_URL=shared_state_url)
+        command = [sys.executable, os.path.abspath(__file__), '--run', '--replicas', str(args.replicas),
+                   '--duration', str(args.duration), '--readers', str(args.readers),
+                   '--order-interval', str(args.order_interval)] + (['--mock'] if args.mock else [])
+        output = subprocess.run(command, env=env, capture_output=True, text=True)
+        if output.returncode:
+            print(output.stdout, output.stderr)
+            sys.exit(output.returncode)
+        results[mode] = json.loads(output.stdout.strip().splitlines()[-1])
+    if server is not None:
+        server.shutdown()
+
+    print(f"\n   {'':<32} {'isolated':>12} {'shared':>12}")
+    rows = [('requests', 'requests'), ('read route Mongo ops/s', 'read_ops_per_s'),
+            ('order placement Mongo ops/s', 'order_ops_per_s'), ('watching replicas', 'leaders'),
+            ('propagation p50 ms', 'propagation_p50_ms')]
+    for title, key in rows:
+        print(f"   {title:<32} {results['isolated'][key]!s:>12} {results['shared'][key]!s:>12}")
+    kinds = sorted(set(results['isolated']['background_ops_per_s']) | set(results['shared']['background_ops_per_s']))
+    for kind in kinds:
+        print(f"   {'background ' + kind + ' ops/s':<32} "
+              f"{results['isolated']['background_ops_per_s'].get(kind, 0):>12} "
+              f"{results['shared']['background_ops_per_s'].get(kind, 0):>12}")
+
+
+if __name__ == '__main__':
+    main()
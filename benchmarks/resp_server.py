@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Stand-in Redis-protocol server for trying SHARED_STATE_URL without Redis
+
+Implements the handful of commands ordering_core.shared_state uses (GET, SET
+with PX/NX, DEL, INCR, PEXPIRE, PUBLISH, SUBSCRIBE, PING, AUTH, SELECT, and
+EVAL of its lease renewal script only) in memory. One database, no
+persistence; for local testing and the benchmarks only.
+
+    python benchmarks/resp_server.py --port 6390
+    SHARED_STATE_URL=redis://localhost:6390/0 python customer_service/app.py
+"""
+
+import argparse
+import os
+import socketserver
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ordering_core.shared_state import RENEW_LEASE_SCRIPT
+
+
+class Store:
+    def __init__(self):
+        self.values = {}
+        self.channels = {}
+        self.lock = threading.Lock()
+
+    def live(self, key):
+        entry = self.values.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.monotonic():
+            del self.values[key]
+            return None
+        return entry
+
+
+def _bulk(value):
+    if value is None:
+        return b'$-1\r\n'
+    return b'$%d\r\n%s\r\n' % (len(value), value)
+
+
+def _array(items):
+    return b'*%d\r\n' % len(items) + b''.join(_bulk(item) if not isinstance(item, int) else b':%d\r\n' % item
+                                               for item in items)
+
+
+class Handler(socketserver.StreamRequestHandler):
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        count = int(line[1:-2])
+        args = []
+        for _ in range(count):
+            length = int(self.rfile.readline()[1:-2])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def handle(self):
+        store = self.server.store
+        while True:
+            try:
+                command = self.read_command()
+            except (OSError, ValueError):
+                return
+            if command is None:
+                return
+            name = command[0].upper()
+            if name == b'SUBSCRIBE':
+                self.subscribe(store, command[1:])
+                return
+            self.wfile.write(self.execute(store, name, command[1:]))
+
+    def execute(self, store, name, args):
+        now = time.monotonic()
+        with store.lock:
+            if name in (b'PING', b'AUTH', b'SELECT'):
+                return b'+PONG\r\n' if name == b'PING' else b'+OK\r\n'
+            if name == b'GET':
+                entry = store.live(args[0])
+                return _bulk(entry[0] if entry else None)
+            if name == b'SET':
+                options = [arg.upper() for arg in args[2:]]
+                if b'NX' in options and store.live(args[0]) is not None:
+                    return b'$-1\r\n'
+                expires = None
+                if b'PX' in options:
+                    expires = now + int(args[2 + options.index(b'PX') + 1]) / 1000
+                store.values[args[0]] = (args[1], expires)
+                return b'+OK\r\n'
+            if name == b'DEL':
+                return b':%d\r\n' % sum(1 for key in args if store.values.pop(key, None) is not None)
+            if name == b'INCR':
+                entry = store.live(args[0])
+                count = int(entry[0]) + 1 if entry else 1
+                store.values[args[0]] = (str(count).encode(), entry[1] if entry else None)
+                return b':%d\r\n' % count
+            if name == b'PEXPIRE':
+                entry = store.live(args[0])
+                if entry is None:
+                    return b':0\r\n'
+                store.values[args[0]] = (entry[0], now + int(args[1]) / 1000)
+                return b':1\r\n'
+            if name == b'EVAL':
+                if args[0].decode() != RENEW_LEASE_SCRIPT:
+                    return b'-ERR only the lease renewal script is supported\r\n'
+                entry = store.live(args[2])
+                if entry is None or entry[0] != args[3]:
+                    return b':0\r\n'
+                store.values[args[2]] = (entry[0], now + int(args[4]) / 1000)
+                return b':1\r\n'
+            if name == b'PUBLISH':
+                subscribers = list(store.channels.get(args[0], ()))
+            else:
+                return b'-ERR unknown command\r\n'
+        frame = _array([b'message', args[0], args[1]])
+        for subscriber in subscribers:
+            subscriber.send(frame)
+        return b':%d\r\n' % len(subscribers)
+
+    def subscribe(self, store, channels):
+        lock = threading.Lock()
+
+        def send(frame):
+            with lock:
+                try:
+                    self.wfile.write(frame)
+                except OSError:
+                    pass
+        self.send = send
+        with store.lock:
+            for channel in channels:
+                store.channels.setdefault(channel, []).append(self)
+        for number, channel in enumerate(channels, start=1):
+            send(_array([b'subscribe', channel, number]))
+        try:
+            # Subscribers only ever unsubscribe by disconnecting
+            while self.rfile.readline():
+                pass
+        except OSError:
+            pass
+        finally:
+            with store.lock:
+                for channel in channels:
+                    store.channels[channel].remove(self)
+
+
+class Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address):
+        super().__init__(address, Handler)
+        self.store = Store()
+
+
+def start(port=0):
+    """Serve on a background thread; returns the server (its port is server.server_address[1])"""
+    server = Server(('127.0.0.1', port))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=6390)
+    args = parser.parse_args()
+    server = Server(('127.0.0.1', args.port))
+    print(f'Redis-protocol stand-in listening on 127.0.0.1:{args.port}')
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
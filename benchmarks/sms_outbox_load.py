@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Offline load test for the SMS outbox
+
+Enqueues a burst of messages against the fake provider and reports enqueue
+latency (what checkout pays), end-to-end delivery latency and throughput.
+
+    python benchmarks/sms_outbox_load.py --messages 500 --workers 4 --rate 100 --latency 0.05
+    python benchmarks/sms_outbox_load.py --mock   # in-process mongomock (pip install mongomock)
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ordering_core.indexes import ensure_indexes
+from ordering_core.sms import FakeProvider, SmsOutbox
+
+MONGO_URI = os.environ.get('MONGO_URI', 'mongodb://localhost:27017/ordering_stress')
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=500)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--rate', type=float, default=100.0, help='provider rate limit, messages/s')
+    parser.add_argument('--latency', type=float, default=0.05, help='simulated provider latency, seconds')
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--mock', action='store_true', help='use mongomock in this process instead of MONGO_URI')
+    args = parser.parse_args()
+
+    if args.mock:
+        import mongomock
+        db = mongomock.MongoClient().db
+    else:
+        from pymongo import MongoClient
+        db = MongoClient(MONGO_URI).get_database()
+    db.sms_outbox.drop()
+    ensure_indexes(db)
+
+    provider = FakeProvider(latency=args.latency, failure_rate=args.failure_rate)
+    outbox = SmsOutbox(db.sms_outbox, db.orders, provider, workers=args.workers,
+                       rate_per_second=args.rate, base_delay=0.1, poll_interval=0.05)
+
+    print(f"📨 Enqueueing {args.messages} messages ({args.workers} workers, {args.rate:.0f}/s limit)...")
+    enqueue_times = []
+    start = time.perf_counter()
+    for i in range(args.messages):
+        t0 = time.perf_counter()
+        outbox.enqueue(f'555-010-{i:04d}', f'Load test message {i}')
+        enqueue_times.append((time.perf_counter() - t0) * 1000)
+
+    while db.sms_outbox.count_documents({'status': {'$in': ['queued', 'sending']}}):
+        time.sleep(0.05)
+    elapsed = time.perf_counter() - start
+
+    delivered = list(db.sms_outbox.find({'status': 'sent'}, {'created_at': 1, 'sent_at': 1}))
+    delivery_ms = [(m['sent_at'] - m['created_at']).total_seconds() * 1000 for m in delivered]
+    failed = db.sms_outbox.count_documents({'status': 'failed'})
+    print(f"   enqueue  p50 {percentile(enqueue_times, 50):.2f} ms  p99 {percentile(enqueue_times, 99):.2f} ms")
+    if delivery_ms:
+        print(f"   delivery p50 {percentile(delivery_ms, 50):.0f} ms  p99 {percentile(delivery_ms, 99):.0f} ms")
+    print(f"   {len(delivered)} sent, {failed} failed in {elapsed:.2f}s ({len(delivered) / elapsed:.1f} msg/s)")
+
+
+if __name__ == '__main__':
+    main()
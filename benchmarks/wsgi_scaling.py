@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Throughput of one service under gunicorn as the worker count grows
+
+Starts the service with 1, 2, 4, ... workers (up to --max-workers, default the
+core count), drives it with keep-alive HTTP clients for --duration seconds at
+each step, and prints requests/s and latency percentiles per worker count.
+Needs a running MongoDB at MONGO_URI with some menu items and orders.
+
+    python benchmarks/wsgi_scaling.py --service display_service --path /api/display/orders
+    python benchmarks/wsgi_scaling.py --service customer_service --path /api/menu_items --threads 4
+"""
+
+import argparse
+import http.client
+import multiprocessing
+import os
+import signal
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def client(args):
+    """One client process: sequential keep-alive requests until the deadline"""
+    port, path, deadline = args
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    latencies = []
+    errors = 0
+    while time.time() < deadline:
+        start = time.perf_counter()
+        try:
+            conn.request('GET', path)
+            response = conn.getresponse()
+            response.read()
+            if response.status >= 400:
+                errors += 1
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+        latencies.append(time.perf_counter() - start)
+    conn.close()
+    return latencies, errors
+
+
+def wait_for_port(port, timeout=20):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/__ready__')
+            conn.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'service did not start on port {port}')
+
+
+def run_step(service, workers, threads, port, path, clients, duration):
+    env = dict(os.environ, WEB_CONCURRENCY=str(workers), GUNICORN_THREADS=str(threads),
+               PORT=str(port), GUNICORN_ACCESS_LOG='/dev/null')
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', os.path.join(ROOT, 'gunicorn.conf.py'), 'app:app'],
+        cwd=os.path.join(ROOT, service), env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(port)
+        deadline = time.time() + duration
+        with multiprocessing.Pool(clients) as pool:
+            results = pool.map(client, [(port, path, deadline)] * clients)
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=30)
+    latencies = sorted(l for result in results for l in result[0])
+    errors = sum(result[1] for result in results)
+    return latencies, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--service', default='display_service')
+    parser.add_argument('--path', default='/api/display/orders')
+    parser.add_argument('--max-workers', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--threads', type=int, default=8, help='gunicorn threads per worker')
+    parser.add_argument('--clients', type=int, default=32, help='concurrent keep-alive clients')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds per step')
+    parser.add_argument('--port', type=int, default=5099)
+    args = parser.parse_args()
+
+    steps = []
+    workers = 1
+    while workers <= args.max_workers:
+        steps.append(workers)
+        workers *= 2
+
+    print(f"🚀 {args.service} {args.path}: {args.clients} clients, {args.threads} threads/worker, {args.duration:.0f}s per step")
+    print(f"   {'workers':>7} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for workers in steps:
+        latencies, errors = run_step(args.service, workers, args.threads, args.port, args.path,
+                                     args.clients, args.duration)
+        if not latencies:
+            print(f"   {workers:>7} {'-':>9}")
+            continue
+        p50 = latencies[len(latencies) // 2] * 1000
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+        print(f"   {workers:>7} {len(latencies) / args.duration:>9.0f} {p50:>8.2f} {p99:>8.2f} {errors:>7}")
+
+
+if __name__ == '__main__':
+    main()
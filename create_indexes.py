@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""
+Create the MongoDB indexes the services rely on
+Safe to run on every deploy; existing indexes are left as they are
+
+Run with --check to also explain every route's query and exit non-zero if
+any of them would fall back to a collection scan
+"""
+
+import sys
+
+from ordering_core.config import database
+from ordering_core.indexes import ensure_indexes, collscan_queries
+
+# Connect to MongoDB
+db = database()
+
+print("🗂️  Creating indexes...")
+for collection, names in ensure_indexes(db).items():
+    print(f"   {collection}: {', '.join(names)}")
+
+if '--check' in sys.argv[1:]:
+    print("\n🔍 Checking query plans...")
+    failing = collscan_queries(db)
+    db.client.close()
+    if failing:
+        for name in failing:
+            print(f"   ❌ COLLSCAN: {name}")
+        sys.exit(1)
+    print("   ✅ No route query uses a collection scan")
+
+print("\n✨ Indexes ready!")
+db.client.close()
@@ -1,125 +1,200 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
-from flask_pymongo import PyMongo
+from flask import render_template, request, redirect, url_for, flash, jsonify, Response, stream_with_context
 from datetime import datetime
 import os
-import random
-import string
-from dotenv import load_dotenv
-from twilio.rest import Client
-
-load_dotenv()
-app = Flask(__name__, template_folder='templates', static_folder='static')
-app.config['MONGO_URI'] = os.environ.get('MONGO_URI', 'mongodb://localhost:27017/ordering_system')
-mongo = PyMongo(app)
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key-here')
-
-# Twilio setup
-TWILIO_PHONE_NUMBER = os.getenv('TWILIO_PHONE_NUMBER')
-twilio_client = None
-if os.getenv('TWILIO_ACCOUNT_SID') and os.getenv('TWILIO_AUTH_TOKEN'):
-    try:
-        twilio_client = Client(os.getenv('TWILIO_ACCOUNT_SID'), os.getenv('TWILIO_AUTH_TOKEN'))
-    except Exception as e:
-        print(f"Twilio error: {e}")
-
-def generate_order_number():
-    while True:
-        order_number = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
-        if not mongo.db.orders.find_one({'order_number': order_number}):
-            return order_number
-
-def send_sms(phone_number, message):
-    if not twilio_client:
-        print(f"SMS would be sent to {phone_number}: {message}")
-        return False
-    try:
-        if phone_number and TWILIO_PHONE_NUMBER:
-            if not phone_number.startswith('+'):
-                phone_number = '+1' + phone_number.replace('-', '').replace('(', '').replace(')', '').replace(' ', '')
-            twilio_client.messages.create(body=message, from_=TWILIO_PHONE_NUMBER, to=phone_number)
-            return True
-    except Exception as e:
-        print(f"SMS sending failed: {e}")
-        return False
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ordering_core.active_orders import UNCACHED_FIELDS, ActiveOrderCache
+from ordering_core.config import create_app
+from ordering_core.menu_catalog import MenuCatalog
+from ordering_core.order_deltas import revision_fields
+from ordering_core.order_ingest import MAX_BATCH, STREAM_BATCH, OrderIngester, batches, read_ndjson
+from ordering_core.order_journal import journal_from_env
+from ordering_core.order_numbers import OrderNumberAllocator, insert_order
+from ordering_core.ready_times import PrepStats, ReadyTimeEstimator
+from ordering_core.shared_state import state_from_env
+from ordering_core.sms import outbox_from_env, placed_message
+
+app, mongo = create_app(__name__, 'customer_service')
+
+# Pub/sub, caches and counters shared with the other processes of this service (SHARED_STATE_URL)
+shared_state = state_from_env()
+
+# Active orders served from memory, kept current by our writes and a watcher on the collection
+active_orders = ActiveOrderCache(mongo.db.orders, window_minutes=0, shared=shared_state,
+                                 exclude=UNCACHED_FIELDS + ('customer_phone', 'total_price', 'total_cents'))
+
+# Active menu cached per version; employee_service bumps the version on every admin change
+menu_catalog = MenuCatalog(mongo.db.menu_items, mongo.db.counters,
+                           check_interval=float(os.getenv('MENU_VERSION_CHECK_SECONDS', '5')),
+                           dumps=app.json.dumps, shared=shared_state)
+
+# Ready times predicted from measured prep times and the current station queues
+prep_stats = PrepStats(mongo.db.prep_stats, shared=shared_state)
+ready_estimator = ReadyTimeEstimator(active_orders, prep_stats)
+
+# Order numbers come from blocks reserved on a shared counter, so checkout never reads to check for collisions;
+# codes legacy orders already use are skipped once per block
+order_numbers = OrderNumberAllocator(mongo.db.counters, orders=mongo.db.orders)
+
+# Kiosks and delivery integrations submit orders in bulk through POST /api/orders
+order_ingester = OrderIngester(mongo.db, order_numbers)
+
+# SMS goes through a durable outbox drained by background workers (Twilio, or SMS_PROVIDER=fake|log)
+sms_outbox = outbox_from_env(mongo.db, shared_state)
+sms_outbox.start()
+
+def journal_flushed(orders):
+    active_orders.release([str(order['_id']) for order in orders])
+    # A retried or replayed flush hands over orders again; each order's SMS is queued once
+    sms_outbox.enqueue_many([(order['customer_phone'], placed_message(order), order['_id']) for order in orders],
+                            kind='order_placed', once=True)
+
+# With ORDER_JOURNAL_DIR, checkout writes orders to a local journal that a background flusher copies into MongoDB
+order_journal = journal_from_env(mongo.db.orders, order_numbers, on_flushed=journal_flushed)
 
 @app.route('/')
 def index():
-    # Get all active menu items from database
-    menu_items = list(mongo.db.menu_items.find({'active': True}).sort('category', 1))
-    return render_template('customer_order.html', menu_items=menu_items)
+    # Rendered once per menu version, then served from memory
+    menu, body = menu_catalog.page('customer_order', lambda items: render_template('customer_order.html', menu_items=items))
+    response = Response(body, mimetype='text/html')
+    response.set_etag(f'{menu.etag}-page')
+    return response.make_conditional(request)
 
 @app.route('/api/menu_items')
 def get_menu_items():
     """API endpoint to get menu items"""
-    menu_items = list(mongo.db.menu_items.find({'active': True}).sort('category', 1))
-    for item in menu_items:
-        item['_id'] = str(item['_id'])
-    return jsonify(menu_items)
+    menu = menu_catalog.current()
+    response = Response(menu.json, mimetype='application/json')
+    response.set_etag(menu.etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+def new_order(form, menu):
+    """The order document for a submitted order form, priced from ``menu``; not yet numbered or inserted"""
+    customer_name = form.get('customer_name')
+    customer_phone = form.get('customer_phone', '').strip()
+    
+    # Parse the order items from JSON
+    import json
+    order_items_data = json.loads(form.get('order_items', '[]'))
+    
+    # Price every line from the menu; client-supplied prices are ignored
+    price_index = menu.price_index
+    items, total_cents = price_index.price(order_items_data)
+    order_time = datetime.utcnow()
+    
+    return {
+        'customer_name': customer_name,
+        'customer_phone': customer_phone if customer_phone else None,
+        'items': items,
+        'item_lines': price_index.describe(items),
+        'total_price': total_cents / 100,
+        'total_cents': total_cents,
+        # One ticket per kitchen station the order needs (see ordering_core/stations.py)
+        'tickets': menu.ticket_router.route(items, order_time, prep_stats.seconds),
+        'status': 'pending',
+        'order_time': order_time
+    }
+
+def confirmation_page(order, ready_at):
+    return render_template('order_confirmation.html', 
+                         order_number=order['order_number'], 
+                         customer_name=order['customer_name'],
+                         customer_phone=order['customer_phone'] or '',
+                         item_lines=order['item_lines'],
+                         total_price=order['total_price'],
+                         ready_at=ready_at.isoformat() if ready_at else None,
+                         ready_minutes=max(1, round((ready_at - order['order_time']).total_seconds() / 60)) if ready_at else None)
+
+def order_error(e):
+    print(f"Error placing order: {str(e)}")
+    flash(f'Error placing order: {str(e)}', 'error')
+    return redirect(url_for('index'))
 
 @app.route('/place_order', methods=['POST'])
 def place_order():
     try:
-        customer_name = request.form.get('customer_name')
-        customer_phone = request.form.get('customer_phone', '').strip()
-        
-        # Parse the order items from JSON
-        import json
-        order_items_data = json.loads(request.form.get('order_items', '[]'))
-        
-        # Calculate total and format items
-        total_price = 0
-        order_items_text = []
-        
-        for item in order_items_data:
-            item_total = item['price'] * item['quantity']
-            total_price += item_total
-            
-            # Format item with customizations
-            item_text = f"{item['quantity']}x {item['name']}"
-            if item.get('customizations'):
-                item_text += f" ({', '.join(item['customizations'])})"
-            item_text += f" - ${item_total:.2f}"
-            order_items_text.append(item_text)
-        
-        order_items_str = '; '.join(order_items_text)
-        order_number = generate_order_number()
+        order = new_order(request.form, menu_catalog.current())
+        if order_journal is not None:
+            # Durable on local disk; the flusher inserts it and queues the SMS
+            order_journal.place(order)
+            active_orders.hold(order)
+            return confirmation_page(order, ready_estimator.ready_at(order))
+        order.update(revision_fields(mongo.db))
         
-        order = {
-            'order_number': order_number,
-            'customer_name': customer_name,
-            'customer_phone': customer_phone if customer_phone else None,
-            'order_items': order_items_str,
-            'order_items_detailed': order_items_data,  # Store detailed order data
-            'total_price': total_price,
-            'status': 'pending',
-            'order_time': datetime.utcnow()
-        }
+        insert_order(mongo.db.orders, order, order_numbers)
+        active_orders.put(order)
         
-        mongo.db.orders.insert_one(order)
+        if order['customer_phone']:
+            sms_outbox.enqueue(order['customer_phone'], placed_message(order), order_id=order['_id'], kind='order_placed')
         
-        if customer_phone:
-            message = f"Thank you {customer_name}! Your order #{order_number} has been placed. Total: ${total_price:.2f}. We'll text you when it's ready!"
-            send_sms(customer_phone, message)
-        
-        return render_template('order_confirmation.html', 
-                             order_number=order_number, 
-                             customer_name=customer_name,
-                             customer_phone=customer_phone,
-                             order_items=order_items_str,
-                             total_price=total_price)
+        return confirmation_page(order, ready_estimator.ready_at(order))
     except Exception as e:
-        print(f"Error placing order: {str(e)}")
-        flash(f'Error placing order: {str(e)}', 'error')
-        return redirect(url_for('index'))
+        return order_error(e)
+
+def ingest_batch(payloads, start_index=0):
+    """Insert a batch of submitted orders; returns their results"""
+    results, created = order_ingester.ingest(payloads, menu_catalog.current(), prep_stats.seconds, start_index)
+    for order in created:
+        active_orders.put(order)
+    sms_outbox.enqueue_many([(order['customer_phone'], placed_message(order), order['_id'])
+                             for order in created], kind='order_placed')
+    ready = ready_estimator.ready_times()
+    for result in results:
+        if result['status'] == 'created' and result['id'] in ready:
+            result['estimated_ready'] = ready[result['id']].isoformat()
+    return results
+
+@app.route('/api/orders', methods=['POST'])
+def ingest_orders():
+    """Bulk order submission: a JSON batch, or an NDJSON stream answered line by line"""
+    if request.mimetype == 'application/x-ndjson':
+        def stream():
+            index = 0
+            for batch in batches(read_ndjson(request.stream), STREAM_BATCH):
+                for result in ingest_batch(batch, index):
+                    yield app.json.dumps(result) + '\n'
+                index += len(batch)
+        return Response(stream_with_context(stream()), mimetype='application/x-ndjson')
+
+    data = request.get_json(silent=True)
+    payloads = data.get('orders') if isinstance(data, dict) else data
+    if not isinstance(payloads, list):
+        return jsonify({'error': 'Expected a JSON list of orders or {"orders": [...]}'}), 400
+    if len(payloads) > MAX_BATCH:
+        return jsonify({'error': f'At most {MAX_BATCH} orders per request; stream larger sets as NDJSON'}), 413
+    results = ingest_batch(payloads)
+    counts = {status: sum(1 for r in results if r['status'] == status) for status in ('created', 'duplicate', 'rejected')}
+    return jsonify({'results': results, **counts})
+
+def order_summary(order):
+    return {
+        '_id': order['_id'],
+        'order_number': order['order_number'],
+        'customer_name': order['customer_name'],
+        'item_lines': order.get('item_lines', []),
+        'status': order['status'],
+        'order_time': order.get('order_time')
+    }
 
 @app.route('/orders', methods=['GET'])
 def list_orders():
-    orders = list(mongo.db.orders.find({'status': {'$in': ['pending', 'in_progress']}}))
-    for order in orders:
-        order['_id'] = str(order['_id'])
-        order['order_time'] = order['order_time'].isoformat() if 'order_time' in order else None
-    return jsonify(orders)
+    return jsonify([order_summary(order) for order in active_orders.orders(window_minutes=0)])
+
+@app.route('/api/active_orders/stats')
+def active_orders_stats():
+    """Hit rate and staleness of the in-memory active order cache"""
+    return jsonify(active_orders.stats())
+
+@app.route('/api/order_journal/stats')
+def order_journal_stats():
+    """Orders waiting in this process's journal for MongoDB, and the flusher's progress"""
+    if order_journal is None:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, **order_journal.stats()})
 
 # ...existing code...
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    # Development server only; production runs under gunicorn (see gunicorn.conf.py)
+    app.run(host='0.0.0.0', port=5000, debug=os.getenv('FLASK_DEBUG') == '1')
@@ -0,0 +1,59 @@
+"""Customer service under an asyncio server (SERVING_MODE=async, see gunicorn.conf.py and
+ordering_core/async_serving.py).
+
+Placing an order and listing the active orders run as coroutines over Motor;
+every other route is app.py's.
+"""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app as service
+from ordering_core.async_serving import AsyncService, from_memory, motor_database
+from ordering_core.order_deltas import revision_fields_async
+from ordering_core.order_numbers import insert_order_async
+
+app = AsyncService(service.app, 'customer_service')
+db = motor_database(service.app.config['MONGO_URI'])
+
+
+async def confirmation_page(request, order):
+    # The estimate replays the station queues from the cache, which reads MongoDB until it has loaded
+    cache = service.active_orders
+    ready_at = await from_memory(cache.ready, service.ready_estimator.ready_at, order)
+    return app.flask(request, lambda: service.confirmation_page(order, ready_at))
+
+
+@app.route('/place_order', methods=['POST'])
+async def place_order(request):
+    form = await request.form()
+    try:
+        menu = await from_memory(service.menu_catalog.fresh, service.menu_catalog.current)
+        await from_memory(service.prep_stats.fresh, service.prep_stats.refresh)
+        order = service.new_order(form, menu)
+        if service.order_journal is not None:
+            # The fsync, and now and then a new order number block, off the loop
+            await asyncio.to_thread(service.order_journal.place, order)
+            service.active_orders.hold(order)
+            return await confirmation_page(request, order)
+        order.update(await revision_fields_async(db))
+
+        await insert_order_async(db.orders, order, service.order_numbers, db.counters)
+        await service.active_orders.put_async(order)
+
+        if order['customer_phone']:
+            await service.sms_outbox.enqueue_async(db.sms_outbox, order['customer_phone'],
+                                                   service.placed_message(order), order_id=order['_id'],
+                                                   kind='order_placed')
+
+        return await confirmation_page(request, order)
+    except Exception as e:
+        return app.flask(request, lambda error=e: service.order_error(error))
+
+
+@app.route('/orders')
+async def list_orders(request):
+    cache = service.active_orders
+    orders = await from_memory(cache.ready, cache.orders, 0)
+    return app.json([service.order_summary(order) for order in orders])
@@ -1,54 +1,74 @@
-from flask import Flask, render_template, jsonify
-from flask_pymongo import PyMongo
-from datetime import datetime, timedelta
+from flask import render_template, request, jsonify, Response, stream_with_context
 import os
-from dotenv import load_dotenv
+import sys
 
-load_dotenv()
-app = Flask(__name__, template_folder='templates', static_folder='static')
-app.config['MONGO_URI'] = os.environ.get('MONGO_URI', 'mongodb://localhost:27017/ordering_system')
-mongo = PyMongo(app)
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key-here')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ordering_core.active_orders import UNCACHED_FIELDS, ActiveOrderCache
+from ordering_core.config import create_app
+from ordering_core.order_deltas import delta
+from ordering_core.order_feed import OrderFeed
+from ordering_core.ready_times import PrepStats, ReadyTimeEstimator
+from ordering_core.shared_state import state_from_env
+
+app, mongo = create_app(__name__, 'display_service')
 
 @app.route('/')
 def display():
     """Public display page showing order status"""
     return render_template('display.html')
 
+def serialize_order(order):
+    # Elapsed time is worked out by the page from order_time
+    return {
+        'id': order['_id'],
+        'order_number': order['order_number'],
+        'customer_name': order['customer_name'],
+        'item_lines': order.get('item_lines', []),
+        'status': order['status'],
+        'order_time': order.get('order_time'),
+        'estimated_ready': ready_estimator.ready_at(order),
+        'revision': order.get('revision', 0)
+    }
+
+# Pub/sub, caches and counters shared with the other processes of this service (SHARED_STATE_URL)
+shared_state = state_from_env()
+
+# Completed orders stay on the display for 5 minutes
+active_orders = ActiveOrderCache(mongo.db.orders, window_minutes=5, shared=shared_state,
+                                 exclude=UNCACHED_FIELDS + ('customer_phone', 'total_price', 'total_cents'))
+# Created before the feed so the estimates are refreshed before changed orders are published
+ready_estimator = ReadyTimeEstimator(active_orders, PrepStats(mongo.db.prep_stats, shared=shared_state))
+order_feed = OrderFeed(active_orders, serialize_order, window_minutes=5)
+
 @app.route('/api/display/orders')
 def get_display_orders():
     """API endpoint to get orders for display"""
     # Get all orders that are not completed or completed within last 5 minutes
-    five_minutes_ago = datetime.utcnow() - timedelta(minutes=5)
-    
-    orders = list(mongo.db.orders.find({
-        '$or': [
-            {'status': {'$in': ['pending', 'in_progress']}},
-            {
-                'status': 'completed',
-                'completed_time': {'$gte': five_minutes_ago}
-            }
-        ]
-    }).sort('order_time', 1))
-    
-    orders_data = []
-    for order in orders:
-        # Determine time info
-        time_info = ''
-        if order.get('order_time'):
-            elapsed = (datetime.utcnow() - order['order_time']).total_seconds() / 60
-            time_info = f"{int(elapsed)} min ago"
-        
-        orders_data.append({
-            'id': str(order['_id']),
-            'order_number': order['order_number'],
-            'customer_name': order['customer_name'],
-            'order_items': order['order_items'],
-            'status': order['status'],
-            'time_info': time_info
-        })
-    
-    return jsonify(orders_data)
+    if 'since' in request.args:
+        # Only what changed after the cursor, plus ids of orders that left the window
+        return jsonify(delta(active_orders, request.args['since'], 5, serialize_order))
+    orders = active_orders.orders(window_minutes=5)
+    return jsonify([serialize_order(order) for order in orders])
+
+@app.route('/api/display/ready_times')
+def get_ready_times():
+    """Predicted ready time of every pending and in-progress order, by order id"""
+    return jsonify(ready_estimator.serialized())
+
+@app.route('/api/display/orders/stream')
+def stream_display_orders():
+    """Server-Sent Events feed: a snapshot on connect, then only changed orders"""
+    order_feed.start()
+    if not order_feed.available:
+        return jsonify({'error': 'Order feed unavailable'}), 503
+    return Response(stream_with_context(order_feed.stream()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/active_orders/stats')
+def active_orders_stats():
+    """Hit rate and staleness of the in-memory active order cache"""
+    return jsonify(active_orders.stats())
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    # Development server only; production runs under gunicorn (see gunicorn.conf.py)
+    app.run(host='0.0.0.0', port=5000, debug=os.getenv('FLASK_DEBUG') == '1')
@@ -0,0 +1,54 @@
+"""Display service under an asyncio server (SERVING_MODE=async, see gunicorn.conf.py and
+ordering_core/async_serving.py).
+
+The display orders, ready times and live feed run as coroutines, so a process
+holds thousands of open display boards; the page itself is app.py's.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app as service
+from ordering_core.async_serving import AsyncService, from_memory
+from ordering_core.order_deltas import delta
+
+app = AsyncService(service.app, 'display_service')
+
+
+async def prep_stats_loaded():
+    # Ready times are part of every serialized order
+    stats = service.ready_estimator.stats
+    await from_memory(stats.fresh, stats.refresh)
+
+
+def serialized_orders():
+    # Serializing estimates ready times from the cache's orders, so it runs wherever reading them does
+    return [service.serialize_order(order) for order in service.active_orders.orders(5)]
+
+
+@app.route('/api/display/orders')
+async def get_display_orders(request):
+    """API endpoint to get orders for display"""
+    cache = service.active_orders
+    await prep_stats_loaded()
+    if 'since' in request.args:
+        return app.json(await from_memory(cache.ready, delta, cache, request.args['since'], 5,
+                                          service.serialize_order))
+    return app.json(await from_memory(cache.ready, serialized_orders))
+
+
+@app.route('/api/display/ready_times')
+async def get_ready_times(request):
+    """Predicted ready time of every pending and in-progress order, by order id"""
+    await prep_stats_loaded()
+    return app.json(await from_memory(service.active_orders.ready, service.ready_estimator.serialized))
+
+
+@app.route('/api/display/orders/stream')
+async def stream_display_orders(request):
+    """Server-Sent Events feed: a snapshot on connect, then only changed orders"""
+    service.order_feed.start()
+    if not service.order_feed.available:
+        return app.json({'error': 'Order feed unavailable'}, 503)
+    await prep_stats_loaded()
+    return app.event_stream(service.order_feed.astream())
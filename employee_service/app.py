@@ -1,38 +1,101 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
-from flask_pymongo import PyMongo
+from flask import render_template, request, redirect, url_for, flash, jsonify, Response, stream_with_context
 from datetime import datetime
 import os
-from dotenv import load_dotenv
-from twilio.rest import Client
+import sys
 from bson.objectid import ObjectId
+from pymongo import ReturnDocument
 
-load_dotenv()
-app = Flask(__name__, template_folder='templates', static_folder='static')
-app.config['MONGO_URI'] = os.environ.get('MONGO_URI', 'mongodb://localhost:27017/ordering_system')
-mongo = PyMongo(app)
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key-here')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ordering_core.active_orders import UNCACHED_FIELDS, ActiveOrderCache
+from ordering_core import analytics
+from ordering_core.config import create_app
+from ordering_core.line_items import assign_customization_ids
+from ordering_core.menu_catalog import bump_menu_version
+from ordering_core import menu_import
+from ordering_core.order_archive import ARCHIVE_COLLECTION, archiver_from_env
+from ordering_core.order_deltas import delta, revision_fields
+from ordering_core.order_feed import OrderFeed
+from ordering_core.order_history import HistoryQuery, HistoryQueryError, fetch_page, parse_time
+from ordering_core.order_journal import tail_from_env
+from ordering_core.shared_state import state_from_env
+from ordering_core.sms import outbox_from_env, ready_message
+from ordering_core.stations import STATIONS, StationBoard, TicketError, close_tickets, set_ticket_status
 
-TWILIO_PHONE_NUMBER = os.getenv('TWILIO_PHONE_NUMBER')
-twilio_client = None
-if os.getenv('TWILIO_ACCOUNT_SID') and os.getenv('TWILIO_AUTH_TOKEN'):
-    try:
-        twilio_client = Client(os.getenv('TWILIO_ACCOUNT_SID'), os.getenv('TWILIO_AUTH_TOKEN'))
-    except Exception as e:
-        print(f"Twilio error: {e}")
+app, mongo = create_app(__name__, 'employee_service')
 
-def send_sms(phone_number, message):
-    if not twilio_client:
-        print(f"SMS would be sent to {phone_number}: {message}")
-        return False
-    try:
-        if phone_number and TWILIO_PHONE_NUMBER:
-            if not phone_number.startswith('+'):
-                phone_number = '+1' + phone_number.replace('-', '').replace('(', '').replace(')', '').replace(' ', '')
-            twilio_client.messages.create(body=message, from_=TWILIO_PHONE_NUMBER, to=phone_number)
-            return True
-    except Exception as e:
-        print(f"SMS sending failed: {e}")
-        return False
+# Pub/sub, caches and counters shared with the other processes of this service (SHARED_STATE_URL)
+shared_state = state_from_env()
+
+# SMS goes through a durable outbox drained by background workers (Twilio, or SMS_PROVIDER=fake|log)
+sms_outbox = outbox_from_env(mongo.db, shared_state)
+sms_outbox.start()
+
+def serialize_order(order):
+    return {
+        'id': order['_id'],
+        'order_number': order['order_number'],
+        'customer_name': order['customer_name'],
+        'customer_phone': order.get('customer_phone', ''),
+        'item_lines': order.get('item_lines', []),
+        'total_price': order['total_price'],
+        'status': order['status'],
+        'order_time': order.get('order_time'),
+        'completed_time': order.get('completed_time'),
+        'tickets': [{'station': t['station'], 'status': t['status']} for t in order.get('tickets', [])],
+        'revision': order.get('revision', 0)
+    }
+
+# Active orders served from memory, kept current by our writes and a watcher on the collection
+active_orders = ActiveOrderCache(mongo.db.orders, window_minutes=10, shared=shared_state,
+                                 exclude=UNCACHED_FIELDS + ('total_cents',))
+
+# Orders the customer service has journaled but not yet written to MongoDB (ORDER_JOURNAL_DIR)
+order_journal_tail = tail_from_env(active_orders)
+
+# Live feed for the worker dashboard and display board (recently completed orders stay 10 minutes)
+order_feed = OrderFeed(active_orders, serialize_order, window_minutes=10)
+
+# Per-station ticket queues, rebuilt from the cache after it changes
+station_board = StationBoard(active_orders)
+
+# Completed orders older than ARCHIVE_AFTER_DAYS move to orders_archive in the background
+order_archiver = archiver_from_env(mongo.db, shared_state)
+order_archiver.start()
+
+def order_ready(order):
+    """Roll a just-completed order into analytics and text the customer"""
+    analytics.record_completion(mongo.db, order)
+    if order.get('customer_phone'):
+        sms_outbox.enqueue(order['customer_phone'], ready_message(order), order_id=order['_id'], kind='order_ready')
+
+def status_fields(new_status, tickets=()):
+    """Fields to $set (besides the revision) when an order moves to ``new_status``; completing closes its ``tickets``"""
+    update = {'status': new_status}
+    if new_status == 'completed':
+        update['completed_time'] = datetime.utcnow()
+        # Stations stop showing an order once it is handed out
+        update.update(close_tickets(tickets, update['completed_time']))
+    return update
+
+def status_query(order_id, new_status):
+    query = {'_id': ObjectId(order_id)}
+    if new_status == 'completed':
+        # Only the update that completes the order matches, so the customer is texted once
+        query['status'] = {'$ne': 'completed'}
+    return query
+
+def set_status(order_id, new_status):
+    """Move an order to ``new_status`` from the dashboard; returns the order and whether this call completed it"""
+    tickets = []
+    if new_status == 'completed':
+        # Tickets only move forward, so the ones open now are the ones to close
+        current = mongo.db.orders.find_one({'_id': ObjectId(order_id)}, {'tickets.status': 1})
+        tickets = (current or {}).get('tickets') or []
+    update = {**status_fields(new_status, tickets), **revision_fields(mongo.db)}
+    order = mongo.db.orders.find_one_and_update(status_query(order_id, new_status), {'$set': update},
+                                                return_document=ReturnDocument.AFTER)
+    active_orders.put(order)
+    return order, new_status == 'completed' and order is not None
 
 @app.route('/')
 def index():
@@ -43,27 +106,32 @@ def display_board():
     """Public display board showing all active orders with color coding"""
     return render_template('display_board.html')
 
+def order_summary(order):
+    return {
+        '_id': order['_id'],
+        'order_number': order['order_number'],
+        'customer_name': order['customer_name'],
+        'item_lines': order.get('item_lines', []),
+        'total_price': order['total_price'],
+        'status': order['status'],
+        'order_time': order.get('order_time')
+    }
+
 @app.route('/orders', methods=['GET'])
 def list_orders():
-    orders = list(mongo.db.orders.find({'status': {'$in': ['pending', 'in_progress']}}))
-    for order in orders:
-        order['_id'] = str(order['_id'])
-        order['order_time'] = order['order_time'].isoformat() if 'order_time' in order else None
-    return jsonify(orders)
+    return jsonify([order_summary(order) for order in active_orders.orders(window_minutes=0)])
 
 @app.route('/orders/<order_id>/status', methods=['POST'])
 def update_order_status(order_id):
     data = request.get_json(force=True)
-    new_status = data.get('status')
-    update = {'status': new_status}
-    if new_status == 'completed':
-        update['completed_time'] = datetime.utcnow()
-    result = mongo.db.orders.update_one({'_id': mongo.db.ObjectId(order_id)}, {'$set': update})
-    return jsonify({'updated': result.modified_count == 1})
+    order, completed = set_status(order_id, data.get('status'))
+    if completed:
+        order_ready(order)
+    return jsonify({'updated': order is not None})
 
 @app.route('/worker')
 def worker_dashboard():
-    orders = list(mongo.db.orders.find({'status': {'$in': ['pending', 'in_progress']}}).sort('order_time', 1))
+    orders = active_orders.orders(window_minutes=0)
     for order in orders:
         order['_id'] = str(order['_id'])
     return render_template('worker_dashboard.html', orders=orders)
@@ -73,14 +141,12 @@ def update_order_status_form():
     try:
         order_id = request.form.get('order_id')
         new_status = request.form.get('status')
-        order = mongo.db.orders.find_one({'_id': ObjectId(order_id)})
-        update = {'status': new_status}
-        if new_status == 'completed':
-            update['completed_time'] = datetime.utcnow()
-            if order and order.get('customer_phone'):
-                message = f"Hi {order['customer_name']}! Your order #{order['order_number']} is ready for pickup!"
-                send_sms(order['customer_phone'], message)
-        mongo.db.orders.update_one({'_id': ObjectId(order_id)}, {'$set': update})
+        order, completed = set_status(order_id, new_status)
+        if order is None:
+            flash('Order not found or already completed', 'error')
+            return redirect(url_for('worker_dashboard'))
+        if completed:
+            order_ready(order)
         flash(f"Order #{order['order_number']} status updated to {new_status}", 'success')
     except Exception as e:
         flash(f'Error updating order: {str(e)}', 'error')
@@ -89,37 +155,103 @@ def update_order_status_form():
 @app.route('/api/orders')
 def api_orders():
     # Get pending and in_progress orders, plus recently completed orders (last 10 minutes)
-    from datetime import datetime, timedelta
-    ten_minutes_ago = datetime.utcnow() - timedelta(minutes=10)
-    
-    orders = list(mongo.db.orders.find({
-        '$or': [
-            {'status': {'$in': ['pending', 'in_progress']}},
-            {'status': 'completed', 'completed_time': {'$gte': ten_minutes_ago}}
-        ]
-    }).sort('order_time', 1))
-    
-    orders_data = []
-    for order in orders:
-        orders_data.append({
-            'id': str(order['_id']),
-            'order_number': order['order_number'],
-            'customer_name': order['customer_name'],
-            'customer_phone': order.get('customer_phone', ''),
-            'order_items': order['order_items'],
-            'total_price': order['total_price'],
-            'status': order['status'],
-            'order_time': order['order_time'].isoformat() if 'order_time' in order else None,
-            'completed_time': order['completed_time'].isoformat() if 'completed_time' in order else None
-        })
-    return jsonify(orders_data)
+    if 'since' in request.args:
+        # Only what changed after the cursor, plus ids of orders that left the window
+        return jsonify(delta(active_orders, request.args['since'], 10, serialize_order))
+    orders = active_orders.orders(window_minutes=10)
+    return jsonify([serialize_order(order) for order in orders])
+
+@app.route('/api/orders/stream')
+def api_orders_stream():
+    """Server-Sent Events feed: a snapshot on connect, then only changed orders"""
+    order_feed.start()
+    if not order_feed.available:
+        return jsonify({'error': 'Order feed unavailable'}), 503
+    return Response(stream_with_context(order_feed.stream()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/active_orders/stats')
+def active_orders_stats():
+    """Hit rate and staleness of the in-memory active order cache"""
+    return jsonify(active_orders.stats())
+
+@app.route('/api/archive/stats')
+def archive_stats():
+    """Orders archived by this process, the last run's throughput, and both collections' sizes"""
+    return jsonify(order_archiver.stats())
+
+@app.route('/api/archive/run', methods=['POST'])
+def run_archive():
+    """Start an archive run now instead of at the next interval"""
+    order_archiver.wake()
+    return jsonify({'started': True}), 202
+
+@app.route('/stations')
+def stations():
+    """Station picker with queue lengths"""
+    return render_template('stations.html', stations=station_board.summary())
+
+@app.route('/stations/<station>')
+def station_screen(station):
+    """One station's ticket screen, fed by /api/stations/<station>"""
+    if station not in STATIONS:
+        flash(f'Unknown station: {station}', 'error')
+        return redirect(url_for('stations'))
+    return render_template('station.html', station=station, name=STATIONS[station]['name'])
+
+@app.route('/api/stations/<station>')
+def api_station(station):
+    """Tickets being cooked and the first queued ones for a station, in schedule order"""
+    try:
+        view, etag = station_board.view(station)
+    except TicketError as e:
+        return jsonify({'error': str(e)}), 404
+    response = jsonify(view)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+@app.route('/api/stations/<station>/tickets/<order_id>', methods=['POST'])
+def api_ticket_status(station, order_id):
+    """Start or finish a station's ticket; the order completes when its last ticket is done"""
+    data = request.get_json(force=True)
+    try:
+        order, completed = set_ticket_status(mongo.db, ObjectId(order_id), station, data.get('status'))
+    except TicketError as e:
+        return jsonify({'error': str(e)}), 400
+    active_orders.put(order)
+    if completed:
+        order_ready(order)
+    return jsonify({'order_status': order['status'], 'completed': completed,
+                    'tickets': [{'station': t['station'], 'status': t['status']} for t in order['tickets']]})
 
 @app.route('/order_history')
 def order_history():
-    completed_orders = list(mongo.db.orders.find({'status': 'completed'}).sort('completed_time', -1).limit(50))
-    for order in completed_orders:
-        order['_id'] = str(order['_id'])
-    return render_template('order_history.html', orders=completed_orders)
+    """History page; rows are fetched page by page from /api/orders/history"""
+    return render_template('order_history.html')
+
+@app.route('/api/orders/history')
+def api_order_history():
+    """One page of order history, filtered and sorted server-side; pass next_cursor back for the next page"""
+    try:
+        query = HistoryQuery(request.args)
+    except HistoryQueryError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(fetch_page(mongo.db.orders, query, archive=mongo.db[ARCHIVE_COLLECTION]))
+
+@app.route('/analytics')
+def analytics_dashboard():
+    """Sales and kitchen throughput, drawn from /api/analytics"""
+    return render_template('analytics.html')
+
+@app.route('/api/analytics')
+def api_analytics():
+    """Rolled-up sales, items, customizations and prep time for a range of hours (default: last 24)"""
+    try:
+        start, end = analytics.parse_range(request.args, parse_time)
+    except analytics.AnalyticsError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(analytics.summarize(mongo.db, start, end))
 
 @app.route('/admin/menu')
 def admin_menu():
@@ -130,6 +262,66 @@ def admin_menu():
         item['_id'] = str(item['_id'])
     return render_template('admin_menu.html', menu_items=menu_items)
 
+@app.route('/admin/menu/export')
+def export_menu():
+    """Download the whole catalog as CSV or JSON"""
+    fmt = request.args.get('format', 'csv')
+    items = list(mongo.db.menu_items.find())
+    if fmt == 'json':
+        body, mimetype = menu_import.to_json(items), 'application/json'
+    else:
+        fmt, body, mimetype = 'csv', menu_import.to_csv(items), 'text/csv'
+    return Response(body, mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename=menu.{fmt}'})
+
+@app.route('/admin/menu/import', methods=['POST'])
+def import_menu():
+    """Preview or apply a CSV/JSON catalog import.
+
+    The admin page uploads a file and gets a preview page, which posts the same
+    content back to apply it. Scripts post the file as the request body
+    (text/csv or application/json) and get the diff as JSON; ``?apply=1``
+    writes it.
+    """
+    from_form = bool(request.files) or request.mimetype == 'multipart/form-data' or bool(request.form)
+    if from_form:
+        upload = request.files.get('file')
+        text = upload.read().decode('utf-8-sig') if upload else request.form.get('content', '')
+        fmt = request.form.get('format') or ('json' if upload and upload.filename.endswith('.json') else 'csv')
+        apply = request.form.get('apply') == '1'
+        deactivate_missing = request.form.get('deactivate_missing') == '1'
+    else:
+        text = request.get_data(as_text=True)
+        fmt = 'json' if request.mimetype == 'application/json' else 'csv'
+        apply = request.args.get('apply') == '1'
+        deactivate_missing = request.args.get('deactivate_missing') == '1'
+    try:
+        plan = menu_import.plan_import(mongo.db.menu_items, menu_import.read_import(text, fmt), deactivate_missing)
+    except menu_import.MenuImportError as e:
+        if from_form:
+            flash(f'Import failed: {e}', 'error')
+            return redirect(url_for('admin_menu'))
+        return jsonify({'error': str(e)}), 400
+    written = plan.apply(mongo.db) if apply else 0
+    if not from_form:
+        return jsonify({**plan.summary(), 'applied': apply, 'written': written})
+    if apply:
+        flash(f'Menu import applied: {written} items written', 'success')
+        return redirect(url_for('admin_menu'))
+    return render_template('admin_menu_import.html', plan=plan.summary(), content=text, format=fmt,
+                           deactivate_missing=deactivate_missing)
+
+@app.route('/admin/menu/batch', methods=['POST'])
+def batch_menu_items():
+    """Activate, deactivate, reprice or delete the selected menu items in one bulk write"""
+    try:
+        changed = menu_import.batch_update(mongo.db, request.form.getlist('item_ids'), request.form.get('action'),
+                                           request.form.get('value'))
+        flash(f'{changed} menu items updated', 'success')
+    except menu_import.MenuImportError as e:
+        flash(f'Error updating menu items: {e}', 'error')
+    return redirect(url_for('admin_menu'))
+
 @app.route('/admin/menu/add', methods=['POST'])
 def add_menu_item():
     """Add a new menu item"""
@@ -137,13 +329,10 @@ def add_menu_item():
         name = request.form.get('name')
         category = request.form.get('category')
         description = request.form.get('description', '')
-        base_price = float(request.form.get('base_price', 0))
+        # Prices are checked as imported ones are: a NaN or inf price would break pricing for the whole menu
+        base_price, customizations = menu_import.form_prices(request.form)
         image_url = request.form.get('image_url', '')
-        
-        # Parse customizations
-        import json
-        customizations_json = request.form.get('customizations', '[]')
-        customizations = json.loads(customizations_json) if customizations_json else []
+        customization_seq = assign_customization_ids(customizations)
         
         menu_item = {
             'name': name,
@@ -152,11 +341,13 @@ def add_menu_item():
             'base_price': base_price,
             'image_url': image_url,
             'customizations': customizations,
+            'customization_seq': customization_seq,
             'active': True,
             'created_at': datetime.utcnow()
         }
         
         mongo.db.menu_items.insert_one(menu_item)
+        bump_menu_version(mongo.db)
         flash(f'Menu item "{name}" added successfully!', 'success')
     except Exception as e:
         flash(f'Error adding menu item: {str(e)}', 'error')
@@ -167,14 +358,14 @@ def add_menu_item():
 def edit_menu_item(item_id):
     """Edit an existing menu item"""
     try:
-        import json
         name = request.form.get('name')
         category = request.form.get('category')
         description = request.form.get('description', '')
-        base_price = float(request.form.get('base_price', 0))
+        base_price, customizations = menu_import.form_prices(request.form)
         image_url = request.form.get('image_url', '')
-        customizations_json = request.form.get('customizations', '[]')
-        customizations = json.loads(customizations_json) if customizations_json else []
+        # Keep existing customization ids; new customizations get ids the item has never used
+        existing = mongo.db.menu_items.find_one({'_id': ObjectId(item_id)}, {'customization_seq': 1}) or {}
+        customization_seq = assign_customization_ids(customizations, existing.get('customization_seq', 0))
         
         update_data = {
             'name': name,
@@ -183,6 +374,7 @@ def edit_menu_item(item_id):
             'base_price': base_price,
             'image_url': image_url,
             'customizations': customizations,
+            'customization_seq': customization_seq,
             'updated_at': datetime.utcnow()
         }
         
@@ -190,6 +382,7 @@ def edit_menu_item(item_id):
             {'_id': ObjectId(item_id)},
             {'$set': update_data}
         )
+        bump_menu_version(mongo.db)
         flash(f'Menu item "{name}" updated successfully!', 'success')
     except Exception as e:
         flash(f'Error updating menu item: {str(e)}', 'error')
@@ -207,6 +400,7 @@ def toggle_menu_item(item_id):
                 {'_id': ObjectId(item_id)},
                 {'$set': {'active': new_status}}
             )
+            bump_menu_version(mongo.db)
             status_text = 'activated' if new_status else 'deactivated'
             flash(f'Menu item {status_text} successfully!', 'success')
     except Exception as e:
@@ -220,6 +414,7 @@ def delete_menu_item(item_id):
     try:
         result = mongo.db.menu_items.delete_one({'_id': ObjectId(item_id)})
         if result.deleted_count > 0:
+            bump_menu_version(mongo.db)
             flash('Menu item deleted successfully!', 'success')
         else:
             flash('Menu item not found!', 'error')
@@ -229,4 +424,5 @@ def delete_menu_item(item_id):
     return redirect(url_for('admin_menu'))
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    # Development server only; production runs under gunicorn (see gunicorn.conf.py)
+    app.run(host='0.0.0.0', port=5000, debug=os.getenv('FLASK_DEBUG') == '1')
@@ -0,0 +1,125 @@
+"""Employee service under an asyncio server (SERVING_MODE=async, see gunicorn.conf.py and
+ordering_core/async_serving.py).
+
+Order status updates, station ticket updates, the active order lists, the live
+feed and the station queues run as coroutines over Motor; every other route
+(admin, history, analytics) is app.py's.
+"""
+import os
+import sys
+
+from bson.objectid import ObjectId
+from flask import flash, redirect, url_for
+from pymongo import ReturnDocument
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app as service
+from ordering_core.analytics import record_completion_async
+from ordering_core.async_serving import AsyncService, from_memory, motor_database
+from ordering_core.order_deltas import delta, revision_fields_async
+from ordering_core.stations import TicketError, set_ticket_status_async
+
+app = AsyncService(service.app, 'employee_service')
+db = motor_database(service.app.config['MONGO_URI'])
+
+
+async def set_status(order_id, new_status):
+    """``service.set_status`` over Motor: the order after the write, and whether this call completed it"""
+    tickets = []
+    if new_status == 'completed':
+        current = await db.orders.find_one({'_id': ObjectId(order_id)}, {'tickets.status': 1})
+        tickets = (current or {}).get('tickets') or []
+    update = {**service.status_fields(new_status, tickets), **await revision_fields_async(db)}
+    order = await db.orders.find_one_and_update(service.status_query(order_id, new_status), {'$set': update},
+                                                return_document=ReturnDocument.AFTER)
+    await service.active_orders.put_async(order)
+    return order, new_status == 'completed' and order is not None
+
+
+async def order_ready(order):
+    """Roll a just-completed order into analytics and text the customer"""
+    await record_completion_async(db, order)
+    if order.get('customer_phone'):
+        await service.sms_outbox.enqueue_async(db.sms_outbox, order['customer_phone'], service.ready_message(order),
+                                               order_id=order['_id'], kind='order_ready')
+
+
+def back_to_dashboard(message, category):
+    flash(message, category)
+    return redirect(url_for('worker_dashboard'))
+
+
+@app.route('/orders')
+async def list_orders(request):
+    cache = service.active_orders
+    orders = await from_memory(cache.ready, cache.orders, 0)
+    return app.json([service.order_summary(order) for order in orders])
+
+
+@app.route('/orders/<order_id>/status', methods=['POST'])
+async def update_order_status(request, order_id):
+    order, completed = await set_status(order_id, (await request.json()).get('status'))
+    if completed:
+        await order_ready(order)
+    return app.json({'updated': order is not None})
+
+
+@app.route('/update_order_status', methods=['POST'])
+async def update_order_status_form(request):
+    form = await request.form()
+    try:
+        new_status = form.get('status')
+        order, completed = await set_status(form.get('order_id'), new_status)
+        if completed:
+            await order_ready(order)
+        if order is None:
+            message, category = 'Order not found or already completed', 'error'
+        else:
+            message, category = f"Order #{order['order_number']} status updated to {new_status}", 'success'
+    except Exception as e:
+        message, category = f'Error updating order: {str(e)}', 'error'
+    return app.flask(request, lambda: back_to_dashboard(message, category))
+
+
+@app.route('/api/orders')
+async def api_orders(request):
+    cache = service.active_orders
+    if 'since' in request.args:
+        return app.json(await from_memory(cache.ready, delta, cache, request.args['since'], 10,
+                                          service.serialize_order))
+    orders = await from_memory(cache.ready, cache.orders, 10)
+    return app.json([service.serialize_order(order) for order in orders])
+
+
+@app.route('/api/orders/stream')
+async def api_orders_stream(request):
+    """Server-Sent Events feed: a snapshot on connect, then only changed orders"""
+    service.order_feed.start()
+    if not service.order_feed.available:
+        return app.json({'error': 'Order feed unavailable'}, 503)
+    return app.event_stream(service.order_feed.astream())
+
+
+@app.route('/api/stations/<station>')
+async def api_station(request, station):
+    """Tickets being cooked and the first queued ones for a station, in schedule order"""
+    try:
+        view, etag = await from_memory(service.active_orders.ready, service.station_board.view, station)
+    except TicketError as e:
+        return app.json({'error': str(e)}, 404)
+    return app.conditional(request, view, etag)
+
+
+@app.route('/api/stations/<station>/tickets/<order_id>', methods=['POST'])
+async def api_ticket_status(request, station, order_id):
+    """Start or finish a station's ticket; the order completes when its last ticket is done"""
+    data = await request.json()
+    try:
+        order, completed = await set_ticket_status_async(db, ObjectId(order_id), station, data.get('status'))
+    except TicketError as e:
+        return app.json({'error': str(e)}, 400)
+    await service.active_orders.put_async(order)
+    if completed:
+        await order_ready(order)
+    return app.json({'order_status': order['status'], 'completed': completed,
+                     'tickets': [{'station': t['station'], 'status': t['status']} for t in order['tickets']]})
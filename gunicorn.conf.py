@@ -0,0 +1,44 @@
+"""
+Gunicorn settings shared by the three services
+
+    gunicorn -c gunicorn.conf.py                  (inside a service directory / container)
+
+SERVING_MODE=async serves asgi.py instead of app.py on uvicorn workers: order
+placement, status updates and the order feeds run as coroutines on one event
+loop per worker and the remaining routes on GUNICORN_THREADS threads (see
+ordering_core/async_serving.py).
+
+Every value can be overridden from the environment. Each worker process gets
+its own PyMongo client and background threads (active-order watcher, SMS
+workers), so the app must be imported after the fork: do not enable preload.
+With SHARED_STATE_URL set the workers elect one active-order watcher between them.
+Send SIGHUP to the master for a graceful reload.
+"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+
+if os.getenv('SERVING_MODE', 'sync') == 'async':
+    wsgi_app = 'asgi:app'
+    worker_class = 'uvicorn_worker.UvicornWorker'
+else:
+    wsgi_app = 'app:app'
+    # Threaded workers: live-feed (SSE) connections each hold a thread, so keep a few spare per worker
+    worker_class = 'gthread'
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv('GUNICORN_THREADS', '8'))
+
+# Long enough for a slow Mongo failover; gthread workers heartbeat independently of open streams
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '30'))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+# Keep this above the load balancer's idle timeout so it never reuses a connection we just closed
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '75'))
+
+# Recycle workers now and then to cap slow leaks; jitter avoids restarting them all at once
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '5000'))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', '500'))
+
+preload_app = False
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
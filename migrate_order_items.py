@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Convert stored orders to the canonical line-item schema
+Gives every menu customization an id, then rewrites each order that still has
+the old order_items string / order_items_detailed into items + item_lines, and
+finally rebuilds the analytics rollups (which are keyed by those ids).
+Safe to run again: converted orders are skipped.
+"""
+
+from pymongo import UpdateOne
+
+from ordering_core import analytics
+from ordering_core.config import database
+from ordering_core.line_items import assign_customization_ids, migrate_order
+from ordering_core.menu_catalog import bump_menu_version
+
+BATCH_SIZE = 500
+
+# Connect to MongoDB
+db = database()
+
+print("🏷️  Assigning customization ids...")
+customization_ids = {}
+updated_items = 0
+for item in db.menu_items.find({}, {'customizations': 1, 'customization_seq': 1}):
+    customizations = item.get('customizations') or []
+    if any(not c.get('id') for c in customizations):
+        sequence = assign_customization_ids(customizations, item.get('customization_seq', 0))
+        db.menu_items.update_one({'_id': item['_id']},
+                                 {'$set': {'customizations': customizations, 'customization_seq': sequence}})
+        updated_items += 1
+    customization_ids[str(item['_id'])] = {c['name']: c['id'] for c in customizations}
+if updated_items:
+    bump_menu_version(db)
+print(f"   {updated_items} menu items updated")
+
+print("📦 Converting orders...")
+converted = 0
+last_id = None
+while True:
+    query = {'items': {'$exists': False}}
+    if last_id is not None:
+        query['_id'] = {'$gt': last_id}
+    orders = list(db.orders.find(query, {'order_items': 1, 'order_items_detailed': 1})
+                  .sort('_id', 1).limit(BATCH_SIZE))
+    if not orders:
+        break
+    last_id = orders[-1]['_id']
+    db.orders.bulk_write([UpdateOne({'_id': order['_id']}, migrate_order(order, customization_ids))
+                          for order in orders], ordered=False)
+    converted += len(orders)
+    print(f"   {converted} orders")
+
+if converted:
+    print("📊 Rebuilding analytics rollups...")
+    analytics.reset(db)
+    print(f"   {analytics.backfill(db)} orders rolled up")
+
+print(f"\n✨ Converted {converted} orders!")
+db.client.close()
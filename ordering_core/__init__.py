@@ -0,0 +1 @@
+"""Code shared by the customer, employee and display services."""
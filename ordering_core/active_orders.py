@@ -0,0 +1,486 @@
+"""In-memory cache of the active orders, shared by the three services.
+
+The cache is seeded once from MongoDB and then kept current two ways: the
+service's own write paths hand it the order they just wrote (``put``), and a
+background thread follows the orders collection so writes made by the other
+services show up too (a change stream on a replica set, otherwise a diff of the
+active-order query on a fixed interval). Reads never touch the database unless
+the cache has not loaded yet or its watcher has fallen too far behind.
+
+The cache also remembers which orders left it in the last few minutes, so it
+can answer "what changed since revision N" (see ``changes`` and order_deltas)
+with tombstones for the orders a client should drop.
+
+Orders placed through the order journal (see order_journal.py) are ``hold``-ed
+until they reach MongoDB: they show in every read, but the watcher's view of the
+collection does not drop them, and the copy from MongoDB replaces them.
+
+Given a ``shared`` state (see shared_state.py), the processes of a service
+share one watcher: whichever holds the lease follows the collection and
+publishes each change, plus a heartbeat and a periodic snapshot, and the others
+apply what it publishes without querying MongoDB. Writers also publish the
+orders they ``put``, so replicas see them at once. When the leader goes quiet
+its lease runs out and another process takes over.
+"""
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from ordering_core.shared_state import SharedStateError
+
+ACTIVE_STATUSES = ['pending', 'in_progress']
+# The watching process renews its lease well within this; followers take over once it lapses
+LEASE_SECONDS = 10.0
+# How often the leader stores a full snapshot for followers that start or reconnect
+SNAPSHOT_SECONDS = 5.0
+# Order fields no service reads from its cache: SMS delivery status and the pre-migration line formats
+UNCACHED_FIELDS = ('sms', 'order_items', 'order_items_detailed')
+
+
+def active_orders_query(window_minutes, statuses=None):
+    """Pending or in_progress orders, plus orders completed within the window"""
+    if statuses is None:
+        statuses = ACTIVE_STATUSES
+    query = {'$or': [{'status': {'$in': statuses}}]}
+    if window_minutes:
+        since = datetime.utcnow() - timedelta(minutes=window_minutes)
+        query['$or'].append({'status': 'completed', 'completed_time': {'$gte': since}})
+    return query
+
+
+def _order_time(order):
+    return order.get('order_time') or datetime.min
+
+
+class LeaseLost(Exception):
+    pass
+
+
+class ActiveOrderCache:
+    """Active orders keyed by id, plus hit/miss counters and staleness.
+
+    ``window_minutes`` is the longest completed-order window any caller reads;
+    narrower windows are filtered in memory. Caches with a ``shared`` state and
+    the same window share one watcher. Fields in ``exclude`` are never fetched
+    nor kept, so the cache holds only what its service reads.
+    """
+
+    def __init__(self, collection, window_minutes=10, poll_interval=2.0, max_staleness=30.0,
+                 departure_seconds=300.0, shared=None, exclude=()):
+        self.collection = collection
+        self.window_minutes = window_minutes
+        self.exclude = frozenset(exclude)
+        self.projection = {field: 0 for field in sorted(self.exclude)} or None
+        self.poll_interval = poll_interval
+        self.max_staleness = max_staleness
+        self.departure_seconds = departure_seconds
+        self.shared = shared
+        self.owner = f'{os.getpid()}-{uuid.uuid4().hex[:8]}'
+        self.channel = f'active_orders:{collection.name}:{window_minutes}'
+        self.leader = shared is None
+        self.mode = None
+        self.hits = 0
+        self.misses = 0
+        self.last_sync = None
+        self.revision = 0
+        self._orders = {}
+        # Journaled orders not in MongoDB yet, and when each was reported flushed
+        self._held = {}
+        self._released = {}
+        self._departed = deque()
+        self._tracking_since = None
+        self._renewed_at = 0.0
+        self._snapshot_at = 0.0
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._loaded = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def ready(self):
+        return self._loaded.is_set() and self.running and self.staleness() <= self.max_staleness
+
+    def start(self):
+        with self._lock:
+            if self.running:
+                return
+            self._thread = threading.Thread(target=self._run, name='active-order-cache', daemon=True)
+            self._thread.start()
+
+    def wait_until_ready(self, timeout=5):
+        self.start()
+        return self._loaded.wait(timeout)
+
+    def add_listener(self, listener):
+        """Call ``listener()`` after every change and every sync with the database"""
+        self._listeners.append(listener)
+
+    def staleness(self):
+        """Seconds since the cache last confirmed it matched the database"""
+        if self.last_sync is None:
+            return float('inf')
+        return time.monotonic() - self.last_sync
+
+    def stats(self):
+        total = self.hits + self.misses
+        staleness = self.staleness()
+        return {
+            'mode': self.mode,
+            'leader': self.leader,
+            'size': len(self._orders),
+            'held': len(self._held),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else None,
+            'staleness_seconds': round(staleness, 3) if staleness != float('inf') else None
+        }
+
+    def orders(self, window_minutes=None, statuses=None):
+        """Active orders sorted by order_time, as copies the caller may modify.
+
+        ``window_minutes`` of 0 leaves completed orders out; ``None`` uses the
+        cache's own window.
+        """
+        if window_minutes is None:
+            window_minutes = self.window_minutes
+        self.start()
+        if not self.ready:
+            self.misses += 1
+            query = active_orders_query(window_minutes, statuses)
+            return list(self.collection.find(query, self.projection).sort('order_time', 1))
+        self.hits += 1
+        return self.view(window_minutes, statuses)
+
+    def view(self, window_minutes=None, statuses=None):
+        """Like ``orders`` but memory only and not counted as a hit (for internal consumers)"""
+        if window_minutes is None:
+            window_minutes = self.window_minutes
+        if statuses is None:
+            statuses = ACTIVE_STATUSES
+        since = datetime.utcnow() - timedelta(minutes=window_minutes)
+        with self._lock:
+            held = [order for order_id, order in self._held.items() if order_id not in self._orders]
+            orders = [
+                dict(order) for order in list(self._orders.values()) + held
+                if order.get('status') in statuses
+                or (window_minutes and order.get('status') == 'completed'
+                    and order.get('completed_time') and order['completed_time'] >= since)
+            ]
+        orders.sort(key=_order_time)
+        return orders
+
+    def changes(self, revision, since, window_minutes=None):
+        """(orders changed after ``revision`` or ``since``, ids that left the window since then).
+
+        Returns None when the cache cannot tell: it is not ready, or ``since``
+        is older than the departures it remembers.
+        """
+        if window_minutes is None:
+            window_minutes = self.window_minutes
+        self.start()
+        now = datetime.utcnow()
+        if (not self.ready or self._tracking_since is None or since < self._tracking_since
+                or since < now - timedelta(seconds=self.departure_seconds)):
+            return None
+
+        def changed(order):
+            return order.get('revision', 0) > revision or (order.get('updated_at') or datetime.min) >= since
+
+        visible = {str(order['_id']): order for order in self.view(window_minutes)}
+        # Unchanged orders that were inside the window at ``since`` but have aged out of it
+        window_start = since - timedelta(minutes=window_minutes)
+        with self._lock:
+            removed = {order_id for left_at, order_id in self._departed if left_at >= since}
+            for order_id, order in self._orders.items():
+                if order_id not in visible and (
+                        changed(order) or (order.get('completed_time') or datetime.min) >= window_start):
+                    removed.add(order_id)
+        self.hits += 1
+        return [order for order in visible.values() if changed(order)], sorted(removed - visible.keys())
+
+    def put(self, order):
+        """Record an order this process just inserted or updated"""
+        if order is not None:
+            order = self._project(order)
+            self._apply(order)
+            self._notify()
+            self._publish(orders=[order])
+
+    async def put_async(self, order):
+        """``put`` for coroutines: with a distributed shared state the publish is a network call, made off the loop"""
+        if self.shared is None or not self.shared.distributed:
+            self.put(order)
+            return
+        # Only the async serving mode pays for importing asyncio
+        import asyncio
+        await asyncio.to_thread(self.put, order)
+
+    def hold(self, order):
+        """Show a journaled order that is not in MongoDB yet; the copy from MongoDB replaces it"""
+        order_id = str(order['_id'])
+        with self._lock:
+            if order_id in self._orders:
+                return
+            self._held[order_id] = self._project(order)
+        self._notify()
+
+    def release(self, order_ids):
+        """The journal flushed these orders: stop holding them once the watcher has had time to see them"""
+        now = time.monotonic()
+        with self._lock:
+            for order_id in order_ids:
+                if order_id in self._held:
+                    self._released.setdefault(order_id, now)
+
+    def _unhold(self, order_id, departed=False):
+        """Stop holding an order, replaced by its copy from MongoDB or ``departed`` (callers hold the lock)"""
+        self._released.pop(order_id, None)
+        if self._held.pop(order_id, None) is not None and departed and order_id not in self._orders:
+            self._record_departure(order_id)
+
+    def _in_window(self, order):
+        if order.get('status') in ACTIVE_STATUSES:
+            return True
+        if order.get('status') == 'completed' and order.get('completed_time'):
+            since = datetime.utcnow() - timedelta(minutes=self.window_minutes)
+            return order['completed_time'] >= since
+        return False
+
+    def _depart(self, order_id):
+        """Forget an order and remember that it left (callers hold the lock)"""
+        if self._orders.pop(order_id, None) is not None:
+            self._record_departure(order_id)
+
+    def _record_departure(self, order_id):
+        now = datetime.utcnow()
+        self._departed.append((now, order_id))
+        horizon = now - timedelta(seconds=self.departure_seconds)
+        while self._departed and self._departed[0][0] < horizon:
+            self._departed.popleft()
+
+    def _project(self, order):
+        """``order`` without the excluded fields, as a query with ``projection`` would return it"""
+        if not self.exclude.intersection(order):
+            return order
+        return {field: value for field, value in order.items() if field not in self.exclude}
+
+    def _apply(self, order):
+        order = self._project(order)
+        order_id = str(order['_id'])
+        with self._lock:
+            current = self._orders.get(order_id)
+            # Published copies can arrive after a newer one
+            if current is not None and current.get('revision', 0) > order.get('revision', 0):
+                return
+            self.revision = max(self.revision, order.get('revision', 0))
+            self._unhold(order_id)
+            if self._in_window(order):
+                self._orders[order_id] = order
+            else:
+                self._depart(order_id)
+
+    def _remove(self, order_id):
+        with self._lock:
+            self._depart(order_id)
+
+    def _expire(self):
+        """Drop completed orders that have aged out of the window, and released orders nobody reported"""
+        horizon = time.monotonic() - self.max_staleness
+        with self._lock:
+            for order_id, order in list(self._orders.items()):
+                if not self._in_window(order):
+                    self._depart(order_id)
+            for order_id, released_at in list(self._released.items()):
+                # Flushed, yet the watcher never brought it: it left the window before we looked
+                if released_at < horizon:
+                    self._unhold(order_id, departed=True)
+
+    def _notify(self):
+        for listener in self._listeners:
+            try:
+                listener()
+            except Exception as e:
+                print(f"Active order listener failed: {e}")
+
+    def _load_snapshot(self):
+        started = datetime.utcnow()
+        queried = time.monotonic()
+        orders = {str(o['_id']): o for o in self.collection.find(active_orders_query(self.window_minutes),
+                                                                 self.projection)}
+        with self._lock:
+            for order_id in orders:
+                self._unhold(order_id)
+            for order_id, released_at in list(self._released.items()):
+                # In MongoDB before the query ran, so its absence means it has left the window
+                if released_at < queried:
+                    self._unhold(order_id, departed=True)
+            removed = set(self._orders) - set(orders)
+            changed = [order for order_id, order in orders.items() if self._orders.get(order_id) != order]
+            for order_id in removed:
+                self._depart(order_id)
+            self._orders = orders
+            self.revision = max([self.revision] + [o.get('revision', 0) for o in orders.values()])
+            if self._tracking_since is None:
+                self._tracking_since = started
+        self.last_sync = time.monotonic()
+        self._loaded.set()
+        self._notify()
+        if self.leader:
+            self._publish(orders=changed, removed=sorted(removed), synced=True)
+            self._lead()
+
+    def _run(self):
+        if self.shared is None:
+            self._watch()
+            return
+        self.shared.subscribe(self.channel, self._receive, on_connect=self._catch_up)
+        while True:
+            try:
+                self.leader = self.shared.hold_lease(f'{self.channel}:leader', self.owner, LEASE_SECONDS)
+            except SharedStateError as e:
+                print(f"Active order cache: shared state unavailable ({e})")
+                self.leader = False
+            if self.leader:
+                self._renewed_at = time.monotonic()
+                try:
+                    self._watch()
+                except LeaseLost:
+                    print("Active order cache: lost the watcher lease, following the new watcher")
+                self.leader = False
+            else:
+                self.mode = 'follower'
+                time.sleep(self.poll_interval)
+
+    def _watch(self):
+        while True:
+            try:
+                self._watch_change_stream()
+            except OperationFailure as e:
+                # Standalone servers have no change streams; diff the query instead
+                print(f"Active order cache: change stream unavailable ({e}), polling every {self.poll_interval}s")
+                self._poll_forever()
+            except PyMongoError as e:
+                print(f"Active order cache error: {e}")
+                time.sleep(self.poll_interval)
+
+    def _watch_change_stream(self):
+        pipeline = [{'$project': {f'fullDocument.{field}': 0 for field in self.projection}}] if self.projection else []
+        with self.collection.watch(pipeline, full_document='updateLookup', max_await_time_ms=1000) as stream:
+            self.mode = 'change_stream'
+            self._load_snapshot()
+            while stream.alive:
+                change = stream.try_next()
+                if change is None:
+                    # An empty batch means we have seen everything up to now
+                    self.last_sync = time.monotonic()
+                elif change['operationType'] == 'delete':
+                    self._remove(str(change['documentKey']['_id']))
+                elif change.get('fullDocument'):
+                    self._apply(change['fullDocument'])
+                self._expire()
+                self._notify()
+                if change is None:
+                    self._publish(synced=True)
+                elif change['operationType'] == 'delete':
+                    self._publish(removed=[str(change['documentKey']['_id'])])
+                elif change.get('fullDocument'):
+                    self._publish(orders=[change['fullDocument']])
+                self._lead()
+
+    def _poll_forever(self):
+        self.mode = 'polling'
+        while True:
+            try:
+                self._load_snapshot()
+            except PyMongoError as e:
+                print(f"Active order cache error: {e}")
+            time.sleep(self.poll_interval)
+
+    def _publish(self, orders=(), removed=(), synced=False):
+        """Tell the other processes sharing this cache what changed"""
+        if self.shared is None or not (orders or removed or synced):
+            return
+        try:
+            self.shared.publish(self.channel, {'origin': self.owner, 'orders': list(orders),
+                                               'removed': list(removed), 'synced': synced})
+        except SharedStateError as e:
+            print(f"Active order cache: could not publish changes ({e})")
+
+    def _lead(self):
+        """Renew the watcher lease and refresh the stored snapshot when due; raises LeaseLost"""
+        if self.shared is None:
+            return
+        now = time.monotonic()
+        if now - self._renewed_at > LEASE_SECONDS / 3:
+            try:
+                held = self.shared.hold_lease(f'{self.channel}:leader', self.owner, LEASE_SECONDS)
+            except SharedStateError:
+                held = False
+            if not held:
+                raise LeaseLost()
+            self._renewed_at = now
+        if now - self._snapshot_at > SNAPSHOT_SECONDS:
+            with self._lock:
+                orders = list(self._orders.values())
+            try:
+                self.shared.set(f'{self.channel}:snapshot',
+                                {'orders': orders, 'revision': self.revision, 'synced_at': datetime.utcnow()},
+                                ttl=self.max_staleness)
+                self._snapshot_at = now
+            except SharedStateError as e:
+                print(f"Active order cache: could not store snapshot ({e})")
+
+    def _receive(self, message):
+        """Apply changes published by another process"""
+        if message.get('origin') == self.owner:
+            return
+        for order in message.get('orders') or []:
+            self._apply(order)
+        for order_id in message.get('removed') or []:
+            self._remove(order_id)
+        if message.get('synced') and self._loaded.is_set():
+            self.last_sync = time.monotonic()
+        self._expire()
+        self._notify()
+
+    def _catch_up(self):
+        """Load the leader's stored snapshot after (re)subscribing; MongoDB only when there is none"""
+        if self.leader:
+            return
+        try:
+            snapshot = self.shared.get(f'{self.channel}:snapshot')
+        except SharedStateError as e:
+            print(f"Active order cache: could not load snapshot ({e})")
+            snapshot = None
+        if snapshot is None:
+            try:
+                self._load_snapshot()
+            except PyMongoError as e:
+                print(f"Active order cache error: {e}")
+            return
+        age = (datetime.utcnow() - snapshot['synced_at']).total_seconds()
+        orders = {str(o['_id']): o for o in snapshot['orders']}
+        with self._lock:
+            for order_id, order in list(self._orders.items()):
+                # Keep what arrived after the snapshot was taken
+                if order.get('revision', 0) > snapshot['revision']:
+                    orders[order_id] = order
+                elif order_id not in orders:
+                    self._depart(order_id)
+            self._orders = orders
+            self.revision = max(self.revision, snapshot['revision'])
+            if self._tracking_since is None:
+                self._tracking_since = snapshot['synced_at']
+        self.last_sync = time.monotonic() - max(0.0, age)
+        self._loaded.set()
+        self._expire()
+        self._notify()
@@ -0,0 +1,317 @@
+"""Sales and kitchen-throughput rollups, kept in the analytics_rollups collection.
+
+When an order completes, its numbers are added ($inc) to a few small documents
+for the hour it was ordered in: one for the hour as a whole (orders, items,
+revenue, prep time from order_time to completed_time), one per menu item and
+one per item customization, keyed by the ids in the order's ``items``. Reports read those documents for the requested
+hours only, so they cost the same whether the orders collection holds a
+hundred orders or ten million. The same pass adds each item's prep time samples
+to the running sums in prep_stats (see ready_times).
+
+Each order is counted at most once: whoever rolls it up first claims it by
+setting ``rolled_up`` on the order (the status routes with True, the backfill
+with a batch token).
+"""
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from bson.objectid import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+
+from ordering_core import ready_times
+from ordering_core.pricing import to_cents
+
+COLLECTION = 'analytics_rollups'
+# Upper bounds of the prep time histogram, in minutes; slower orders count as 'over'
+PREP_BUCKETS = [5, 10, 15, 20, 30, 45, 60]
+MAX_RANGE_DAYS = 92
+
+
+class AnalyticsError(ValueError):
+    pass
+
+
+def hour_of(value):
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def _prep_bucket(minutes):
+    for bound in PREP_BUCKETS:
+        if minutes <= bound:
+            return str(bound)
+    return 'over'
+
+
+class Rollup:
+    """Increments for a set of orders, merged per rollup document before writing"""
+
+    def __init__(self):
+        self._set = {}
+        self._inc = defaultdict(lambda: defaultdict(int))
+        self._max = defaultdict(dict)
+        self._prep = defaultdict(lambda: defaultdict(int))
+
+    def _bump(self, doc_id, fields, **amounts):
+        self._set[doc_id] = fields
+        for name, amount in amounts.items():
+            self._inc[doc_id][name] += amount
+
+    def add(self, order):
+        hour = hour_of(order['order_time'])
+        stamp = hour.strftime('%Y-%m-%dT%H')
+        lines = order.get('items') or []
+        revenue = order.get('total_cents')
+        if revenue is None:
+            revenue = to_cents(order.get('total_price', 0))
+        hour_id = f'hour:{stamp}'
+        self._bump(hour_id, {'kind': 'hour', 'hour': hour}, orders=1, revenue_cents=revenue,
+                   items=sum(line.get('quantity', 0) for line in lines))
+
+        if order.get('completed_time'):
+            prep = max(0.0, (order['completed_time'] - order['order_time']).total_seconds())
+            self._bump(hour_id, {'kind': 'hour', 'hour': hour}, prep_orders=1, prep_seconds=prep,
+                       **{f'prep_histogram.{_prep_bucket(prep / 60)}': 1})
+            self._max[hour_id]['prep_max_seconds'] = max(self._max[hour_id].get('prep_max_seconds', 0), prep)
+
+        seen_items = set()
+        for line in lines:
+            item_id = line['item_id']
+            item_fields = {'kind': 'item', 'hour': hour, 'key': item_id}
+            self._bump(f'item:{stamp}:{item_id}', item_fields, quantity=line['quantity'],
+                       revenue_cents=line['unit_cents'] * line['quantity'],
+                       orders=0 if item_id in seen_items else 1)
+            seen_items.add(item_id)
+            for customization_id in line['customization_ids']:
+                key = f'{item_id}:{customization_id}'
+                fields = {'kind': 'customization', 'hour': hour, 'key': key, 'item_id': item_id,
+                          'customization_id': customization_id}
+                self._bump(f'customization:{stamp}:{key}', fields, quantity=line['quantity'])
+
+        for item_id, samples in ready_times.prep_samples(order).items():
+            self._prep[item_id]['samples'] += len(samples)
+            self._prep[item_id]['seconds'] += sum(samples)
+
+    def operations(self):
+        operations = []
+        for doc_id, fields in self._set.items():
+            update = {'$set': fields, '$inc': dict(self._inc[doc_id])}
+            if self._max.get(doc_id):
+                update['$max'] = self._max[doc_id]
+            operations.append(UpdateOne({'_id': doc_id}, update, upsert=True))
+        return operations
+
+    def writes(self):
+        """(collection, bulk operations) pairs that record the rollup"""
+        writes = []
+        operations = self.operations()
+        if operations:
+            writes.append((COLLECTION, operations))
+        if self._prep:
+            writes.append((ready_times.COLLECTION, [
+                UpdateOne({'_id': item_id}, {'$inc': dict(sums)}, upsert=True)
+                for item_id, sums in self._prep.items()
+            ]))
+        return writes
+
+    def write(self, db):
+        for collection, operations in self.writes():
+            db[collection].bulk_write(operations, ordered=False)
+        return len(self._set)
+
+
+def _claim(order):
+    """Filter and update that mark ``order`` rolled up, or None when it is not a completed order"""
+    if order is None or order.get('status') != 'completed' or not order.get('order_time'):
+        return None
+    return {'_id': order['_id'], 'rolled_up': {'$exists': False}}, {'$set': {'rolled_up': True}}
+
+
+def record_completion(db, order):
+    """Roll up an order that has just completed, unless it already was"""
+    claim = _claim(order)
+    if claim is None:
+        return False
+    try:
+        if not db.orders.update_one(*claim).modified_count:
+            return False
+        rollup = Rollup()
+        rollup.add(order)
+        rollup.write(db)
+        return True
+    except PyMongoError as e:
+        # The order stays claimed; `python backfill_analytics.py --rebuild` recounts everything
+        print(f"Analytics rollup failed for order {order.get('order_number')}: {e}")
+        return False
+
+
+async def record_completion_async(db, order):
+    """``record_completion`` for coroutines, over a Motor database"""
+    claim = _claim(order)
+    if claim is None:
+        return False
+    try:
+        if not (await db.orders.update_one(*claim)).modified_count:
+            return False
+        rollup = Rollup()
+        rollup.add(order)
+        for collection, operations in rollup.writes():
+            await db[collection].bulk_write(operations, ordered=False)
+        return True
+    except PyMongoError as e:
+        print(f"Analytics rollup failed for order {order.get('order_number')}: {e}")
+        return False
+
+
+# Completed orders live in orders until the archiver moves them (see order_archive)
+ORDER_COLLECTIONS = ['orders', 'orders_archive']
+BACKFILL_FIELDS = ['order_time', 'completed_time', 'status', 'total_cents', 'total_price', 'items', 'tickets']
+
+
+def backfill(db, batch_size=500, progress=None):
+    """Roll up every completed order nobody has rolled up yet, archived ones included; returns the number of orders"""
+    total = 0
+    for collection in ORDER_COLLECTIONS:
+        total = _backfill(db, db[collection], batch_size, progress, total)
+    return total
+
+
+def _backfill(db, orders, batch_size, progress, total):
+    last_id = None
+    while True:
+        # Walk the collection in _id order so each batch is an index range scan
+        query = {'status': 'completed', 'order_time': {'$exists': True}, 'rolled_up': {'$exists': False}}
+        if last_id is not None:
+            query['_id'] = {'$gt': last_id}
+        ids = [o['_id'] for o in orders.find(query, {'_id': 1}).sort('_id', 1).limit(batch_size)]
+        if not ids:
+            return total
+        last_id = ids[-1]
+        token = uuid.uuid4().hex
+        orders.update_many({'_id': {'$in': ids}, 'rolled_up': {'$exists': False}},
+                           {'$set': {'rolled_up': token}})
+        rollup = Rollup()
+        count = 0
+        for order in orders.find({'_id': {'$in': ids}, 'rolled_up': token}, BACKFILL_FIELDS):
+            rollup.add(order)
+            count += 1
+        rollup.write(db)
+        total += count
+        if progress:
+            progress(total)
+
+
+def reset(db):
+    """Drop every rollup and every order's claim, so a backfill recounts from scratch"""
+    db[COLLECTION].delete_many({})
+    db[ready_times.COLLECTION].delete_many({})
+    for collection in ORDER_COLLECTIONS:
+        db[collection].update_many({'rolled_up': {'$exists': True}}, {'$unset': {'rolled_up': ''}})
+
+
+def parse_range(args, parse_time):
+    """(start, end) hours from ``from``/``to`` arguments; the last 24 hours by default"""
+    try:
+        end = parse_time(args['to'], 'to') if args.get('to') else datetime.utcnow()
+        start = parse_time(args['from'], 'from') if args.get('from') else end - timedelta(hours=24)
+    except ValueError as e:
+        raise AnalyticsError(str(e))
+    if start >= end:
+        raise AnalyticsError('from must be before to')
+    if end - start > timedelta(days=MAX_RANGE_DAYS):
+        raise AnalyticsError(f'The range can span at most {MAX_RANGE_DAYS} days')
+    return hour_of(start), end
+
+
+def _minutes(seconds):
+    return round(seconds / 60, 1) if seconds is not None else None
+
+
+def _histogram_percentile(histogram, count, pct):
+    """Upper bound (minutes) of the bucket holding the pct-th percentile"""
+    if not count:
+        return None
+    running = 0
+    for bound in PREP_BUCKETS + ['over']:
+        running += histogram.get(str(bound), 0)
+        if running >= count * pct / 100:
+            return bound if bound != 'over' else None
+    return None
+
+
+def _menu_names(db, item_ids):
+    """item id -> (name, {customization id: name}) for the menu items still in the database"""
+    object_ids = [ObjectId(i) for i in set(item_ids) if ObjectId.is_valid(i)]
+    if not object_ids:
+        return {}
+    return {
+        str(item['_id']): (item['name'], {c.get('id') or c['name']: c['name'] for c in item.get('customizations') or []})
+        for item in db.menu_items.find({'_id': {'$in': object_ids}}, {'name': 1, 'customizations': 1})
+    }
+
+
+def summarize(db, start, end):
+    """Totals, per-hour series, items and customizations for hours in [start, end)"""
+    hours = []
+    items = {}
+    customizations = {}
+    totals = defaultdict(int)
+    histogram = defaultdict(int)
+    prep_max = 0
+    for doc in db[COLLECTION].find({'hour': {'$gte': start, '$lt': end}}).sort('hour', 1):
+        if doc['kind'] == 'hour':
+            for name in ('orders', 'items', 'revenue_cents', 'prep_orders'):
+                totals[name] += doc.get(name, 0)
+            totals['prep_seconds'] += doc.get('prep_seconds', 0)
+            for bound, count in (doc.get('prep_histogram') or {}).items():
+                histogram[bound] += count
+            prep_max = max(prep_max, doc.get('prep_max_seconds', 0))
+            hours.append({
+                'hour': doc['hour'].isoformat(),
+                'orders': doc.get('orders', 0),
+                'items': doc.get('items', 0),
+                'revenue_cents': doc.get('revenue_cents', 0),
+                'average_prep_minutes': (_minutes(doc['prep_seconds'] / doc['prep_orders'])
+                                         if doc.get('prep_orders') else None)
+            })
+        elif doc['kind'] == 'item':
+            item = items.setdefault(doc['key'], {'id': doc['key'], 'quantity': 0, 'orders': 0, 'revenue_cents': 0})
+            for name in ('quantity', 'orders', 'revenue_cents'):
+                item[name] += doc.get(name, 0)
+        elif doc['kind'] == 'customization':
+            entry = customizations.setdefault(doc['key'], {'item_id': doc['item_id'], 'id': doc['customization_id'],
+                                                           'quantity': 0})
+            entry['quantity'] += doc.get('quantity', 0)
+
+    # Rollups hold ids only; names come from the menu (one query, bounded by the menu's size)
+    names = _menu_names(db, list(items) + [c['item_id'] for c in customizations.values()])
+    for item in items.values():
+        item['name'] = names.get(item['id'], ('Removed item', {}))[0]
+    for entry in customizations.values():
+        item_name, customization_names = names.get(entry['item_id'], ('Removed item', {}))
+        entry['item'] = item_name
+        entry['name'] = customization_names.get(entry['id'], entry['id'])
+
+    prep_orders = totals['prep_orders']
+    return {
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'totals': {
+            'orders': totals['orders'],
+            'items': totals['items'],
+            'revenue_cents': totals['revenue_cents'],
+            'average_order_cents': totals['revenue_cents'] // totals['orders'] if totals['orders'] else 0,
+            'prep': {
+                'orders': prep_orders,
+                'average_minutes': _minutes(totals['prep_seconds'] / prep_orders) if prep_orders else None,
+                'max_minutes': _minutes(prep_max) if prep_orders else None,
+                'p50_minutes_at_most': _histogram_percentile(histogram, prep_orders, 50),
+                'p90_minutes_at_most': _histogram_percentile(histogram, prep_orders, 90),
+                'histogram': {str(bound): histogram.get(str(bound), 0) for bound in PREP_BUCKETS + ['over']}
+            }
+        },
+        'hours': hours,
+        'items': sorted(items.values(), key=lambda i: (-i['quantity'], i['name'])),
+        'customizations': sorted(customizations.values(), key=lambda c: (-c['quantity'], c['item'], c['name']))
+    }
@@ -0,0 +1,255 @@
+"""Async serving mode: order placement, status updates and the order feeds as coroutines.
+
+With SERVING_MODE=async gunicorn runs each service's asgi.py on uvicorn workers
+(see gunicorn.conf.py) instead of app.py on threads. A threaded worker holds a
+thread for every open live feed and for every request waiting on MongoDB or on
+a lock, so a container serves as many screens and checkouts at once as it has
+threads. Here an open feed is a queue on the event loop and a request waiting
+on MongoDB (through Motor) is a suspended coroutine, so one process holds
+thousands of screens.
+
+``AsyncService`` answers the routes a service registers on it and passes every
+other request to the service's Flask app on a small thread pool, so the admin
+pages, history, analytics and /metrics stay app.py's own. The coroutines share
+app.py's caches and background threads. The few cache reads that can fall
+through to PyMongo run on a worker thread when the cache is not fresh
+(``from_memory``). Pages, flash messages and redirects are made by Flask itself
+inside a request context (``AsyncService.flask``), so templates, url_for and the
+session cookie behave as they do in the threaded mode.
+"""
+import asyncio
+import io
+import json
+import os
+import re
+import sys
+import time
+import traceback
+from urllib.parse import parse_qsl
+
+from a2wsgi import WSGIMiddleware
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import uri_parser
+from werkzeug.exceptions import BadRequest, HTTPException, InternalServerError
+
+from ordering_core import metrics
+from ordering_core.serialization import dumps, negotiate
+from ordering_core.serving import async_mongo_client_options
+
+
+def motor_database(uri):
+    """The Motor database named in ``uri``, with the async pool settings and the metrics listener"""
+    client = AsyncIOMotorClient(uri, event_listeners=[metrics.mongo_listener], **async_mongo_client_options())
+    return client[uri_parser.parse_uri(uri)['database']]
+
+
+async def from_memory(fresh, call, *args):
+    """``call(*args)`` on the loop when ``fresh`` says it is answered from memory, else on a worker thread"""
+    if fresh:
+        return call(*args)
+    return await asyncio.to_thread(call, *args)
+
+
+class Request:
+    def __init__(self, scope, receive, params):
+        self.scope = scope
+        self.method = scope['method']
+        self.path = scope['path']
+        self.params = params
+        self.args = dict(parse_qsl(scope['query_string'].decode('latin-1'), keep_blank_values=True))
+        self.headers = {name.decode('latin-1'): value.decode('latin-1') for name, value in scope['headers']}
+        self._receive = receive
+        self._body = None
+
+    async def body(self):
+        if self._body is None:
+            chunks = []
+            while True:
+                message = await self._receive()
+                chunks.append(message.get('body', b''))
+                if not message.get('more_body'):
+                    break
+            self._body = b''.join(chunks)
+        return self._body
+
+    async def form(self):
+        """URL-encoded form fields, the first value of each"""
+        return dict(parse_qsl((await self.body()).decode('utf-8'), keep_blank_values=True))
+
+    async def json(self):
+        """The body as JSON whatever its content type, like Flask's get_json(force=True)"""
+        try:
+            return json.loads(await self.body())
+        except ValueError:
+            raise BadRequest('Failed to decode JSON object')
+
+    async def disconnected(self):
+        """Returns once the client has gone away"""
+        while (await self._receive())['type'] != 'http.disconnect':
+            pass
+
+    def environ(self):
+        """A WSGI environ for this request, without its body"""
+        server = self.scope.get('server') or ('localhost', 80)
+        environ = {
+            'REQUEST_METHOD': self.method,
+            'SCRIPT_NAME': self.scope.get('root_path', ''),
+            'PATH_INFO': self.path,
+            'QUERY_STRING': self.scope['query_string'].decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': f"HTTP/{self.scope.get('http_version', '1.1')}",
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': self.scope.get('scheme', 'http'),
+            'wsgi.input': io.BytesIO(),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False
+        }
+        for name, value in self.headers.items():
+            key = name.upper().replace('-', '_')
+            environ[key if key in ('CONTENT_TYPE', 'CONTENT_LENGTH') else f'HTTP_{key}'] = value
+        return environ
+
+
+class Response:
+    """A complete body (bytes or str), or an async iterator of str chunks streamed until the client leaves.
+
+    Complete bodies are compressed as the client accepts (see serialization.negotiate).
+    """
+
+    def __init__(self, body=b'', status=200, headers=(), content_type='text/html; charset=utf-8'):
+        self.body = body
+        self.status = status
+        self.headers = list(headers)
+        if content_type and not any(name.lower() == 'content-type' for name, _ in self.headers):
+            self.headers.append(('Content-Type', content_type))
+
+    async def send(self, request, send):
+        if isinstance(self.body, (bytes, str)):
+            body = self.body.encode() if isinstance(self.body, str) else self.body
+            content_type = next((value for name, value in self.headers if name.lower() == 'content-type'), None)
+            body, extra = negotiate(request.headers.get('accept-encoding'), self.status, content_type, body,
+                                    self.headers)
+            # Vary adds to any Vary already set; the other headers negotiate returns replace ours
+            replaced = {name.lower() for name, _ in extra if name != 'Vary'} | {'content-length'}
+            headers = [header for header in self.headers if header[0].lower() not in replaced] + extra
+            headers.append(('Content-Length', len(body)))
+            await send({'type': 'http.response.start', 'status': self.status, 'headers': self._encode(headers)})
+            await send({'type': 'http.response.body', 'body': body})
+            return
+        await send({'type': 'http.response.start', 'status': self.status, 'headers': self._encode(self.headers)})
+        await self._stream(request, send)
+
+    @staticmethod
+    def _encode(headers):
+        return [(name.lower().encode('latin-1'), str(value).encode('latin-1')) for name, value in headers]
+
+    async def _stream(self, request, send):
+        async def pump():
+            async for chunk in self.body:
+                await send({'type': 'http.response.body', 'body': chunk.encode(), 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+
+        # Cancelling the pump closes the stream's generator, which unsubscribes it
+        tasks = [asyncio.ensure_future(pump()), asyncio.ensure_future(request.disconnected())]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+class AsyncService:
+    """ASGI app: the routes registered with ``route`` as coroutines, everything else through ``flask_app``.
+
+    Handlers are ``async def handler(request, **path_params)`` returning a
+    Response. Flask's routes run on ``threads`` worker threads (default
+    GUNICORN_THREADS).
+    """
+
+    def __init__(self, flask_app, service, threads=None):
+        self.flask_app = flask_app
+        self.service = service
+        self.routes = []
+        self.wsgi = WSGIMiddleware(flask_app, workers=threads or int(os.getenv('GUNICORN_THREADS', '8')))
+
+    def route(self, rule, methods=('GET',)):
+        """Register a coroutine for ``rule`` (Flask syntax, ``<name>`` for a path segment)"""
+        pattern = re.compile('^' + re.sub(r'<(\w+)>', r'(?P<\1>[^/]+)', rule) + '$')
+
+        def register(handler):
+            self.routes.append((pattern, set(methods), rule, handler))
+            return handler
+        return register
+
+    def _match(self, method, path):
+        for pattern, methods, rule, handler in self.routes:
+            match = pattern.match(path) if method in methods else None
+            if match:
+                return rule, handler, match.groupdict()
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        matched = self._match(scope['method'], scope['path']) if scope['type'] == 'http' else None
+        if matched is None:
+            await self.wsgi(scope, receive, send)
+            return
+        rule, handler, params = matched
+        request = Request(scope, receive, params)
+        start = time.perf_counter()
+        try:
+            response = await handler(request, **params)
+        except HTTPException as e:
+            response = Response(e.get_body(), e.code)
+        except Exception:
+            traceback.print_exc()
+            response = Response(InternalServerError().get_body(), 500)
+        metrics.observe_request(self.service, rule, request.method, response.status, time.perf_counter() - start)
+        await response.send(request, send)
+
+    @staticmethod
+    async def _lifespan(receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    @staticmethod
+    def _dumps(data):
+        return dumps(data) + b'\n'
+
+    def json(self, data, status=200, headers=()):
+        """Like Flask's jsonify, with the same encoder (serialization.py)"""
+        return Response(self._dumps(data), status, headers, content_type='application/json')
+
+    def conditional(self, request, data, etag):
+        """JSON ``data`` with a strong ETag and Cache-Control: no-cache; 304 when the client has it already"""
+        headers = [('ETag', f'"{etag}"'), ('Cache-Control', 'no-cache')]
+        if_none_match = request.headers.get('if-none-match', '')
+        if if_none_match == '*' or f'"{etag}"' in [tag.strip() for tag in if_none_match.split(',')]:
+            return Response(b'', 304, headers, content_type=None)
+        return Response(self._dumps(data), 200, headers, content_type='application/json')
+
+    def event_stream(self, frames):
+        """Server-Sent Events response streaming ``frames`` (an async iterator of str)"""
+        return Response(frames, headers=[('Cache-Control', 'no-cache'), ('X-Accel-Buffering', 'no')],
+                        content_type='text/event-stream; charset=utf-8')
+
+    def flask(self, request, view):
+        """Response of ``view()`` run in a Flask request context, so render_template, url_for and flash work"""
+        app = self.flask_app
+        context = app.request_context(request.environ())
+        with context:
+            response = app.make_response(view())
+            if not app.session_interface.is_null_session(context.session):
+                app.session_interface.save_session(app, context.session, response)
+        return Response(response.get_data(), response.status_code, response.headers.items(), content_type=None)
@@ -0,0 +1,47 @@
+"""Environment configuration and the bootstrap every service and script starts with.
+
+Importing this module loads .env. ``create_app`` builds a service's Flask app
+and its pooled PyMongo client; ``database`` connects the command-line scripts.
+Flask and flask_pymongo are imported inside ``create_app`` so the seed
+container, which installs only pymongo and python-dotenv, can use the rest.
+"""
+import os
+
+from dotenv import load_dotenv
+
+DEFAULT_MONGO_URI = 'mongodb://localhost:27017/ordering_system'
+
+load_dotenv()
+
+
+def mongo_uri():
+    return os.environ.get('MONGO_URI', DEFAULT_MONGO_URI)
+
+
+def database():
+    """The database named in MONGO_URI, for the scripts run outside the services"""
+    from pymongo import MongoClient
+    return MongoClient(mongo_uri()).get_database()
+
+
+def create_app(import_name, service):
+    """Flask app and PyMongo for ``service``: pooled client, metrics listener and /metrics, fast JSON
+
+    Compiled templates are cached in TEMPLATE_CACHE_DIR (default: a per-user
+    directory under the system temp dir), shared by the workers of a container.
+    """
+    from flask import Flask
+    from flask_pymongo import PyMongo
+    from jinja2 import FileSystemBytecodeCache
+
+    from ordering_core import metrics, serialization
+    from ordering_core.serving import mongo_client_options
+
+    app = Flask(import_name, template_folder='templates', static_folder='static')
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(os.getenv('TEMPLATE_CACHE_DIR') or None)
+    app.config['MONGO_URI'] = mongo_uri()
+    app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key-here')
+    mongo = PyMongo(app, event_listeners=[metrics.mongo_listener], **mongo_client_options())
+    metrics.init_app(app, service)
+    serialization.init_app(app)
+    return app, mongo
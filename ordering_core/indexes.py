@@ -0,0 +1,126 @@
+"""Index definitions for the orders, orders_archive and menu_items collections.
+
+``ensure_indexes`` is idempotent: create_index is a no-op when an index with the
+same name and keys already exists, and indexes listed in SUPERSEDED (replaced by
+a wider index under a new name) are dropped. ``collscan_queries`` explains the
+query each route runs and reports any that MongoDB would answer with a
+collection scan.
+"""
+from datetime import datetime
+
+from bson.objectid import ObjectId
+from pymongo import ASCENDING, DESCENDING
+
+from ordering_core.active_orders import active_orders_query
+from ordering_core.order_history import HistoryQuery, encode_cursor
+
+INDEXES = {
+    'orders': [
+        # Guarantees no two orders share a number; insert_order retries on a clash
+        ([('order_number', ASCENDING)], {'name': 'order_number_unique', 'unique': True}),
+        # Retried bulk submissions (POST /api/orders) are rejected by the insert itself
+        ([('idempotency_key', ASCENDING)], {'name': 'idempotency_key_unique', 'unique': True,
+                                            'partialFilterExpression': {'idempotency_key': {'$exists': True}}}),
+        # Active-order queries (status $in [pending, in_progress] by order_time) and history by order_time;
+        # _id breaks ties so history pages can resume from a (time, _id) cursor
+        ([('status', ASCENDING), ('order_time', ASCENDING), ('_id', ASCENDING)], {'name': 'status_order_time_id'}),
+        # Recently completed window and order history (newest completed first)
+        ([('status', ASCENDING), ('completed_time', DESCENDING), ('_id', DESCENDING)],
+         {'name': 'status_completed_time_id'}),
+    ],
+    'orders_archive': [
+        # History pages over archived orders, by completed_time or order_time (same shapes as orders)
+        ([('status', ASCENDING), ('completed_time', DESCENDING), ('_id', DESCENDING)],
+         {'name': 'status_completed_time_id'}),
+        ([('status', ASCENDING), ('order_time', ASCENDING), ('_id', ASCENDING)], {'name': 'status_order_time_id'}),
+        # Not unique: legacy random order numbers may repeat once the orders they clashed with are archived
+        ([('order_number', ASCENDING)], {'name': 'order_number'}),
+    ],
+    'sms_outbox': [
+        # Workers claim due messages oldest first
+        ([('status', ASCENDING), ('next_attempt', ASCENDING)], {'name': 'status_next_attempt'}),
+        ([('claim', ASCENDING)], {'name': 'claim'}),
+        # The order journal checks which flushed orders already have their SMS queued
+        ([('order_id', ASCENDING), ('kind', ASCENDING)], {'name': 'order_id_kind'}),
+    ],
+    'analytics_rollups': [
+        # Reports read every rollup document for a range of hours
+        ([('hour', ASCENDING)], {'name': 'hour'}),
+    ],
+    'menu_items': [
+        # Customer menu: active items by category
+        ([('active', ASCENDING), ('category', ASCENDING), ('name', ASCENDING)], {'name': 'active_category_name'}),
+        # Admin menu: every item by category, then name
+        ([('category', ASCENDING), ('name', ASCENDING)], {'name': 'category_name'}),
+        # Imports and the seed script upsert items by name
+        ([('name', ASCENDING)], {'name': 'name_unique', 'unique': True}),
+    ],
+}
+
+# Older indexes that are a prefix of one above
+SUPERSEDED = {
+    'orders': ['status_order_time', 'status_completed_time'],
+}
+
+
+def ensure_indexes(db):
+    """Create every index in INDEXES; returns the names per collection"""
+    created = {}
+    for collection, indexes in INDEXES.items():
+        created[collection] = [db[collection].create_index(keys, **options) for keys, options in indexes]
+    for collection, names in SUPERSEDED.items():
+        existing = db[collection].index_information()
+        for name in names:
+            if name in existing:
+                db[collection].drop_index(name)
+    return created
+
+
+def route_queries(db):
+    """The queries the services run, keyed by the route that runs them"""
+    return {
+        'order lookup by number': db.orders.find({'order_number': 'ABC123'}),
+        'customer POST /api/orders (duplicate lookup)': db.orders.find({'idempotency_key': {'$in': ['kiosk-1:42']}}),
+        'customer index, /api/menu_items': db.menu_items.find({'active': True}).sort('category', 1),
+        'customer /orders, employee /orders, /worker': (
+            db.orders.find(active_orders_query(0)).sort('order_time', 1)),
+        'employee /api/orders': db.orders.find(active_orders_query(10)).sort('order_time', 1),
+        'display /api/display/orders': db.orders.find(active_orders_query(5)).sort('order_time', 1),
+        'employee /api/orders/history': HistoryQuery({}).cursor(db.orders),
+        'employee /api/orders/history (next page)': HistoryQuery({'cursor': _sample_cursor()}).cursor(db.orders),
+        'employee /api/orders/history by order_time': (
+            HistoryQuery({'status': 'pending,in_progress,completed', 'sort': 'order_time'}).cursor(db.orders)),
+        'employee /api/orders/history (archive)': HistoryQuery({}).cursor(db.orders_archive),
+        'employee order archiver': (
+            db.orders.find({'status': 'completed', 'completed_time': {'$lt': datetime(2024, 1, 1)}})
+            .sort('completed_time', 1).limit(500)),
+        'employee /admin/menu': db.menu_items.find().sort([('category', 1), ('name', 1)]),
+        'employee /admin/menu/import': db.menu_items.find({'name': {'$in': ['Classic Burger']}}),
+        'employee /api/analytics': db.analytics_rollups.find(
+            {'hour': {'$gte': datetime(2024, 1, 1), '$lt': datetime(2024, 1, 2)}}).sort('hour', 1),
+    }
+
+
+def _sample_cursor():
+    return encode_cursor('completed_time', 'desc', {'completed_time': datetime.utcnow(), '_id': ObjectId()})
+
+
+def _stages(plan):
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            yield plan['stage']
+        for value in plan.values():
+            yield from _stages(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            yield from _stages(value)
+
+
+def collscan_queries(db):
+    """Names of the route queries whose winning plan contains a COLLSCAN"""
+    failing = []
+    for name, cursor in route_queries(db).items():
+        plan = cursor.explain()['queryPlanner']['winningPlan']
+        if 'COLLSCAN' in set(_stages(plan)):
+            failing.append(name)
+    return failing
@@ -0,0 +1,62 @@
+"""The canonical order line schema and the display text derived from it.
+
+An order stores its lines once, compactly::
+
+    'items': [{'item_id': '65f...', 'quantity': 2, 'customization_ids': ['c2'], 'unit_cents': 1499}]
+
+plus ``item_lines``, the human-readable text for each line (``"2x Classic
+Burger (Bacon) - $29.98"``), rendered once when the order is placed so no client
+has to split or format anything. Customization ids are short and unique within
+their menu item (``c1``, ``c2``, ...); they are assigned when an item is saved
+and never reused, so renaming or removing a customization does not change what
+old orders point at.
+"""
+from ordering_core.pricing import line_text, to_cents
+
+
+def assign_customization_ids(customizations, sequence=0):
+    """Give every customization without an ``id`` a new ``cN``; returns the item's new sequence.
+
+    ``sequence`` is the item's ``customization_seq``, the highest number it
+    has handed out, so ids of deleted customizations are never handed out again.
+    """
+    for customization in customizations:
+        customization_id = customization.get('id') or ''
+        if customization_id[1:].isdigit():
+            sequence = max(sequence, int(customization_id[1:]))
+    for customization in customizations:
+        if not customization.get('id'):
+            sequence += 1
+            customization['id'] = f'c{sequence}'
+    return sequence
+
+
+def migrate_order(order, customization_ids):
+    """``$set``/``$unset`` converting an order stored before ``items`` existed.
+
+    ``customization_ids`` maps item id -> {customization name: id} for the
+    current menu; customizations no longer on the menu keep their name as id.
+    Orders without ``order_items_detailed`` keep their text lines only.
+    """
+    detailed = order.get('order_items_detailed') or []
+    items = []
+    item_lines = []
+    for line in detailed:
+        ids = customization_ids.get(str(line['id']), {})
+        unit_cents = line.get('unit_cents')
+        if unit_cents is None:
+            unit_cents = to_cents(line.get('price', 0))
+        items.append({
+            'item_id': str(line['id']),
+            'quantity': line['quantity'],
+            'customization_ids': [ids.get(name, name) for name in line.get('customizations') or []],
+            'unit_cents': unit_cents
+        })
+        item_lines.append(line_text(line['name'], line['quantity'], line.get('customizations'),
+                                    line.get('line_cents', unit_cents * line['quantity'])))
+    if not detailed and order.get('order_items'):
+        item_lines = order['order_items'].split('; ')
+    return {
+        '$set': {'items': items, 'item_lines': item_lines},
+        '$unset': {'order_items': '', 'order_items_detailed': ''}
+    }
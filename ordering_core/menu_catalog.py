@@ -0,0 +1,124 @@
+"""Cached menu catalog, invalidated through a version counter.
+
+The admin routes bump ``counters.menu_version`` on every change. Each customer
+process checks that counter at most once per ``check_interval`` and only then
+reloads the active menu, so page loads and /api/menu_items cost no database
+queries between menu edits. For each version the catalog keeps the serialized
+JSON, a strong ETag, the price index used to price orders, the router that
+splits orders into kitchen station tickets, and any pages prerendered from it.
+
+With a shared state the version and the items of each version are cached there,
+so across all processes MongoDB sees one version check per interval and one
+menu load per change.
+"""
+import hashlib
+import json
+import threading
+import time
+
+from pymongo import ReturnDocument
+
+from ordering_core.pricing import PriceIndex
+from ordering_core.stations import TicketRouter
+
+MENU_VERSION_ID = 'menu_version'
+# Menus of past versions are only read by processes catching up, so they need not stay long
+ITEMS_TTL_SECONDS = 600
+
+
+def bump_menu_version(db):
+    """Record that the menu changed; returns the new version"""
+    counter = db.counters.find_one_and_update(
+        {'_id': MENU_VERSION_ID},
+        {'$inc': {'value': 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return counter['value']
+
+
+class MenuSnapshot:
+    def __init__(self, version, items, dumps):
+        self.version = version
+        self.items = items
+        self.json = dumps(items).encode()
+        self.etag = f"{version}-{hashlib.sha1(self.json).hexdigest()[:16]}"
+        self.pages = {}
+        self._price_index = None
+        self._ticket_router = None
+
+    @property
+    def price_index(self):
+        if self._price_index is None:
+            self._price_index = PriceIndex(self.items)
+        return self._price_index
+
+    @property
+    def ticket_router(self):
+        if self._ticket_router is None:
+            self._ticket_router = TicketRouter(self.items)
+        return self._ticket_router
+
+
+class MenuCatalog:
+    def __init__(self, menu_items, counters, check_interval=5.0, dumps=None, shared=None):
+        self.menu_items = menu_items
+        self.counters = counters
+        self.check_interval = check_interval
+        self.shared = shared
+        self.dumps = dumps or (lambda items: json.dumps(items, default=str))
+        self.reloads = 0
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _read_version(self):
+        counter = self.counters.find_one({'_id': MENU_VERSION_ID})
+        return {'value': counter['value'] if counter else 0}
+
+    def _read_items(self):
+        items = list(self.menu_items.find({'active': True}).sort('category', 1))
+        for item in items:
+            item['_id'] = str(item['_id'])
+        self.reloads += 1
+        return {'items': items}
+
+    def _version(self):
+        if self.shared is None:
+            return self._read_version()['value']
+        return self.shared.cached('menu:version', self.check_interval, self._read_version)['value']
+
+    def _load(self, version):
+        if self.shared is None:
+            items = self._read_items()['items']
+        else:
+            items = self.shared.cached(f'menu:items:{version}', ITEMS_TTL_SECONDS, self._read_items)['items']
+        return MenuSnapshot(version, items, self.dumps)
+
+    @property
+    def fresh(self):
+        """True while ``current`` answers from memory without checking the version"""
+        return self._snapshot is not None and time.monotonic() - self._checked_at < self.check_interval
+
+    def current(self):
+        """The active menu, reloaded only when the version counter has moved"""
+        now = time.monotonic()
+        snapshot = self._snapshot
+        if snapshot is not None and now - self._checked_at < self.check_interval:
+            return snapshot
+        with self._lock:
+            if self._snapshot is not None and now - self._checked_at < self.check_interval:
+                return self._snapshot
+            version = self._version()
+            if self._snapshot is None or self._snapshot.version != version:
+                self._snapshot = self._load(version)
+            self._checked_at = now
+            return self._snapshot
+
+    def page(self, name, render):
+        """``render(items)`` once per menu version; later calls reuse the body"""
+        snapshot = self.current()
+        body = snapshot.pages.get(name)
+        if body is None:
+            body = snapshot.pages[name] = render(snapshot.items)
+        return snapshot, body
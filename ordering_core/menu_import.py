@@ -0,0 +1,293 @@
+"""Whole-catalog menu import and export, and batched admin changes.
+
+The catalog moves in and out as CSV or JSON with one row per item (CSV rows
+carry customizations as a JSON list). Imported items are matched to the menu
+by name: ``plan_import`` compares the file with the stored items and returns
+the diff the admin previews, and ``ImportPlan.apply`` writes it in a single
+``bulk_write`` of upserts keyed by name, so applying the same file twice changes
+nothing the second time. Customizations keep their ids when their name is
+unchanged, and new ones get ids the item has never used, so existing orders
+still resolve.
+
+``batch_update`` applies one admin action (activate, deactivate, price change,
+delete) to many items with one ``bulk_write``.
+"""
+import csv
+import io
+import json
+import math
+from datetime import datetime
+
+from bson.errors import InvalidId
+from bson.objectid import ObjectId
+from pymongo import DeleteOne, UpdateOne
+
+from ordering_core.line_items import assign_customization_ids
+from ordering_core.menu_catalog import bump_menu_version
+
+FIELDS = ['name', 'category', 'description', 'base_price', 'image_url', 'active', 'customizations']
+CATEGORIES = ['appetizer', 'main', 'side', 'drink', 'dessert']
+BATCH_ACTIONS = ['activate', 'deactivate', 'set_price', 'adjust_price', 'delete']
+_TRUE = {'1', 'true', 'yes', 'y', 'active'}
+_FALSE = {'0', 'false', 'no', 'n', 'inactive', ''}
+
+
+class MenuImportError(ValueError):
+    pass
+
+
+def export_items(items):
+    """Menu items as plain dicts with the exported fields, in a stable order"""
+    return [{
+        'name': item['name'],
+        'category': item.get('category', ''),
+        'description': item.get('description', ''),
+        'base_price': item.get('base_price', 0),
+        'image_url': item.get('image_url', ''),
+        'active': item.get('active', True),
+        'customizations': [{'id': c.get('id'), 'name': c['name'], 'price': c.get('price', 0)}
+                           for c in item.get('customizations') or []]
+    } for item in sorted(items, key=lambda item: (item.get('category', ''), item['name']))]
+
+
+def to_json(items):
+    return json.dumps(export_items(items), indent=2)
+
+
+def to_csv(items):
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=FIELDS)
+    writer.writeheader()
+    for item in export_items(items):
+        item['active'] = 'true' if item['active'] else 'false'
+        item['customizations'] = json.dumps(item['customizations']) if item['customizations'] else ''
+        writer.writerow(item)
+    return out.getvalue()
+
+
+def _row(row):
+    """Error message prefix; None for a single item from the admin form"""
+    return f'Row {row}: ' if row is not None else ''
+
+
+def _price(value, row, field):
+    try:
+        price = round(float(value), 2)
+    except (TypeError, ValueError):
+        raise MenuImportError(f'{_row(row)}{field} must be a number')
+    if not math.isfinite(price):
+        raise MenuImportError(f'{_row(row)}{field} must be a finite number')
+    if price < 0:
+        raise MenuImportError(f'{_row(row)}{field} cannot be negative')
+    return price
+
+
+def _active(value, row):
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in _TRUE:
+        return True
+    if text in _FALSE:
+        return False
+    raise MenuImportError(f'Row {row}: active must be true or false')
+
+
+def _customizations(value, row):
+    if isinstance(value, str):
+        try:
+            value = json.loads(value) if value.strip() else []
+        except ValueError:
+            raise MenuImportError(f'{_row(row)}customizations must be a JSON list')
+    if not isinstance(value, list):
+        raise MenuImportError(f'{_row(row)}customizations must be a list')
+    customizations = []
+    for customization in value:
+        if not isinstance(customization, dict) or not str(customization.get('name') or '').strip():
+            raise MenuImportError(f'{_row(row)}every customization needs a name')
+        entry = {'name': str(customization['name']).strip(),
+                 'price': _price(customization.get('price', 0), row, 'customization price')}
+        if customization.get('id'):
+            entry['id'] = str(customization['id'])
+        customizations.append(entry)
+    names = [c['name'] for c in customizations]
+    if len(set(names)) != len(names):
+        raise MenuImportError(f'{_row(row)}customization names must be unique')
+    return customizations
+
+
+def form_prices(form):
+    """``(base_price, customizations)`` from the admin add/edit item form, validated as import rows are"""
+    return (_price(form.get('base_price', 0), None, 'base_price'),
+            _customizations(form.get('customizations') or '[]', None))
+
+
+def normalize(raw, row):
+    """A validated item from one imported row"""
+    if not isinstance(raw, dict):
+        raise MenuImportError(f'Row {row}: expected an object')
+    name = str(raw.get('name') or '').strip()
+    if not name:
+        raise MenuImportError(f'Row {row}: name is required')
+    category = str(raw.get('category') or '').strip().lower()
+    if category not in CATEGORIES:
+        raise MenuImportError(f"Row {row}: category must be one of {', '.join(CATEGORIES)}")
+    return {
+        'name': name,
+        'category': category,
+        'description': str(raw.get('description') or '').strip(),
+        'base_price': _price(raw.get('base_price'), row, 'base_price'),
+        'image_url': str(raw.get('image_url') or '').strip(),
+        'active': _active(raw.get('active', True), row),
+        'customizations': _customizations(raw.get('customizations') or [], row)
+    }
+
+
+def read_import(text, fmt):
+    """Validated items from CSV or JSON text; item names must be unique"""
+    if fmt == 'json':
+        try:
+            rows = json.loads(text)
+        except ValueError as e:
+            raise MenuImportError(f'Invalid JSON: {e}')
+        if isinstance(rows, dict):
+            rows = rows.get('items')
+        if not isinstance(rows, list):
+            raise MenuImportError('Expected a JSON list of items')
+        first_row = 1
+    elif fmt == 'csv':
+        rows = list(csv.DictReader(io.StringIO(text)))
+        first_row = 2  # after the header
+    else:
+        raise MenuImportError(f'Unknown format: {fmt}')
+    items = [normalize(raw, row) for row, raw in enumerate(rows, start=first_row)]
+    seen = set()
+    for item in items:
+        if item['name'].lower() in seen:
+            raise MenuImportError(f"{item['name']} appears more than once")
+        seen.add(item['name'].lower())
+    return items
+
+
+def _resolve_customizations(item, current):
+    """Give imported customizations their existing ids (matched by name) or new ones; returns the sequence"""
+    known = {c['name']: c.get('id') for c in (current or {}).get('customizations') or []}
+    for customization in item['customizations']:
+        if 'id' not in customization and known.get(customization['name']):
+            customization['id'] = known[customization['name']]
+    return assign_customization_ids(item['customizations'], (current or {}).get('customization_seq', 0))
+
+
+class ImportPlan:
+    """What importing a file would change; ``summary`` is the preview, ``apply`` writes it"""
+
+    def __init__(self):
+        self.create = []
+        self.update = []
+        self.unchanged = []
+        self.deactivate = []
+
+    @property
+    def changed(self):
+        return bool(self.create or self.update or self.deactivate)
+
+    def summary(self):
+        return {
+            'create': [item['name'] for item in self.create],
+            'update': [{'name': name, 'changes': changes} for name, _, changes in self.update],
+            'unchanged': self.unchanged,
+            'deactivate': [name for name, _ in self.deactivate]
+        }
+
+    def operations(self):
+        now = datetime.utcnow()
+        operations = [
+            UpdateOne({'name': item['name']}, {'$setOnInsert': {**item, 'created_at': now}}, upsert=True)
+            for item in self.create
+        ]
+        for name, fields, _ in self.update:
+            operations.append(UpdateOne({'name': name}, {'$set': {**fields, 'updated_at': now}}))
+        for name, item_id in self.deactivate:
+            operations.append(UpdateOne({'_id': item_id}, {'$set': {'active': False, 'updated_at': now}}))
+        return operations
+
+    def apply(self, db):
+        """Write the plan with one bulk_write; returns the number of items written"""
+        operations = self.operations()
+        if not operations:
+            return 0
+        result = db.menu_items.bulk_write(operations, ordered=False)
+        bump_menu_version(db)
+        return result.upserted_count + result.modified_count
+
+
+def plan_import(menu_items, items, deactivate_missing=False, update_existing=True):
+    """Compare imported items with the stored menu, by name.
+
+    With ``update_existing`` false, items already on the menu are left as they
+    are and only missing ones are created (how the seed script runs).
+    """
+    names = [item['name'] for item in items]
+    current = {doc['name']: doc for doc in menu_items.find({'name': {'$in': names}})}
+    plan = ImportPlan()
+    for item in items:
+        stored = current.get(item['name'])
+        item['customization_seq'] = _resolve_customizations(item, stored)
+        if stored is None:
+            plan.create.append(item)
+            continue
+        if not update_existing:
+            plan.unchanged.append(item['name'])
+            continue
+        fields = {field: value for field, value in item.items() if stored.get(field) != value}
+        # The sequence only moves when customizations do; it is not a change worth showing on its own
+        if set(fields) <= {'customization_seq'}:
+            plan.unchanged.append(item['name'])
+            continue
+        changes = {field: [stored.get(field), value] for field, value in fields.items()
+                   if field != 'customization_seq'}
+        plan.update.append((item['name'], fields, changes))
+    if deactivate_missing:
+        missing = {'active': True, 'name': {'$nin': names}}
+        plan.deactivate = [(doc['name'], doc['_id']) for doc in menu_items.find(missing, {'name': 1})]
+    return plan
+
+
+def batch_update(db, item_ids, action, value=None):
+    """Apply one admin action to many menu items with a single bulk_write; returns the items changed"""
+    if action not in BATCH_ACTIONS:
+        raise MenuImportError(f'Unknown action: {action}')
+    try:
+        ids = [ObjectId(item_id) for item_id in item_ids]
+    except (InvalidId, TypeError):
+        raise MenuImportError('Invalid menu item id')
+    if not ids:
+        raise MenuImportError('Select at least one menu item')
+    now = datetime.utcnow()
+    if action in ('activate', 'deactivate'):
+        operations = [UpdateOne({'_id': item_id}, {'$set': {'active': action == 'activate', 'updated_at': now}})
+                      for item_id in ids]
+    elif action == 'set_price':
+        price = _price(value, None, 'price')
+        operations = [UpdateOne({'_id': item_id}, {'$set': {'base_price': price, 'updated_at': now}})
+                      for item_id in ids]
+    elif action == 'adjust_price':
+        try:
+            percent = float(value)
+        except (TypeError, ValueError):
+            raise MenuImportError('Price adjustment must be a percentage')
+        if not math.isfinite(percent):
+            raise MenuImportError('Price adjustment must be a finite percentage')
+        prices = {item['_id']: max(0.0, round(item.get('base_price', 0) * (1 + percent / 100), 2))
+                  for item in db.menu_items.find({'_id': {'$in': ids}}, {'base_price': 1})}
+        if not all(math.isfinite(price) for price in prices.values()):
+            raise MenuImportError('Price adjustment is out of range')
+        operations = [UpdateOne({'_id': item_id}, {'$set': {'base_price': price, 'updated_at': now}})
+                      for item_id, price in prices.items()]
+    else:
+        operations = [DeleteOne({'_id': item_id}) for item_id in ids]
+    if not operations:
+        return 0
+    result = db.menu_items.bulk_write(operations, ordered=False)
+    bump_menu_version(db)
+    return result.modified_count + result.deleted_count
@@ -0,0 +1,181 @@
+"""Per-route latency, MongoDB command and SMS timing, exposed at /metrics.
+
+``init_app`` times every request by its URL rule and adds a Prometheus-style
+``/metrics`` endpoint; ``mongo_listener`` is a pymongo command listener (pass
+it to PyMongo as ``event_listeners``) that times every command and remembers
+the query shapes a request issued, so requests slower than SLOW_REQUEST_MS are
+logged together with the queries behind them. Recording is a bisect and a few
+additions under a lock, cheap enough to leave on.
+
+Metrics are per process: with several gunicorn workers each scrape sees the
+worker that answered it, identified by the ``pid`` label.
+"""
+import bisect
+import os
+import threading
+import time
+
+from flask import Response, g, request
+from pymongo import monitoring
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SLOW_REQUEST_MS = float(os.getenv('SLOW_REQUEST_MS', '500'))
+
+_request_local = threading.local()
+
+
+def _format_labels(labels):
+    return ','.join(f'{key}="{value}"' for key, value in labels)
+
+
+class Histogram:
+    def __init__(self, name, help, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, seconds, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += seconds
+            series[2] += 1
+
+    def render(self, extra_labels):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = [(key, list(counts), total, count) for key, (counts, total, count) in self._series.items()]
+        for key, counts, total, count in series:
+            labels = _format_labels(key + extra_labels)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f'{self.name}_sum{{{labels}}} {total}')
+            lines.append(f'{self.name}_count{{{labels}}} {count}')
+        return lines
+
+
+REQUEST_DURATION = Histogram('http_request_duration_seconds', 'Time to handle a request, by route')
+MONGO_DURATION = Histogram('mongo_command_duration_seconds', 'Time spent in MongoDB commands')
+SMS_ENQUEUE_DURATION = Histogram('sms_enqueue_duration_seconds', 'Time to queue an SMS on the request path')
+SMS_SEND_DURATION = Histogram('sms_send_duration_seconds', 'Time for the SMS provider to send one message')
+ARCHIVE_BATCH_DURATION = Histogram('order_archive_batch_duration_seconds',
+                                   'Time to move one batch of orders to orders_archive')
+# The _sum is the number of orders archived, so its rate is the archiver's throughput
+ARCHIVE_BATCH_SIZE = Histogram('order_archive_batch_orders', 'Orders moved to orders_archive per batch',
+                               buckets=(1, 10, 50, 100, 250, 500, 1000))
+JOURNAL_FLUSH_DURATION = Histogram('order_journal_flush_duration_seconds',
+                                   'Time to insert one batch of journaled orders into MongoDB')
+JOURNAL_FLUSH_BATCH_SIZE = Histogram('order_journal_flush_orders', 'Journaled orders inserted per batch',
+                                     buckets=(1, 5, 10, 25, 50, 100, 200, 500))
+HISTOGRAMS = [REQUEST_DURATION, MONGO_DURATION, SMS_ENQUEUE_DURATION, SMS_SEND_DURATION, ARCHIVE_BATCH_DURATION,
+              ARCHIVE_BATCH_SIZE, JOURNAL_FLUSH_DURATION, JOURNAL_FLUSH_BATCH_SIZE]
+
+
+def query_shape(value):
+    """The command's filter with every value replaced by '?' (keys and operators kept)"""
+    if isinstance(value, dict):
+        return {key: query_shape(item) for key, item in value.items()}
+    if isinstance(value, list):
+        if any(isinstance(item, dict) for item in value):
+            return [query_shape(item) for item in value]
+        return ['?']
+    return '?'
+
+
+def _command_filter(command_name, command):
+    if command_name in ('find', 'count', 'distinct'):
+        return command.get('filter') or command.get('query')
+    if command_name in ('update', 'delete'):
+        statements = command.get('updates') or command.get('deletes') or [{}]
+        return statements[0].get('q')
+    if command_name == 'findAndModify':
+        return command.get('query')
+    if command_name == 'aggregate':
+        return command.get('pipeline')
+    return None
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = ''
+        shape = None
+        if getattr(_request_local, 'queries', None) is not None:
+            shape = query_shape(_command_filter(event.command_name, event.command))
+        with self._lock:
+            self._pending[(event.connection_id, event.request_id)] = (collection, shape)
+
+    def _finish(self, event, outcome):
+        with self._lock:
+            collection, shape = self._pending.pop((event.connection_id, event.request_id), ('', None))
+        seconds = event.duration_micros / 1e6
+        MONGO_DURATION.observe(seconds, command=event.command_name, collection=collection, outcome=outcome)
+        queries = getattr(_request_local, 'queries', None)
+        if queries is not None:
+            queries.append((event.command_name, collection, shape, seconds))
+
+    def succeeded(self, event):
+        self._finish(event, 'ok')
+
+    def failed(self, event):
+        self._finish(event, 'error')
+
+
+mongo_listener = MongoCommandListener()
+
+
+def render():
+    extra = (('pid', str(os.getpid())),)
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render(extra))
+    return '\n'.join(lines) + '\n'
+
+
+def observe_request(service, route, method, status, seconds, queries=()):
+    """Record one request; log it with its Mongo commands when slower than SLOW_REQUEST_MS"""
+    REQUEST_DURATION.observe(seconds, service=service, route=route, method=method, status=str(status))
+    if seconds * 1000 >= SLOW_REQUEST_MS:
+        mongo_ms = sum(q[3] for q in queries) * 1000
+        print(f"Slow request: {method} {route} {seconds * 1000:.0f} ms "
+              f"({len(queries)} Mongo commands, {mongo_ms:.0f} ms)")
+        for command_name, collection, shape, command_seconds in queries:
+            print(f"    {command_name} {collection} {shape} {command_seconds * 1000:.1f} ms")
+
+
+def init_app(app, service):
+    """Time every request of ``app`` and serve the metrics at /metrics"""
+
+    @app.before_request
+    def _start_timer():
+        g._metrics_start = time.perf_counter()
+        _request_local.queries = []
+
+    @app.after_request
+    def _observe(response):
+        start = g.pop('_metrics_start', None)
+        queries = getattr(_request_local, 'queries', None) or []
+        _request_local.queries = None
+        if start is None:
+            return response
+        route = request.url_rule.rule if request.url_rule else '<unmatched>'
+        observe_request(service, route, request.method, response.status_code, time.perf_counter() - start, queries)
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        return Response(render(), mimetype='text/plain; version=0.0.4')
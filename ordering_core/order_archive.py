@@ -0,0 +1,174 @@
+"""Moves old completed orders out of the hot ``orders`` collection into ``orders_archive``.
+
+Only a few hundred orders are ever active, but completed orders used to stay
+in ``orders`` forever, so its working set and indexes grew without bound. The
+archiver copies completed orders older than ``age_days`` to orders_archive in
+batches, oldest first, then deletes them from orders. A batch is one
+``bulk_write`` of upserts followed by one ``delete_many``, so a batch cut short
+between the two is simply redone on the next run.
+
+The job runs on a background thread in the employee service every
+``interval`` seconds; with a distributed shared state only the process holding
+the lease runs it. The history API reads both collections (see
+order_history.fetch_page) and the analytics backfill covers both. With
+``retention_days`` a TTL index on the archive lets MongoDB delete archived
+orders once they are that old.
+"""
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from pymongo import ASCENDING, ReplaceOne
+from pymongo.errors import PyMongoError
+
+from ordering_core.metrics import ARCHIVE_BATCH_DURATION, ARCHIVE_BATCH_SIZE
+from ordering_core.shared_state import SharedStateError
+
+ARCHIVE_COLLECTION = 'orders_archive'
+TTL_INDEX = 'completed_time_ttl'
+LEASE_KEY = 'order_archive:leader'
+
+
+def archivable_query(cutoff):
+    return {'status': 'completed', 'completed_time': {'$lt': cutoff}}
+
+
+def ensure_retention(archive, days):
+    """TTL index expiring archived orders ``days`` after completion; no expiry when days is 0"""
+    existing = archive.index_information().get(TTL_INDEX)
+    if not days:
+        if existing:
+            archive.drop_index(TTL_INDEX)
+        return
+    seconds = int(days * 86400)
+    if existing is None:
+        archive.create_index([('completed_time', ASCENDING)], name=TTL_INDEX, expireAfterSeconds=seconds)
+    elif existing.get('expireAfterSeconds') != seconds:
+        archive.database.command('collMod', archive.name,
+                                 index={'name': TTL_INDEX, 'expireAfterSeconds': seconds})
+
+
+class OrderArchiver:
+    """Archives completed orders older than ``age_days``, ``batch_size`` at a time"""
+
+    def __init__(self, db, age_days=30.0, batch_size=500, interval=3600.0, pause=0.1, retention_days=0,
+                 shared=None):
+        self.db = db
+        self.age_days = age_days
+        self.batch_size = batch_size
+        self.interval = interval
+        self.pause = pause
+        self.retention_days = retention_days
+        self.shared = shared if shared is not None and shared.distributed else None
+        self.owner = f'{os.getpid()}-{uuid.uuid4().hex[:8]}'
+        self.archived = 0
+        self.batches = 0
+        self.last_run = None
+        self.last_error = None
+        self._wake = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def archive_batch(self, cutoff):
+        """Move one batch of orders completed before ``cutoff``; returns how many moved"""
+        start = time.perf_counter()
+        orders = list(self.db.orders.find(archivable_query(cutoff))
+                      .sort('completed_time', 1).limit(self.batch_size))
+        if not orders:
+            return 0
+        self.db[ARCHIVE_COLLECTION].bulk_write(
+            [ReplaceOne({'_id': order['_id']}, order, upsert=True) for order in orders], ordered=False)
+        self.db.orders.delete_many({'_id': {'$in': [order['_id'] for order in orders]}, 'status': 'completed'})
+        ARCHIVE_BATCH_DURATION.observe(time.perf_counter() - start)
+        ARCHIVE_BATCH_SIZE.observe(len(orders))
+        with self._lock:
+            self.archived += len(orders)
+            self.batches += 1
+        return len(orders)
+
+    def run_once(self, progress=None):
+        """Archive everything that is due; returns the number of orders moved"""
+        started = time.perf_counter()
+        cutoff = datetime.utcnow() - timedelta(days=self.age_days)
+        total = 0
+        while True:
+            moved = self.archive_batch(cutoff)
+            total += moved
+            if progress and moved:
+                progress(total)
+            if moved < self.batch_size:
+                break
+            # Leave room for the services' own queries between batches
+            time.sleep(self.pause)
+        seconds = time.perf_counter() - started
+        self.last_run = {
+            'finished_at': datetime.utcnow().isoformat(),
+            'cutoff': cutoff.isoformat(),
+            'orders': total,
+            'seconds': round(seconds, 3),
+            'orders_per_second': round(total / seconds, 1) if seconds else None
+        }
+        return total
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='order-archiver', daemon=True)
+            self._thread.start()
+
+    def wake(self):
+        """Run now instead of waiting for the next interval"""
+        self.start()
+        self._wake.set()
+
+    def _leading(self):
+        if self.shared is None:
+            return True
+        try:
+            # Held across a whole interval, so the holder keeps it by renewing once per run
+            return self.shared.hold_lease(LEASE_KEY, self.owner, self.interval * 1.5)
+        except SharedStateError as e:
+            print(f"Order archiver: shared state unavailable ({e}), skipping this run")
+            return False
+
+    def _run(self):
+        while True:
+            try:
+                if self._leading():
+                    ensure_retention(self.db[ARCHIVE_COLLECTION], self.retention_days)
+                    moved = self.run_once()
+                    if moved:
+                        print(f"Order archiver: moved {moved} orders in {self.last_run['seconds']}s")
+                    self.last_error = None
+            except PyMongoError as e:
+                self.last_error = str(e)
+                print(f"Order archiver error: {e}")
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def stats(self):
+        return {
+            'age_days': self.age_days,
+            'retention_days': self.retention_days or None,
+            'archived': self.archived,
+            'batches': self.batches,
+            'last_run': self.last_run,
+            'last_error': self.last_error,
+            'orders': self.db.orders.estimated_document_count(),
+            'archived_orders': self.db[ARCHIVE_COLLECTION].estimated_document_count()
+        }
+
+
+def archiver_from_env(db, shared=None):
+    """OrderArchiver configured from ARCHIVE_* environment variables"""
+    return OrderArchiver(
+        db,
+        age_days=float(os.getenv('ARCHIVE_AFTER_DAYS', '30')),
+        batch_size=int(os.getenv('ARCHIVE_BATCH_SIZE', '500')),
+        interval=float(os.getenv('ARCHIVE_INTERVAL_SECONDS', '3600')),
+        retention_days=float(os.getenv('ARCHIVE_RETENTION_DAYS', '0')),
+        shared=shared
+    )
@@ -0,0 +1,106 @@
+"""Order revisions and the ``since=<cursor>`` delta responses built on them.
+
+Every write to an order sets ``revision`` (from the ``counters.order_revision``
+sequence, so revisions are unique and increase across all services) and
+``updated_at``. A delta cursor records the highest revision the client has been
+sent and when; a poll with it returns only the orders that changed after it,
+plus the ids of orders that left the window (tombstones), all from the active
+order cache.
+
+A revision is allocated a moment before the write that carries it lands, so two
+concurrent writes can become visible out of order. Deltas therefore also resend
+anything updated within SETTLE_SECONDS before the cursor, which covers that gap
+and the cache's own polling lag; clients apply upserts idempotently.
+"""
+import base64
+import json
+from datetime import datetime, timedelta
+
+from pymongo import ReturnDocument
+
+REVISION_ID = 'order_revision'
+SETTLE_SECONDS = 5.0
+
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+
+def revision_fields(db):
+    """``{'revision', 'updated_at'}`` to $set on (or insert with) an order"""
+    counter = db.counters.find_one_and_update(
+        {'_id': REVISION_ID},
+        {'$inc': {'value': 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return {'revision': counter['value'], 'updated_at': datetime.utcnow()}
+
+
+async def revision_fields_async(db):
+    """``revision_fields`` for coroutines, over a Motor database"""
+    counter = await db.counters.find_one_and_update(
+        {'_id': REVISION_ID},
+        {'$inc': {'value': 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return {'revision': counter['value'], 'updated_at': datetime.utcnow()}
+
+
+def revision_block(db, count):
+    """``count`` sets of revision fields for orders written together, from one counter update"""
+    if not count:
+        return []
+    counter = db.counters.find_one_and_update(
+        {'_id': REVISION_ID},
+        {'$inc': {'value': count}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    now = datetime.utcnow()
+    first = counter['value'] - count + 1
+    return [{'revision': first + i, 'updated_at': now} for i in range(count)]
+
+
+def encode_cursor(revision, issued_at):
+    payload = {'r': revision, 't': (issued_at - EPOCH) // MICROSECOND}
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(revision, issued_at), or None when the cursor is missing or malformed"""
+    if not cursor:
+        return None
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return int(payload['r']), EPOCH + int(payload['t']) * MICROSECOND
+    except (ValueError, TypeError, KeyError, OverflowError):
+        return None
+
+
+def delta(cache, since, window_minutes, serialize):
+    """Response body for ``?since=<cursor>``.
+
+    ``{'orders': [...], 'removed': [ids], 'cursor': ..., 'reset': bool}``; when
+    the cursor is empty, malformed or older than the cache can answer for,
+    ``reset`` is true and ``orders`` is the full window.
+    """
+    now = datetime.utcnow()
+    position = decode_cursor(since)
+    changes = None
+    if position is not None:
+        revision, issued_at = position
+        changes = cache.changes(revision, issued_at - timedelta(seconds=SETTLE_SECONDS), window_minutes)
+    if changes is None:
+        orders, removed = cache.orders(window_minutes=window_minutes), []
+        revision = 0
+    else:
+        orders, removed = changes
+    revision = max([revision, cache.revision] + [order.get('revision', 0) for order in orders])
+    return {
+        'orders': [serialize(order) for order in orders],
+        'removed': removed,
+        'cursor': encode_cursor(revision, now),
+        'reset': changes is None
+    }
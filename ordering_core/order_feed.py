@@ -0,0 +1,138 @@
+"""Live order feed pushed to dashboards and display boards over Server-Sent Events.
+
+The feed is a view over the process's ActiveOrderCache: whenever the cache
+changes it diffs the orders in its own window against what it last sent and
+fans the difference out to the connected screens, so a dozen open tabs cost no
+database queries at all. Each event is encoded once however many screens are
+connected. Under the async serving mode a screen is an ``asyncio.Queue`` on the
+event loop (``astream``) rather than a thread blocked on a ``queue.Queue``.
+"""
+import queue
+import threading
+from datetime import datetime
+
+from ordering_core.serialization import dumps
+
+
+def format_event(event, data):
+    return f"event: {event}\ndata: {dumps(data).decode()}\n\n"
+
+
+class OrderFeed:
+    """Publishes snapshot, upsert and remove events for one window of the cache.
+
+    ``serialize`` turns an order document into the JSON payload the service
+    already returns from its polling endpoint, so streamed and polled clients
+    see identical orders.
+    """
+
+    def __init__(self, cache, serialize, window_minutes=10, heartbeat_interval=15.0):
+        self.cache = cache
+        self.serialize = serialize
+        self.window_minutes = window_minutes
+        self.heartbeat_interval = heartbeat_interval
+        self._visible = {}
+        self._subscribers = set()
+        # Event loop -> its subscribers' asyncio queues
+        self._loop_subscribers = {}
+        self._lock = threading.Lock()
+        cache.add_listener(self.refresh)
+
+    @property
+    def available(self):
+        return self.cache.running
+
+    def start(self):
+        self.cache.start()
+
+    def refresh(self):
+        """Diff the cache against what subscribers have seen and publish the changes"""
+        if not self.cache.ready:
+            return
+        orders = {str(o['_id']): o for o in self.cache.view(self.window_minutes)}
+        with self._lock:
+            for order_id in list(self._visible):
+                if order_id not in orders:
+                    del self._visible[order_id]
+                    self._publish('remove', {'id': order_id})
+            for order_id, order in orders.items():
+                if self._visible.get(order_id) != order:
+                    self._visible[order_id] = order
+                    self._publish('upsert', self.serialize(order))
+
+    def _snapshot(self):
+        """Snapshot frame of the visible orders (callers hold the lock)"""
+        snapshot = sorted(self._visible.values(), key=lambda o: o.get('order_time') or datetime.min)
+        return format_event('snapshot', [self.serialize(order) for order in snapshot])
+
+    def subscribe(self):
+        """Register a subscriber queue, primed with a snapshot of the active orders"""
+        self.cache.wait_until_ready()
+        self.refresh()
+        subscriber = queue.Queue()
+        with self._lock:
+            subscriber.put(self._snapshot())
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def stream(self):
+        """Generator of SSE frames: one snapshot, then only the orders that changed"""
+        subscriber = self.subscribe()
+        try:
+            while True:
+                try:
+                    yield subscriber.get(timeout=self.heartbeat_interval)
+                except queue.Empty:
+                    yield ': keep-alive\n\n'
+        finally:
+            self.unsubscribe(subscriber)
+
+    async def astream(self):
+        """``stream`` for asyncio servers: the same frames, awaited on the running event loop"""
+        # Only the async serving mode pays for importing asyncio
+        import asyncio
+        if not self.cache.ready:
+            await asyncio.to_thread(self.cache.wait_until_ready)
+        self.refresh()
+        loop = asyncio.get_running_loop()
+        inbox = asyncio.Queue()
+        with self._lock:
+            inbox.put_nowait(self._snapshot())
+            if loop not in self._loop_subscribers:
+                self._loop_subscribers[loop] = set()
+                loop.call_later(self.heartbeat_interval, self._heartbeat, loop)
+            self._loop_subscribers[loop].add(inbox)
+        try:
+            while True:
+                yield await inbox.get()
+        finally:
+            with self._lock:
+                self._loop_subscribers[loop].discard(inbox)
+
+    def _heartbeat(self, loop):
+        # One timer per loop rather than a timeout on every screen's get(), which costs a task per frame
+        with self._lock:
+            inboxes = self._loop_subscribers[loop]
+            if not inboxes:
+                del self._loop_subscribers[loop]
+                return
+            _deliver(list(inboxes), ': keep-alive\n\n')
+        loop.call_later(self.heartbeat_interval, self._heartbeat, loop)
+
+    def _publish(self, event, data):
+        frame = format_event(event, data)
+        for subscriber in self._subscribers:
+            subscriber.put(frame)
+        for loop, inboxes in self._loop_subscribers.items():
+            if inboxes and not loop.is_closed():
+                # One wakeup per loop, however many of its screens are connected
+                loop.call_soon_threadsafe(_deliver, list(inboxes), frame)
+
+
+def _deliver(inboxes, frame):
+    for inbox in inboxes:
+        inbox.put_nowait(frame)
@@ -0,0 +1,192 @@
+"""Order history queries with keyset (cursor) pagination.
+
+Pages are ordered by ``completed_time`` (or ``order_time``) and then ``_id``, and
+the cursor records the last row of the previous page, so every page is an index
+range scan that starts where the last one stopped: page 500 costs the same as
+page 1, however large the collection grows. Cursors are opaque to clients and
+only valid for the sort they were issued with.
+
+Completed orders move to orders_archive as they age (see order_archive.py).
+When a query can match completed orders, the same page is read from both
+collections and the two are merged, so the history reads as one collection.
+"""
+import base64
+import json
+import re
+from datetime import datetime, timedelta, timezone
+
+from bson.objectid import ObjectId
+from bson.errors import InvalidId
+
+STATUSES = ['pending', 'in_progress', 'completed']
+SORT_FIELDS = ['completed_time', 'order_time']
+FIELDS = [
+    'order_number', 'customer_name', 'customer_phone', 'item_lines', 'items', 'total_price', 'total_cents',
+    'status', 'order_time', 'completed_time'
+]
+# The canonical ``items`` are only returned when asked for
+DEFAULT_FIELDS = [field for field in FIELDS if field != 'items']
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+
+class HistoryQueryError(ValueError):
+    pass
+
+
+def _micros(value):
+    return (value - EPOCH) // MICROSECOND
+
+
+def _from_micros(micros):
+    return EPOCH + micros * MICROSECOND
+
+
+def encode_cursor(sort, direction, order):
+    """Cursor pointing just past ``order`` for the given sort"""
+    payload = {'s': sort, 'd': direction, 't': _micros(order[sort]), 'i': str(order['_id'])}
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, sort, direction):
+    """(sort value, _id) from a cursor issued for the same sort"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        value, order_id = _from_micros(payload['t']), ObjectId(payload['i'])
+    except (ValueError, TypeError, KeyError, OverflowError, InvalidId):
+        raise HistoryQueryError('Invalid cursor')
+    if payload.get('s') != sort or payload.get('d') != direction:
+        raise HistoryQueryError('Cursor was issued for a different sort order')
+    return value, order_id
+
+
+def parse_time(value, name):
+    """ISO 8601 date or datetime as naive UTC (how the services store times)"""
+    try:
+        parsed = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+    except ValueError:
+        raise HistoryQueryError(f'Invalid {name}: {value}')
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+class HistoryQuery:
+    """A validated history request built from query-string arguments.
+
+    Supported arguments: ``status`` (comma separated, default completed),
+    ``sort`` (completed_time or order_time), ``order`` (desc or asc), ``from``
+    (inclusive) and ``to`` (exclusive) on the sort field, ``customer`` (name
+    prefix or exact phone), ``order_number``, ``fields`` (comma separated
+    projection), ``limit`` and ``cursor``.
+    """
+
+    def __init__(self, args):
+        statuses = [s for s in (args.get('status') or 'completed').split(',') if s]
+        unknown = [s for s in statuses if s not in STATUSES]
+        if unknown or not statuses:
+            raise HistoryQueryError(f"Unknown status: {', '.join(unknown) or '(none)'}")
+        self.statuses = statuses
+
+        self.sort = args.get('sort') or 'completed_time'
+        if self.sort not in SORT_FIELDS:
+            raise HistoryQueryError(f'Cannot sort by {self.sort}')
+        if self.sort == 'completed_time' and statuses != ['completed']:
+            raise HistoryQueryError('Only completed orders can be sorted by completed_time')
+        self.direction = args.get('order') or 'desc'
+        if self.direction not in ('asc', 'desc'):
+            raise HistoryQueryError('order must be asc or desc')
+
+        self.start = parse_time(args['from'], 'from') if args.get('from') else None
+        self.end = parse_time(args['to'], 'to') if args.get('to') else None
+        self.customer = (args.get('customer') or '').strip()
+        self.order_number = (args.get('order_number') or '').strip().upper()
+
+        fields = [f for f in (args.get('fields') or '').split(',') if f]
+        unknown = [f for f in fields if f not in FIELDS]
+        if unknown:
+            raise HistoryQueryError(f"Unknown field: {', '.join(unknown)}")
+        self.fields = fields or DEFAULT_FIELDS
+
+        try:
+            self.limit = int(args.get('limit') or DEFAULT_LIMIT)
+        except ValueError:
+            raise HistoryQueryError('limit must be a number')
+        if not 1 <= self.limit <= MAX_LIMIT:
+            raise HistoryQueryError(f'limit must be between 1 and {MAX_LIMIT}')
+
+        self.after = decode_cursor(args['cursor'], self.sort, self.direction) if args.get('cursor') else None
+
+    def filter(self):
+        clauses = [{'status': self.statuses[0] if len(self.statuses) == 1 else {'$in': self.statuses}}]
+        time_range = {}
+        if self.start:
+            time_range['$gte'] = self.start
+        if self.end:
+            time_range['$lt'] = self.end
+        # Orders without the sort field cannot be placed on a page; $exists keeps them out of the scan
+        clauses.append({self.sort: time_range or {'$exists': True}})
+        if self.order_number:
+            clauses.append({'order_number': self.order_number})
+        if self.customer:
+            clauses.append({'$or': [
+                {'customer_name': {'$regex': '^' + re.escape(self.customer), '$options': 'i'}},
+                {'customer_phone': self.customer}
+            ]})
+        if self.after:
+            value, order_id = self.after
+            past, reached = ('$lt', '$lte') if self.direction == 'desc' else ('$gt', '$gte')
+            # The plain range bounds the index scan; the $or only breaks ties on _id
+            clauses.append({self.sort: {reached: value}})
+            clauses.append({'$or': [
+                {self.sort: {past: value}},
+                {self.sort: value, '_id': {past: order_id}}
+            ]})
+        return {'$and': clauses}
+
+    def sort_spec(self):
+        key = -1 if self.direction == 'desc' else 1
+        return [(self.sort, key), ('_id', key)]
+
+    def projection(self):
+        return {field: 1 for field in set(self.fields) | {self.sort}}
+
+    def cursor(self, collection):
+        """The pymongo cursor for this page (one extra row tells whether another page follows)"""
+        return (collection.find(self.filter(), self.projection())
+                .sort(self.sort_spec()).limit(self.limit + 1))
+
+
+def serialize(order, fields):
+    row = {'id': str(order['_id'])}
+    for field in fields:
+        value = order.get(field)
+        row[field] = value.isoformat() if isinstance(value, datetime) else value
+    return row
+
+
+def _merge(hot, archived, query):
+    """One page's rows from both collections, in page order; a row in both (mid-move) counts once"""
+    seen = {order['_id'] for order in hot}
+    rows = hot + [order for order in archived if order['_id'] not in seen]
+    rows.sort(key=lambda order: (order[query.sort], order['_id']), reverse=query.direction == 'desc')
+    return rows[:query.limit + 1]
+
+
+def fetch_page(collection, query, archive=None):
+    """``{'orders', 'next_cursor', 'has_more'}`` for one page of ``query``, across ``archive`` too if given"""
+    orders = list(query.cursor(collection))
+    if archive is not None and 'completed' in query.statuses:
+        orders = _merge(orders, list(query.cursor(archive)), query)
+    has_more = len(orders) > query.limit
+    orders = orders[:query.limit]
+    next_cursor = encode_cursor(query.sort, query.direction, orders[-1]) if has_more else None
+    return {
+        'orders': [serialize(order, query.fields) for order in orders],
+        'next_cursor': next_cursor,
+        'has_more': has_more
+    }
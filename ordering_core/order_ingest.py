@@ -0,0 +1,182 @@
+"""Bulk order ingestion for kiosks and delivery integrations.
+
+Orders arrive as a JSON batch or an NDJSON stream, in the same shape the order
+page submits::
+
+    {"customer_name": "Ada", "customer_phone": "+15551234567", "idempotency_key": "kiosk-3:1842",
+     "source": "kiosk", "items": [{"id": "65f...", "quantity": 2, "customization_ids": ["c2"]}]}
+
+Each order is priced against the cached menu and given an order number from
+the allocator, and the whole batch goes to MongoDB in one unordered
+``insert_many``, so one bad order does not stop the rest. Every order gets a
+result of its own: ``created``, ``duplicate`` (its idempotency key was already
+used, and the result names the existing order) or ``rejected``.
+
+Idempotency keys are stored on the order under a unique index, so a retried
+submission is caught by the insert itself rather than by a read beforehand.
+"""
+import json
+from datetime import datetime
+
+from pymongo.errors import BulkWriteError
+
+from ordering_core.order_deltas import revision_block
+from ordering_core.pricing import PricingError
+
+MAX_BATCH = 500
+# NDJSON streams are written in batches of this many orders
+STREAM_BATCH = 100
+MAX_KEY_LENGTH = 200
+ORDER_NUMBER_ATTEMPTS = 5
+DUPLICATE_KEY = 11000
+
+
+class IngestError(ValueError):
+    pass
+
+
+def build_order(payload, menu, prep_seconds=None, now=None):
+    """Validate one submitted order and build the document to insert"""
+    if not isinstance(payload, dict):
+        raise IngestError('Each order must be a JSON object')
+    customer_name = payload.get('customer_name')
+    if not isinstance(customer_name, str) or not customer_name.strip():
+        raise IngestError('customer_name is required')
+    key = payload.get('idempotency_key')
+    if key is not None and (not isinstance(key, str) or not key or len(key) > MAX_KEY_LENGTH):
+        raise IngestError(f'idempotency_key must be a string of 1 to {MAX_KEY_LENGTH} characters')
+    lines = payload.get('items')
+    if not isinstance(lines, list) or not all(isinstance(line, dict) for line in lines):
+        raise IngestError('items must be a list of objects')
+
+    items, total_cents = menu.price_index.price(lines)
+    order_time = now or datetime.utcnow()
+    phone = (payload.get('customer_phone') or '').strip()
+    order = {
+        'customer_name': customer_name.strip(),
+        'customer_phone': phone or None,
+        'items': items,
+        'item_lines': menu.price_index.describe(items),
+        'total_price': total_cents / 100,
+        'total_cents': total_cents,
+        'tickets': menu.ticket_router.route(items, order_time, prep_seconds),
+        'status': 'pending',
+        'order_time': order_time,
+        'source': str(payload.get('source') or 'api')
+    }
+    if key is not None:
+        order['idempotency_key'] = key
+    return order
+
+
+def _result(index, status, order=None, error=None):
+    result = {'index': index, 'status': status}
+    if order is not None:
+        result.update({'id': str(order['_id']), 'order_number': order['order_number']})
+    if error is not None:
+        result['error'] = error
+    return result
+
+
+class OrderIngester:
+    """Prices, numbers and inserts batches of submitted orders"""
+
+    def __init__(self, db, allocator):
+        self.db = db
+        self.allocator = allocator
+
+    def ingest(self, payloads, menu, prep_seconds=None, start_index=0):
+        """``(results, created)``: one result per payload, in order, and the order documents inserted"""
+        results = {}
+        pending = {}
+        now = datetime.utcnow()
+        for offset, payload in enumerate(payloads):
+            index = start_index + offset
+            if isinstance(payload, Exception):
+                results[index] = _result(index, 'rejected', error=str(payload))
+                continue
+            try:
+                pending[index] = build_order(payload, menu, prep_seconds, now)
+            except (IngestError, PricingError) as e:
+                results[index] = _result(index, 'rejected', error=str(e))
+            except Exception as e:
+                # A payload shape the checks above missed rejects that order, not the batch
+                print(f"Order ingest: rejected order {index}: {e!r}")
+                results[index] = _result(index, 'rejected', error='Invalid order')
+
+        for order, fields in zip(pending.values(), revision_block(self.db, len(pending))):
+            order.update(fields)
+
+        created = []
+        duplicates = {}
+        for _ in range(ORDER_NUMBER_ATTEMPTS):
+            if not pending:
+                break
+            batch = list(pending.items())
+            for _, order in batch:
+                order['order_number'] = self.allocator.next()
+            failed = {}
+            try:
+                self.db.orders.insert_many([order for _, order in batch], ordered=False)
+            except BulkWriteError as e:
+                failed = {error['index']: error for error in e.details['writeErrors']}
+            retry = {}
+            for position, (index, order) in enumerate(batch):
+                error = failed.get(position)
+                if error is None:
+                    created.append(order)
+                    results[index] = _result(index, 'created', order)
+                elif error['code'] == DUPLICATE_KEY:
+                    order.pop('_id', None)
+                    if 'idempotency_key' in order:
+                        duplicates[index] = order
+                    else:
+                        retry[index] = order
+                else:
+                    results[index] = _result(index, 'rejected', error=error.get('errmsg', 'Write failed'))
+            pending = self._resolve_duplicates(duplicates, results, retry)
+            duplicates = {}
+        for index in pending:
+            results[index] = _result(index, 'rejected', error='Could not allocate a free order number')
+        return [results[index] for index in sorted(results)], created
+
+    def _resolve_duplicates(self, duplicates, results, retry):
+        """Report orders whose idempotency key is taken; the rest clashed on order_number and are retried"""
+        if not duplicates:
+            return retry
+        keys = [order['idempotency_key'] for order in duplicates.values()]
+        existing = {
+            order['idempotency_key']: order
+            for order in self.db.orders.find({'idempotency_key': {'$in': keys}},
+                                             {'idempotency_key': 1, 'order_number': 1})
+        }
+        for index, order in duplicates.items():
+            match = existing.get(order['idempotency_key'])
+            if match is not None:
+                results[index] = _result(index, 'duplicate', match)
+            else:
+                retry[index] = order
+        return retry
+
+
+def read_ndjson(lines):
+    """Orders from an NDJSON body, one per non-blank line; bad lines become an exception in their place"""
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield IngestError('Invalid JSON')
+
+
+def batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
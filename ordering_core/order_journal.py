@@ -0,0 +1,462 @@
+"""Write-behind journal for placed orders, so checkout does not wait on MongoDB.
+
+With ORDER_JOURNAL_DIR set, place_order appends the new order to a local
+journal, fsyncs it and answers the customer; a background flusher copies the
+journal into the orders collection with ``insert_many`` a batch at a time. A
+MongoDB stall or failover then delays the flush, not the checkout. The order
+number still comes from the allocator's reserved block, and the flusher keeps
+a spare block reserved so that checkout rarely waits for one. The revision is
+assigned when the order is flushed, so delta cursors see it when it is really
+in MongoDB.
+
+Layout: each process takes a slot directory ``<dir>/<n>`` (held with an
+exclusive ``flock``) holding numbered segment files and a ``checkpoint``. A
+segment is a run of records, each a ``<length, crc32>`` header and the order
+as BSON; a new segment starts every ``segment_bytes`` and at every start.
+Segments are read through ``mmap``. The checkpoint is the position up to which
+orders are known to be in MongoDB; fully flushed segments are deleted.
+
+On start a journal replays its slot from the checkpoint, and then adopts the
+slots no live process holds (a worker that crashed, or one that is gone after
+scaling down). Replaying more than necessary is harmless: orders whose _id is
+already in MongoDB are not inserted again, and the customer service queues each
+order's SMS only once. A record cut short by a crash fails its CRC and
+ends the replay of that segment.
+
+The employee service reads the same directory (``JournalTail``) and shows the
+unflushed orders on the worker dashboard until they arrive through MongoDB.
+"""
+import fcntl
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import deque
+from datetime import datetime
+
+import bson
+from bson.objectid import ObjectId
+from pymongo.errors import BulkWriteError, DuplicateKeyError, PyMongoError
+
+from ordering_core.metrics import JOURNAL_FLUSH_BATCH_SIZE, JOURNAL_FLUSH_DURATION
+from ordering_core.order_deltas import revision_block
+
+HEADER = struct.Struct('<II')
+SEGMENT_SUFFIX = '.journal'
+CHECKPOINT = 'checkpoint'
+# How often a running journal looks for slots left behind by processes that are gone
+ADOPT_SECONDS = 60.0
+
+
+def _segment_name(number):
+    return f'{number:08d}{SEGMENT_SUFFIX}'
+
+
+def _segments(slot):
+    """Segment numbers in ``slot``, oldest first"""
+    try:
+        names = os.listdir(slot)
+    except FileNotFoundError:
+        return []
+    return sorted(int(name[:-len(SEGMENT_SUFFIX)]) for name in names if name.endswith(SEGMENT_SUFFIX))
+
+
+def read_checkpoint(slot):
+    """``(segment, offset)`` up to which the slot's orders are in MongoDB"""
+    try:
+        with open(os.path.join(slot, CHECKPOINT)) as f:
+            checkpoint = json.load(f)
+        return checkpoint['segment'], checkpoint['offset']
+    except (FileNotFoundError, ValueError, KeyError):
+        return 0, 0
+
+
+def _write_checkpoint(slot, segment, offset):
+    path = os.path.join(slot, CHECKPOINT)
+    with open(path + '.tmp', 'w') as f:
+        json.dump({'segment': segment, 'offset': offset}, f)
+    # Not fsynced: a checkpoint lost in a crash only replays orders that are skipped as duplicates
+    os.replace(path + '.tmp', path)
+
+
+def encode(order):
+    payload = bson.encode(order)
+    return HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def read_records(path, start=0):
+    """``(order, end offset)`` for each complete record in a segment from ``start``"""
+    try:
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size <= start:
+                return []
+            with mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as view:
+                records = []
+                offset = start
+                while offset + HEADER.size <= size:
+                    length, crc = HEADER.unpack_from(view, offset)
+                    end = offset + HEADER.size + length
+                    if end > size:
+                        break
+                    payload = view[offset + HEADER.size:end]
+                    if zlib.crc32(payload) != crc:
+                        # Torn write at the tail: nothing after it was acknowledged
+                        break
+                    records.append((bson.decode(payload), end))
+                    offset = end
+                return records
+    except FileNotFoundError:
+        return []
+
+
+def unflushed(slot):
+    """``(order, segment, end offset)`` for every record in ``slot`` past its checkpoint"""
+    checkpoint_segment, checkpoint_offset = read_checkpoint(slot)
+    records = []
+    for segment in _segments(slot):
+        if segment < checkpoint_segment:
+            continue
+        start = checkpoint_offset if segment == checkpoint_segment else 0
+        records.extend((order, segment, end) for order, end in read_records(
+            os.path.join(slot, _segment_name(segment)), start))
+    return records
+
+
+def _lock_slot(slot):
+    """An open file holding ``slot``'s lock, or None when another process holds it"""
+    os.makedirs(slot, exist_ok=True)
+    handle = open(os.path.join(slot, 'lock'), 'a')
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        handle.close()
+        return None
+    return handle
+
+
+class OrderJournal:
+    """Journals placed orders and flushes them to ``collection`` in the background
+
+    ``on_flushed(orders)`` runs after each flushed batch. An order can be handed
+    to it more than once (a retried insert, a replay after a crash), so it must
+    be idempotent per order.
+    """
+
+    def __init__(self, directory, collection, allocator, on_flushed=None, segment_bytes=16 * 1024 * 1024,
+                 batch_size=200, retry_interval=1.0):
+        self.directory = directory
+        self.collection = collection
+        self.allocator = allocator
+        self.on_flushed = on_flushed
+        self.segment_bytes = segment_bytes
+        self.batch_size = batch_size
+        self.retry_interval = retry_interval
+        self.flushed = 0
+        self.renumbered = 0
+        self.last_error = None
+        self._pending = deque()
+        self._written = 0
+        self._synced = 0
+        self._descriptors = {}
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._adopted_at = 0.0
+
+        os.makedirs(directory, exist_ok=True)
+        number = 0
+        while True:
+            self._slot_lock = _lock_slot(os.path.join(directory, str(number)))
+            if self._slot_lock is not None:
+                break
+            number += 1
+        self.slot = os.path.join(directory, str(number))
+        # Whatever a previous process left here goes out first
+        for order, segment, end in unflushed(self.slot):
+            self._pending.append((order, segment, end, 0, None))
+        self._segment = (_segments(self.slot) or [0])[-1] + 1
+        self._offset = 0
+        self._open_segment()
+
+    def _open_segment(self):
+        path = os.path.join(self.slot, _segment_name(self._segment))
+        self._descriptors[self._segment] = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self._offset = 0
+
+    def place(self, order):
+        """Number ``order``, make it durable here and queue it for MongoDB; returns its order number"""
+        order['_id'] = ObjectId()
+        order['order_number'] = self.allocator.next()
+        order['updated_at'] = datetime.utcnow()
+        record = encode(order)
+        with self._lock:
+            if self._offset and self._offset + len(record) > self.segment_bytes:
+                os.fsync(self._descriptors[self._segment])
+                self._segment += 1
+                self._open_segment()
+            os.write(self._descriptors[self._segment], record)
+            self._offset += len(record)
+            self._written += 1
+            sequence = self._written
+            # Queued in file order, so the checkpoint never passes a record still waiting; flushed once synced
+            self._pending.append((order, self._segment, self._offset, sequence, time.monotonic()))
+        self._sync(sequence)
+        self._wake.set()
+        return order['order_number']
+
+    def _sync(self, sequence):
+        # Group commit: one fsync covers every record written before it started
+        with self._sync_lock:
+            if self._synced >= sequence:
+                return
+            with self._lock:
+                descriptor = self._descriptors[self._segment]
+                written = self._written
+            os.fsync(descriptor)
+            self._synced = written
+
+    def pending(self):
+        """Orders not yet in MongoDB, oldest first"""
+        with self._lock:
+            return [entry[0] for entry in self._pending]
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='order-journal', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        delay = self.retry_interval
+        while True:
+            try:
+                if time.monotonic() - self._adopted_at > ADOPT_SECONDS:
+                    self._adopt()
+                    self._adopted_at = time.monotonic()
+                while self._flush_batch():
+                    pass
+                # Checkout keeps numbering orders through a stall that outlasts the current block
+                self.allocator.reserve_spare()
+                self.last_error = None
+                delay = self.retry_interval
+                self._wake.wait(self.retry_interval)
+                self._wake.clear()
+            except PyMongoError as e:
+                self.last_error = str(e)
+                print(f"Order journal: MongoDB unavailable ({e}), {len(self._pending)} orders waiting")
+                time.sleep(delay)
+                delay = min(delay * 2, 30.0)
+
+    def _flush_batch(self):
+        """Insert the oldest pending orders; returns False once nothing is left"""
+        with self._lock:
+            batch = []
+            for entry in self._pending:
+                if len(batch) == self.batch_size or entry[3] > self._synced:
+                    break
+                batch.append(entry)
+        if not batch:
+            return False
+        start = time.perf_counter()
+        stored = self._insert([entry[0] for entry in batch])
+        with self._lock:
+            for _ in batch:
+                self._pending.popleft()
+            self.flushed += len(batch)
+        JOURNAL_FLUSH_DURATION.observe(time.perf_counter() - start)
+        JOURNAL_FLUSH_BATCH_SIZE.observe(len(batch))
+        _, segment, offset, _, _ = batch[-1]
+        _write_checkpoint(self.slot, segment, offset)
+        self._drop_segments(segment)
+        if self.on_flushed and stored:
+            self._flushed(stored)
+        return True
+
+    def _flushed(self, orders):
+        try:
+            self.on_flushed(orders)
+        except Exception as e:
+            print(f"Order journal: on_flushed failed for {len(orders)} orders: {e}")
+
+    def _insert(self, orders):
+        """Insert ``orders``; returns the ones now in MongoDB, including any that already were"""
+        documents = [{**order, **revision} for order, revision in
+                     zip(orders, revision_block(self.collection.database, len(orders)))]
+        try:
+            self.collection.insert_many(documents, ordered=False)
+            return documents
+        except BulkWriteError as e:
+            failed = {error['index']: error for error in e.details['writeErrors']}
+        stored = []
+        for index, document in enumerate(documents):
+            error = failed.get(index)
+            if error is None:
+                stored.append(document)
+            elif error['code'] != 11000:
+                print(f"Order journal: dropping order {document['_id']}: {error.get('errmsg')}")
+            elif self.collection.find_one({'_id': document['_id']}, {'_id': 1}) is not None:
+                # Written by an earlier attempt that failed part way, or by a run that crashed before its checkpoint
+                stored.append(document)
+            else:
+                # Not a replay: the number was taken after its block was checked (the allocator skips the
+                # legacy codes it finds). Keep the number the customer was shown; the SMS has the new one
+                number = document['order_number']
+                document['renumbered_from'] = number
+                if self._renumber(document):
+                    print(f"Order journal: order number {number} was taken, order {document['_id']} "
+                          f"is now {document['order_number']}")
+                    stored.append(document)
+                else:
+                    print(f"Order journal: dropping order {document['_id']}: no free order number")
+        return stored
+
+    def _renumber(self, document, attempts=5):
+        """Insert ``document`` under the next free order number, keeping its _id; False if none was free"""
+        for _ in range(attempts):
+            document['order_number'] = self.allocator.next()
+            try:
+                self.collection.insert_one(document)
+                self.renumbered += 1
+                return True
+            except DuplicateKeyError:
+                continue
+        return False
+
+    def _drop_segments(self, flushed_segment):
+        """Delete the segments before the one the checkpoint points into"""
+        for segment in _segments(self.slot):
+            if segment >= flushed_segment:
+                break
+            with self._sync_lock:
+                descriptor = self._descriptors.pop(segment, None)
+                if descriptor is not None:
+                    os.close(descriptor)
+            os.remove(os.path.join(self.slot, _segment_name(segment)))
+
+    def _adopt(self):
+        """Flush the slots no live process holds, then delete their segments"""
+        for name in os.listdir(self.directory):
+            slot = os.path.join(self.directory, name)
+            if slot == self.slot or not os.path.isdir(slot):
+                continue
+            handle = _lock_slot(slot)
+            if handle is None:
+                continue
+            try:
+                orders = [order for order, _, _ in unflushed(slot)]
+                for offset in range(0, len(orders), self.batch_size):
+                    stored = self._insert(orders[offset:offset + self.batch_size])
+                    if self.on_flushed and stored:
+                        self._flushed(stored)
+                if orders:
+                    print(f"Order journal: replayed {len(orders)} orders left in {slot}")
+                for segment in _segments(slot):
+                    os.remove(os.path.join(slot, _segment_name(segment)))
+                _write_checkpoint(slot, 0, 0)
+            finally:
+                handle.close()
+
+    def stats(self):
+        with self._lock:
+            oldest = next((entry[4] for entry in self._pending if entry[4] is not None), None)
+            pending = len(self._pending)
+        return {
+            'slot': self.slot,
+            'pending': pending,
+            'oldest_pending_seconds': round(time.monotonic() - oldest, 3) if oldest is not None else None,
+            'flushed': self.flushed,
+            'renumbered': self.renumbered,
+            'segments': len(_segments(self.slot)),
+            'last_error': self.last_error
+        }
+
+
+class JournalTail:
+    """Follows a journal directory written by other processes and shows the orders placed in ``cache``.
+
+    An order is ``hold``-ed when its record appears, flushed or not, so it
+    shows before the cache's watcher brings it, and ``release``-d once the
+    writer's checkpoint has passed it. The first scan starts at the checkpoints.
+    """
+
+    def __init__(self, directory, cache, interval=0.25):
+        self.directory = directory
+        self.cache = cache
+        self.interval = interval
+        self._read = None
+        self._held = []
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='order-journal-tail', daemon=True)
+            self._thread.start()
+
+    def scan(self):
+        """Hold the orders written since the last scan and release the ones flushed since"""
+        try:
+            slots = [os.path.join(self.directory, name) for name in os.listdir(self.directory)]
+        except FileNotFoundError:
+            return
+        checkpoints = {slot: read_checkpoint(slot) for slot in slots}
+        first = self._read is None
+        if first:
+            self._read = {}
+        for slot, checkpoint in checkpoints.items():
+            for segment in _segments(slot):
+                if first and segment < checkpoint[0]:
+                    continue
+                path = os.path.join(slot, _segment_name(segment))
+                start = self._read.get(path, checkpoint[1] if first and segment == checkpoint[0] else 0)
+                for order, end in read_records(path, start):
+                    self.cache.hold(order)
+                    self._held.append((slot, path, segment, end, str(order['_id'])))
+                    self._read[path] = end
+        flushed = [held for held in self._held
+                   if (held[2], held[3]) <= checkpoints.get(held[0], (0, 0)) or not os.path.exists(held[1])]
+        if flushed:
+            self.cache.release([held[4] for held in flushed])
+            self._held = [held for held in self._held if held not in flushed]
+        # Forget segments that have been flushed and deleted
+        self._read = {path: offset for path, offset in self._read.items() if os.path.exists(path)}
+
+    def _run(self):
+        while True:
+            try:
+                self.scan()
+            except OSError as e:
+                print(f"Order journal tail error: {e}")
+            time.sleep(self.interval)
+
+
+def journal_from_env(collection, allocator, on_flushed=None):
+    """OrderJournal under ORDER_JOURNAL_DIR, started; None when it is unset"""
+    directory = os.getenv('ORDER_JOURNAL_DIR', '').strip()
+    if not directory:
+        return None
+    journal = OrderJournal(
+        directory, collection, allocator, on_flushed=on_flushed,
+        segment_bytes=int(os.getenv('ORDER_JOURNAL_SEGMENT_BYTES', str(16 * 1024 * 1024))),
+        batch_size=int(os.getenv('ORDER_JOURNAL_BATCH_SIZE', '200'))
+    )
+    journal.start()
+    return journal
+
+
+def tail_from_env(cache):
+    """JournalTail over ORDER_JOURNAL_DIR feeding ``cache``, started; None when it is unset"""
+    directory = os.getenv('ORDER_JOURNAL_DIR', '').strip()
+    if not directory:
+        return None
+    tail = JournalTail(directory, cache)
+    tail.start()
+    return tail
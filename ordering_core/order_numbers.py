@@ -0,0 +1,150 @@
+"""Order numbers allocated from a shared counter, without a read per order.
+
+Each process reserves a block of sequence numbers with a single atomic ``$inc``
+on the ``counters`` collection and hands them out from memory, so concurrent
+gunicorn workers never see the same number. Sequence numbers are scrambled with
+a bijective multiply-and-add modulo 32**6 and spelled in Crockford base32 (no
+I, L, O or U), which keeps codes six characters long, easy to read aloud, and
+not obviously sequential.
+
+Legacy orders carry random six-character codes that may coincide with a
+generated one. Given the orders collection, the allocator looks up the codes of
+each block it reserves and skips the ones already taken, so a number is final
+when it is handed out (the order journal shows it to the customer before the
+order reaches MongoDB). The unique index on ``order_number`` still backs this
+up: ``insert_order`` retries with the next number on a clash.
+
+The ``_async`` variants do the same for the async serving mode through a Motor
+collection; both draw on the same blocks.
+"""
+import threading
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+CODE_LENGTH = 6
+SPACE = len(ALPHABET) ** CODE_LENGTH
+# Odd multiplier, so n -> (n * MULTIPLIER + OFFSET) % SPACE visits every code once
+MULTIPLIER = 387420489
+OFFSET = 91834577
+
+
+def encode(sequence):
+    """Spell sequence number ``sequence`` as a six-character order code"""
+    n = (sequence * MULTIPLIER + OFFSET) % SPACE
+    chars = []
+    for _ in range(CODE_LENGTH):
+        n, digit = divmod(n, len(ALPHABET))
+        chars.append(ALPHABET[digit])
+    return ''.join(reversed(chars))
+
+
+class OrderNumberAllocator:
+    """Hands out order numbers from blocks reserved atomically in MongoDB"""
+
+    def __init__(self, counters, block_size=50, counter_id='order_number', orders=None):
+        self.counters = counters
+        self.block_size = block_size
+        self.counter_id = counter_id
+        # Codes in ``orders`` (legacy random ones) are skipped when a block is reserved
+        self.orders = orders
+        self._next = 0
+        self._end = 0
+        self._taken = frozenset()
+        # A block reserved ahead of time (see reserve_spare)
+        self._spare = None
+        self._lock = threading.Lock()
+
+    def _taken_filter(self, counter):
+        end = counter['value']
+        return {'order_number': {'$in': [encode(sequence) for sequence in range(end - self.block_size, end)]}}
+
+    def _reserve_block(self):
+        """``(counter, taken codes)`` for a newly reserved block"""
+        counter = self.counters.find_one_and_update(
+            {'_id': self.counter_id},
+            {'$inc': {'value': self.block_size}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        if self.orders is None:
+            return counter, frozenset()
+        return counter, frozenset(order['order_number'] for order in
+                                  self.orders.find(self._taken_filter(counter), {'order_number': 1}))
+
+    def _take(self, block=None):
+        """The next free number, switching to the reserved ``block`` once ours is used up; None if none left"""
+        with self._lock:
+            while True:
+                if self._next >= self._end and block is None:
+                    block, self._spare = self._spare, None
+                if self._next >= self._end and block is not None:
+                    counter, self._taken = block
+                    self._end = counter['value']
+                    self._next = self._end - self.block_size
+                    block = None
+                if self._next >= self._end:
+                    return None
+                number = encode(self._next)
+                self._next += 1
+                if number not in self._taken:
+                    return number
+
+    def reserve_spare(self):
+        """Reserve the next block now, so ``next`` does not wait on MongoDB when the current one runs out"""
+        if self._spare is not None:
+            return
+        block = self._reserve_block()
+        with self._lock:
+            if self._spare is None:
+                self._spare = block
+
+    def next(self):
+        # Blocks are reserved outside the lock, so a coroutine taking a number never waits on a thread's
+        # round trip to MongoDB; two callers reserving at once just leave one block unused
+        number = self._take()
+        while number is None:
+            number = self._take(self._reserve_block())
+        return number
+
+    async def next_async(self, counters):
+        """``next`` for coroutines, reserving blocks through the Motor collection ``counters``"""
+        number = self._take()
+        while number is None:
+            counter = await counters.find_one_and_update(
+                {'_id': self.counter_id},
+                {'$inc': {'value': self.block_size}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            taken = frozenset()
+            if self.orders is not None:
+                cursor = counters.database[self.orders.name].find(self._taken_filter(counter), {'order_number': 1})
+                taken = frozenset([order['order_number'] async for order in cursor])
+            number = self._take((counter, taken))
+        return number
+
+
+def insert_order(collection, order, allocator, attempts=5):
+    """Assign ``order['order_number']`` and insert it, retrying on a taken number"""
+    for _ in range(attempts):
+        order['order_number'] = allocator.next()
+        try:
+            collection.insert_one(order)
+            return order['order_number']
+        except DuplicateKeyError:
+            order.pop('_id', None)
+    raise RuntimeError(f"Could not allocate a free order number after {attempts} attempts")
+
+
+async def insert_order_async(collection, order, allocator, counters, attempts=5):
+    """``insert_order`` for coroutines, over Motor ``collection`` and ``counters``"""
+    for _ in range(attempts):
+        order['order_number'] = await allocator.next_async(counters)
+        try:
+            await collection.insert_one(order)
+            return order['order_number']
+        except DuplicateKeyError:
+            order.pop('_id', None)
+    raise RuntimeError(f"Could not allocate a free order number after {attempts} attempts")
@@ -0,0 +1,121 @@
+"""Server-side order pricing in integer cents.
+
+A PriceIndex is built once per menu version (see MenuCatalog) and maps item ids
+to their name, base price and customization prices, all in cents. Pricing an
+order is then a dictionary lookup per line: client-supplied prices are ignored,
+and unknown items, unknown customizations or bad quantities are rejected. The
+priced lines use the canonical schema described in line_items.
+"""
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+MAX_QUANTITY = 100
+
+
+class PricingError(ValueError):
+    pass
+
+
+def to_cents(price):
+    return int((Decimal(str(price)) * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+
+def format_cents(cents):
+    return f"${cents // 100}.{cents % 100:02d}"
+
+
+def line_text(name, quantity, customization_names, line_cents):
+    """``"2x Classic Burger (Bacon) - $29.98"``"""
+    text = f"{quantity}x {name}"
+    if customization_names:
+        text += f" ({', '.join(customization_names)})"
+    return f"{text} - {format_cents(line_cents)}"
+
+
+def _strings(values):
+    return isinstance(values, list) and all(isinstance(value, str) for value in values)
+
+
+def _menu_cents(price):
+    """``to_cents`` for a stored menu price, which must be a finite, non-negative number"""
+    if isinstance(price, bool) or not isinstance(price, (int, float, Decimal, str)):
+        raise ValueError(f'price {price!r} is not a number')
+    try:
+        value = Decimal(str(price))
+    except InvalidOperation:
+        raise ValueError(f'price {price!r} is not a number')
+    if not value.is_finite() or value < 0:
+        raise ValueError(f'price {price!r} is not a finite, non-negative number')
+    return to_cents(value)
+
+
+class PriceIndex:
+    """Item prices in cents by id. Items with a corrupt stored price are skipped (listed in ``skipped``),
+    so only orders for them are rejected."""
+
+    def __init__(self, menu_items):
+        self.items = {}
+        self.skipped = []
+        for item in menu_items:
+            try:
+                customizations = {}
+                ids_by_name = {}
+                for c in item.get('customizations') or []:
+                    customization_id = c.get('id') or c['name']
+                    customizations[customization_id] = (c['name'], _menu_cents(c.get('price', 0)))
+                    ids_by_name[c['name']] = customization_id
+                self.items[str(item['_id'])] = (item['name'], _menu_cents(item.get('base_price', 0)),
+                                                customizations, ids_by_name)
+            except (KeyError, TypeError, ValueError) as e:
+                self.skipped.append(str(item.get('_id')))
+                print(f"Pricing: skipping menu item {item.get('_id')} ({item.get('name')!r}): {e!r}")
+
+    def price(self, lines):
+        """Price ``[{'id', 'quantity', 'customization_ids'}, ...]``; returns (order lines, total cents).
+
+        Lines may name their customizations (``'customizations'``) instead of
+        giving ids. The result uses the canonical schema in line_items.
+        """
+        priced = []
+        total = 0
+        for line in lines:
+            entry = self.items.get(str(line.get('id')))
+            if entry is None:
+                raise PricingError(f"Unknown menu item: {line.get('name') or line.get('id')}")
+            name, unit, prices, ids_by_name = entry
+            quantity = line.get('quantity')
+            if type(quantity) is not int or not 1 <= quantity <= MAX_QUANTITY:
+                raise PricingError(f"Invalid quantity for {name}: {quantity}")
+            chosen = line.get('customization_ids')
+            if chosen is None:
+                chosen = line.get('customizations') or []
+                if not _strings(chosen):
+                    raise PricingError(f"Invalid customizations for {name}")
+                chosen = [ids_by_name.get(c, c) for c in chosen]
+            elif not _strings(chosen):
+                raise PricingError(f"Invalid customization_ids for {name}")
+            if len(set(chosen)) != len(chosen):
+                raise PricingError(f"Duplicate customization for {name}")
+            for customization in chosen:
+                price = prices.get(customization)
+                if price is None:
+                    raise PricingError(f"Unknown customization for {name}: {customization}")
+                unit += price[1]
+            total += unit * quantity
+            priced.append({
+                'item_id': str(line['id']),
+                'quantity': quantity,
+                'customization_ids': list(chosen),
+                'unit_cents': unit
+            })
+        if not priced:
+            raise PricingError('Order has no items')
+        return priced, total
+
+    def describe(self, lines):
+        """Display text for each priced line"""
+        texts = []
+        for line in lines:
+            name, _, prices, _ = self.items[line['item_id']]
+            names = [prices[c][0] for c in line['customization_ids']]
+            texts.append(line_text(name, line['quantity'], names, line['unit_cents'] * line['quantity']))
+        return texts
@@ -0,0 +1,192 @@
+"""Predicted ready times for active orders, from measured prep times and the live station queues.
+
+Prep time statistics are kept per menu item in the prep_stats collection as
+running sums (``samples``, ``seconds``), added to by the analytics rollup of
+each completed order, so they cost one small upsert per item and never a scan
+of the orders. A sample is how long the station ticket holding the item took
+from start to done. Orders completed from the worker dashboard add none for
+the tickets they closed: order_time to completed_time includes the queue wait
+and however long the order sat before someone completed it, not cook time.
+
+The estimator replays each station's queue in the order the station works it
+(see stations.py): tickets being cooked finish at their start time plus their
+estimate, and queued tickets start as soon as one of the station's cooks is
+free. An order is ready when its last open ticket is. The replay works from
+the active order cache only and is redone at most once per cache change, so
+serving an estimate for every active order on every refresh costs no queries.
+"""
+import heapq
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from ordering_core.stations import DEFAULT_STATION, STATIONS, estimate_seconds
+
+COLLECTION = 'prep_stats'
+# Items with fewer completed samples use their station's default prep time
+MIN_SAMPLES = 3
+# Tickets a station works on at once
+STATION_COOKS = {'grill': 2, 'fryer': 1, 'drinks': 1, 'desserts': 1}
+# An order that is late is never predicted sooner than this
+MIN_REMAINING_SECONDS = 60
+# Estimates are redone at least this often while the queue is unchanged, as tickets overrun
+MAX_AGE_SECONDS = 15.0
+
+
+def prep_samples(order):
+    """item id -> [prep seconds] from the station tickets of one completed order"""
+    samples = defaultdict(list)
+    lines = order.get('items') or []
+    for ticket in order.get('tickets') or []:
+        if ticket.get('started_at') and ticket.get('done_at'):
+            seconds = max(0.0, (ticket['done_at'] - ticket['started_at']).total_seconds())
+            for index in ticket['lines']:
+                if index < len(lines):
+                    samples[lines[index]['item_id']].append(seconds)
+    return samples
+
+
+class PrepStats:
+    """Mean prep seconds per menu item, reloaded from prep_stats every ``refresh_interval``.
+
+    With a shared state one process reloads them per interval for all the others.
+    """
+
+    def __init__(self, collection, refresh_interval=60.0, shared=None):
+        self.collection = collection
+        self.refresh_interval = refresh_interval
+        self.shared = shared
+        self._means = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def fresh(self):
+        """True while ``seconds`` answers from memory"""
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.refresh_interval
+
+    def refresh(self):
+        """Reload the means once they are older than refresh_interval"""
+        now = time.monotonic()
+        if self._loaded_at is not None and now - self._loaded_at < self.refresh_interval:
+            return
+        with self._lock:
+            if self._loaded_at is not None and now - self._loaded_at < self.refresh_interval:
+                return
+            if self.shared is None:
+                self._means = self._read()['means']
+            else:
+                self._means = self.shared.cached(COLLECTION, self.refresh_interval, self._read)['means']
+            self._loaded_at = now
+
+    def _read(self):
+        return {'means': {
+            str(doc['_id']): doc['seconds'] / doc['samples']
+            for doc in self.collection.find({'samples': {'$gte': MIN_SAMPLES}})
+        }}
+
+    def seconds(self, item_id):
+        """Mean prep seconds for an item, or None while it has too few samples"""
+        self.refresh()
+        return self._means.get(item_id)
+
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+
+class ReadyTimeEstimator:
+    """Ready time per active order in an ActiveOrderCache"""
+
+    def __init__(self, cache, stats, cooks=None):
+        self.cache = cache
+        self.stats = stats
+        self.cooks = cooks or STATION_COOKS
+        self.replays = 0
+        self._ready = None
+        self._computed_at = 0.0
+        self._generation = 0
+        self._lock = threading.Lock()
+        cache.add_listener(self.invalidate)
+
+    def invalidate(self):
+        self._generation += 1
+        self._ready = None
+
+    def _open_tickets(self, order):
+        """The order's tickets still to finish; orders without tickets count as one for the default station"""
+        tickets = order.get('tickets')
+        if not tickets:
+            status = 'in_progress' if order.get('status') == 'in_progress' else 'pending'
+            lines = order.get('items') or []
+            tickets = [{
+                'station': DEFAULT_STATION,
+                'status': status,
+                'started_at': order.get('updated_at') if status == 'in_progress' else None,
+                'start_by': order.get('order_time'),
+                'estimated_seconds': estimate_seconds(lines, STATIONS[DEFAULT_STATION]['prep_seconds'],
+                                                      self.stats.seconds)
+            }]
+        return [ticket for ticket in tickets if ticket['status'] != 'done']
+
+    def _replay(self):
+        now = datetime.utcnow()
+        cooking = defaultdict(list)
+        queued = defaultdict(list)
+        ready = {}
+        for order in self.cache.orders(window_minutes=0):
+            order_id = str(order['_id'])
+            ready[order_id] = now
+            for ticket in self._open_tickets(order):
+                estimate = timedelta(seconds=ticket.get('estimated_seconds') or 0)
+                if ticket['status'] == 'in_progress':
+                    started = ticket.get('started_at') or now
+                    cooking[ticket['station']].append(max(started + estimate, now))
+                    ready[order_id] = max(ready[order_id], cooking[ticket['station']][-1])
+                else:
+                    key = (ticket.get('start_by') or order.get('order_time') or now, order_id)
+                    queued[ticket['station']].append((key, estimate, order_id))
+
+        for station, tickets in queued.items():
+            # Cooks come free as the tickets on the station finish; idle cooks are free now
+            free = list(cooking[station])
+            free.extend([now] * (self.cooks.get(station, 1) - len(free)))
+            heapq.heapify(free)
+            for _, estimate, order_id in sorted(tickets, key=lambda ticket: ticket[0]):
+                finish = heapq.heappop(free) + estimate
+                heapq.heappush(free, finish)
+                ready[order_id] = max(ready[order_id], finish)
+        self.replays += 1
+        return ready
+
+    def _current(self):
+        ready = self._ready
+        if ready is None or time.monotonic() - self._computed_at > MAX_AGE_SECONDS:
+            with self._lock:
+                ready = self._ready
+                if ready is None or time.monotonic() - self._computed_at > MAX_AGE_SECONDS:
+                    generation = self._generation
+                    ready = self._replay()
+                    if generation == self._generation:
+                        self._ready = ready
+                        self._computed_at = time.monotonic()
+        return ready
+
+    def ready_times(self):
+        """order id -> predicted ready time (naive UTC) for every pending or in_progress order"""
+        floor = datetime.utcnow() + timedelta(seconds=MIN_REMAINING_SECONDS)
+        return {order_id: max(value, floor) for order_id, value in self._current().items()}
+
+    def ready_at(self, order):
+        """Predicted ready time for one order: completed_time once it is done"""
+        if order.get('status') == 'completed':
+            return order.get('completed_time')
+        ready = self._current().get(str(order['_id']))
+        if ready is None:
+            return None
+        return max(ready, datetime.utcnow() + timedelta(seconds=MIN_REMAINING_SECONDS))
+
+    def serialized(self):
+        """``{order id: ISO ready time}`` for the display boards"""
+        return {order_id: _isoformat(value) for order_id, value in self.ready_times().items()}
@@ -0,0 +1,183 @@
+"""JSON encoding and compression for the services' API responses.
+
+``dumps`` encodes ObjectIds as their hex string and datetimes as ISO 8601, so
+the order serializers hand over values as they come from MongoDB instead of
+converting each field in Python. It uses orjson when it is installed, the
+standard library otherwise; JSON_BACKEND=json|orjson picks one. ``init_app``
+makes it the encoder behind a Flask app's jsonify and app.json, and compresses
+large responses with brotli or gzip, whichever the client accepts (brotli only
+with the Brotli package installed).
+"""
+import dataclasses
+import json
+import os
+import threading
+import zlib
+from datetime import date, datetime
+from decimal import Decimal
+from uuid import UUID
+
+from bson.objectid import ObjectId
+from flask import request
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Smaller bodies fit in a packet or two; compressing them costs more than it saves
+COMPRESS_MIN_BYTES = int(os.getenv('COMPRESS_MIN_BYTES', '1024'))
+COMPRESSIBLE_TYPES = ('application/json', 'text/html')
+# Order lists shrink 7-10x at the lowest levels, for a third or less of the CPU of the default levels
+GZIP_LEVEL = 1
+BROTLI_QUALITY = 1
+# Bodies with a strong ETag (menus, rendered pages) are compressed once per ETag
+COMPRESSED_CACHE_SIZE = 64
+
+
+def _default(obj):
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, (Decimal, UUID)):
+        return str(obj)
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return dataclasses.asdict(obj)
+    if hasattr(obj, '__html__'):
+        return str(obj.__html__())
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+def _orjson_dumps(obj):
+    return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+def _json_dumps(obj):
+    return json.dumps(obj, default=_default, separators=(',', ':'), ensure_ascii=False).encode()
+
+
+BACKENDS = {'json': _json_dumps}
+if orjson is not None:
+    BACKENDS['orjson'] = _orjson_dumps
+
+
+def backend_from_env():
+    name = os.getenv('JSON_BACKEND') or ('orjson' if orjson is not None else 'json')
+    if name not in BACKENDS:
+        print(f"JSON backend {name} unavailable, using json")
+        name = 'json'
+    return name
+
+
+BACKEND = backend_from_env()
+dumps = BACKENDS[BACKEND]
+
+
+class JSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider (jsonify, app.json) on ``dumps``; compact, keys in insertion order"""
+
+    def dumps(self, obj, **kwargs):
+        return dumps(obj).decode()
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(obj) + b'\n', mimetype=self.mimetype)
+
+
+def accepted_encoding(accept_encoding):
+    """'br', 'gzip' or None: the encoding to use for a client sending ``accept_encoding``"""
+    accepted = set()
+    for part in (accept_encoding or '').split(','):
+        name, _, params = part.partition(';')
+        params = params.strip()
+        quality = 1.0
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if quality > 0:
+            accepted.add(name.strip().lower())
+    if brotli is not None and ('br' in accepted or '*' in accepted):
+        return 'br'
+    if 'gzip' in accepted or '*' in accepted:
+        return 'gzip'
+    return None
+
+
+_compressed = {}
+_compressed_lock = threading.Lock()
+
+
+def compress(body, encoding, etag=None):
+    """``body`` compressed with ``encoding``; cached per strong ``etag`` when given"""
+    key = (etag, len(body), encoding)
+    if etag:
+        with _compressed_lock:
+            data = _compressed.get(key)
+        if data is not None:
+            return data
+    if encoding == 'br':
+        data = brotli.compress(body, quality=BROTLI_QUALITY)
+    else:
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        data = compressor.compress(body) + compressor.flush()
+    if etag:
+        with _compressed_lock:
+            if len(_compressed) >= COMPRESSED_CACHE_SIZE:
+                _compressed.pop(next(iter(_compressed)))
+            _compressed[key] = data
+    return data
+
+
+def negotiate(accept_encoding, status, content_type, body, headers):
+    """(body, extra headers) for a complete response; compressed when large, compressible and accepted.
+
+    ``headers`` are the response's (name, value) pairs. A strong ETag is
+    returned weakened, as the compressed bytes differ from the original's.
+    """
+    if status != 200 or len(body) < COMPRESS_MIN_BYTES:
+        return body, []
+    if not (content_type or '').startswith(COMPRESSIBLE_TYPES):
+        return body, []
+    if any(name.lower() == 'content-encoding' for name, _ in headers):
+        return body, []
+    encoding = accepted_encoding(accept_encoding)
+    extra = [('Vary', 'Accept-Encoding')]
+    if encoding is None:
+        return body, extra
+    etag = next((value for name, value in headers if name.lower() == 'etag'), None)
+    strong = etag if etag and not etag.startswith('W/') else None
+    extra.append(('Content-Encoding', encoding))
+    if etag:
+        extra.append(('ETag', f'W/{etag}' if strong else etag))
+    return compress(body, encoding, strong), extra
+
+
+def _compress_response(response):
+    if response.direct_passthrough or response.is_streamed:
+        return response
+    data = response.get_data()
+    body, extra = negotiate(request.headers.get('Accept-Encoding'), response.status_code, response.content_type,
+                            data, list(response.headers.items()))
+    for name, value in extra:
+        if name == 'Vary':
+            response.vary.add(value)
+        else:
+            response.headers[name] = value
+    if body is not data:
+        response.set_data(body)
+    return response
+
+
+def init_app(app):
+    """Encode the app's JSON with ``dumps`` and compress its large responses"""
+    app.json = JSONProvider(app)
+    app.after_request(_compress_response)
@@ -0,0 +1,26 @@
+"""Settings that size each process's MongoDB connection pool to its server threads."""
+import os
+
+# Threads outside the request path that also talk to Mongo: active-order watcher, SMS workers
+BACKGROUND_THREADS = 4
+
+
+def mongo_client_options():
+    """Keyword arguments for PyMongo(app, ...): one pooled client per process"""
+    threads = int(os.getenv('GUNICORN_THREADS', '8'))
+    return {
+        'maxPoolSize': int(os.getenv('MONGO_MAX_POOL_SIZE', threads + BACKGROUND_THREADS)),
+        'minPoolSize': int(os.getenv('MONGO_MIN_POOL_SIZE', '2')),
+        # Fail a request quickly instead of hanging when Mongo is unreachable or the pool is exhausted
+        'serverSelectionTimeoutMS': int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000')),
+        'waitQueueTimeoutMS': int(os.getenv('MONGO_WAIT_QUEUE_TIMEOUT_MS', '5000')),
+        'connectTimeoutMS': 5000
+    }
+
+
+def async_mongo_client_options():
+    """Keyword arguments for the Motor client of the async serving mode (see async_serving.py)"""
+    options = mongo_client_options()
+    # Coroutines waiting on Mongo hold no thread, so this caps the commands in flight, not the requests
+    options['maxPoolSize'] = int(os.getenv('MONGO_ASYNC_MAX_POOL_SIZE', '100'))
+    return options
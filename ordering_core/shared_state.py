@@ -0,0 +1,348 @@
+"""State shared by every process of a service: pub/sub, TTL caches and counters.
+
+Each gunicorn worker (and each replica behind a load balancer) otherwise keeps
+its own caches and polls MongoDB for itself. With a shared backend the
+active-order cache elects one process per service to follow the orders
+collection and publish what changed to the rest (see active_orders.py), the
+menu version, menu items and prep time statistics are loaded from MongoDB by
+whichever process finds them expired and served to the others from the
+backend, and rate limits (SMS sending) count across processes.
+
+Two backends ship:
+
+* ``LocalState``: in this process only, the default. Nothing is shared, which
+  matches a single process.
+* ``RedisState``: any server speaking the Redis protocol, over plain sockets
+  (no client library needed). Values and messages are dicts encoded as BSON,
+  so ObjectIds and datetimes round-trip unchanged.
+
+``SHARED_STATE_URL`` picks the backend: unset or ``local`` for LocalState,
+``redis://[:password@]host:port/db`` for RedisState.
+"""
+import os
+import queue
+import socket
+import threading
+import time
+from urllib.parse import unquote, urlparse
+
+import bson
+
+# Expired keys are swept from LocalState at most this often
+SWEEP_SECONDS = 10.0
+# Extends a lease only while its owner still holds it, so a lease that expired and
+# was taken by another process is never extended on the new holder's behalf
+RENEW_LEASE_SCRIPT = (
+    "if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('PEXPIRE', KEYS[1], ARGV[2]) end return 0"
+)
+
+
+class SharedStateError(Exception):
+    pass
+
+
+class SharedState:
+    """Backend interface. Values and messages are dicts (BSON-encodable); ttl is in seconds."""
+
+    # Whether other processes see this state
+    distributed = False
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value, ttl=None):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def incr(self, key, ttl):
+        """Add one to a counter that expires ``ttl`` seconds after its last increment; returns the new count"""
+        raise NotImplementedError
+
+    def hold_lease(self, key, owner, ttl):
+        """Take the lease on ``key`` or renew it if ``owner`` holds it; True while ``owner`` holds it"""
+        raise NotImplementedError
+
+    def publish(self, channel, message):
+        raise NotImplementedError
+
+    def subscribe(self, channel, callback, on_connect=None):
+        """Call ``callback(message)`` on a background thread for every message on ``channel``.
+
+        ``on_connect()`` runs each time the subscription is (re)established,
+        before any message, so the subscriber can catch up on what it missed.
+        """
+        raise NotImplementedError
+
+    def cached(self, key, ttl, load):
+        """``load()`` at most once per ``ttl`` across the processes sharing this state; every time if ``ttl`` <= 0"""
+        if ttl is not None and ttl <= 0:
+            return load()
+        try:
+            value = self.get(key)
+        except SharedStateError as e:
+            print(f"Shared state unavailable, loading {key} directly: {e}")
+            return load()
+        if value is None:
+            value = load()
+            try:
+                self.set(key, value, ttl)
+            except SharedStateError as e:
+                print(f"Shared state unavailable, not caching {key}: {e}")
+        return value
+
+
+class LocalState(SharedState):
+    """Shared state within one process. Messages and cached values are passed as-is; treat them as read-only."""
+
+    def __init__(self):
+        self._values = {}
+        self._subscribers = {}
+        self._swept_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _live(self, key, now):
+        entry = self._values.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= now:
+            del self._values[key]
+            return None
+        return entry
+
+    def _store(self, key, value, ttl, now):
+        self._values[key] = (value, now + ttl if ttl is not None else None)
+        if now - self._swept_at > SWEEP_SECONDS:
+            self._swept_at = now
+            for stale in [k for k, (_, expires) in self._values.items() if expires is not None and expires <= now]:
+                del self._values[stale]
+
+    def get(self, key):
+        with self._lock:
+            entry = self._live(key, time.monotonic())
+            return entry[0] if entry else None
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._store(key, value, ttl, time.monotonic())
+
+    def delete(self, key):
+        with self._lock:
+            self._values.pop(key, None)
+
+    def incr(self, key, ttl):
+        with self._lock:
+            now = time.monotonic()
+            entry = self._live(key, now)
+            count = (entry[0] if entry else 0) + 1
+            self._store(key, count, ttl, now)
+            return count
+
+    def hold_lease(self, key, owner, ttl):
+        with self._lock:
+            now = time.monotonic()
+            entry = self._live(key, now)
+            if entry is not None and entry[0] != owner:
+                return False
+            self._store(key, owner, ttl, now)
+            return True
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for inbox in subscribers:
+            inbox.put(message)
+
+    def subscribe(self, channel, callback, on_connect=None):
+        inbox = queue.Queue()
+        with self._lock:
+            self._subscribers.setdefault(channel, []).append(inbox)
+
+        def deliver():
+            if on_connect:
+                on_connect()
+            while True:
+                message = inbox.get()
+                try:
+                    callback(message)
+                except Exception as e:
+                    print(f"Shared state subscriber on {channel} failed: {e}")
+
+        threading.Thread(target=deliver, name=f'shared-state-{channel}', daemon=True).start()
+
+
+def _encode_command(args):
+    parts = [b'*%d\r\n' % len(args)]
+    for arg in args:
+        if isinstance(arg, str):
+            arg = arg.encode()
+        elif isinstance(arg, int):
+            arg = str(arg).encode()
+        parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+    return b''.join(parts)
+
+
+class _Connection:
+    """One socket speaking RESP2"""
+
+    def __init__(self, host, port, timeout):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        self.file = self.sock.makefile('rb')
+
+    def send(self, *commands):
+        self.sock.sendall(b''.join(_encode_command(command) for command in commands))
+
+    def read(self):
+        line = self.file.readline()
+        if not line.endswith(b'\r\n'):
+            raise ConnectionError('Connection closed by the shared state server')
+        kind, rest = line[:1], line[1:-2]
+        if kind == b'+':
+            return rest.decode()
+        if kind == b'-':
+            return SharedStateError(rest.decode())
+        if kind == b':':
+            return int(rest)
+        if kind == b'$':
+            length = int(rest)
+            return None if length < 0 else self.file.read(length + 2)[:-2]
+        if kind == b'*':
+            length = int(rest)
+            return None if length < 0 else [self.read() for _ in range(length)]
+        raise SharedStateError(f'Unexpected reply from the shared state server: {line!r}')
+
+    def close(self):
+        try:
+            self.file.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class RedisState(SharedState):
+    """Shared state on a Redis-protocol server, with a small pool of connections"""
+
+    distributed = True
+
+    def __init__(self, url, timeout=5.0, pool_size=8):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.database = int(parsed.path.lstrip('/') or 0)
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self._pool = queue.LifoQueue()
+
+    def _connect(self, timeout):
+        connection = _Connection(self.host, self.port, timeout)
+        setup = []
+        if self.password:
+            setup.append(('AUTH', self.password))
+        if self.database:
+            setup.append(('SELECT', self.database))
+        if setup:
+            connection.send(*setup)
+            for _ in setup:
+                reply = connection.read()
+                if isinstance(reply, SharedStateError):
+                    connection.close()
+                    raise reply
+        return connection
+
+    def _execute(self, *commands):
+        """Send the commands in one round trip and return their replies; retries once on a dropped connection"""
+        for attempt in range(2):
+            try:
+                connection = self._pool.get_nowait()
+            except queue.Empty:
+                connection = None
+            try:
+                if connection is None:
+                    connection = self._connect(self.timeout)
+                connection.send(*commands)
+                replies = [connection.read() for _ in commands]
+            except OSError as e:
+                if connection is not None:
+                    connection.close()
+                if attempt:
+                    raise SharedStateError(f'{self.host}:{self.port}: {e}')
+                continue
+            if self._pool.qsize() < self.pool_size:
+                self._pool.put(connection)
+            else:
+                connection.close()
+            for reply in replies:
+                if isinstance(reply, SharedStateError):
+                    raise reply
+            return replies
+
+    @staticmethod
+    def _ttl_ms(ttl):
+        return max(1, int(ttl * 1000))
+
+    def get(self, key):
+        value = self._execute(('GET', key))[0]
+        return bson.decode(value) if value is not None else None
+
+    def set(self, key, value, ttl=None):
+        command = ('SET', key, bson.encode(value))
+        if ttl is not None:
+            command += ('PX', self._ttl_ms(ttl))
+        self._execute(command)
+
+    def delete(self, key):
+        self._execute(('DEL', key))
+
+    def incr(self, key, ttl):
+        return self._execute(('INCR', key), ('PEXPIRE', key, self._ttl_ms(ttl)))[0]
+
+    def hold_lease(self, key, owner, ttl):
+        ttl_ms = self._ttl_ms(ttl)
+        taken, renewed = self._execute(('SET', key, owner, 'NX', 'PX', ttl_ms),
+                                       ('EVAL', RENEW_LEASE_SCRIPT, 1, key, owner, ttl_ms))
+        return taken == 'OK' or renewed == 1
+
+    def publish(self, channel, message):
+        self._execute(('PUBLISH', channel, bson.encode(message)))
+
+    def subscribe(self, channel, callback, on_connect=None):
+        threading.Thread(target=self._listen, args=(channel, callback, on_connect),
+                         name=f'shared-state-{channel}', daemon=True).start()
+
+    def _listen(self, channel, callback, on_connect):
+        while True:
+            connection = None
+            try:
+                # No read timeout: a subscriber waits as long as the channel is quiet
+                connection = self._connect(None)
+                connection.send(('SUBSCRIBE', channel))
+                connection.read()
+                if on_connect:
+                    on_connect()
+                while True:
+                    reply = connection.read()
+                    if isinstance(reply, list) and reply and reply[0] == b'message':
+                        try:
+                            callback(bson.decode(reply[2]))
+                        except Exception as e:
+                            print(f"Shared state subscriber on {channel} failed: {e}")
+            except (OSError, SharedStateError) as e:
+                print(f"Shared state subscription to {channel} lost ({e}), reconnecting")
+                time.sleep(1.0)
+            finally:
+                if connection is not None:
+                    connection.close()
+
+
+def state_from_env():
+    """Backend named by SHARED_STATE_URL (in-process when unset)"""
+    url = os.getenv('SHARED_STATE_URL', '').strip()
+    if not url or url == 'local':
+        return LocalState()
+    if url.startswith('redis://'):
+        return RedisState(url)
+    raise ValueError(f'Unsupported SHARED_STATE_URL: {url}')
@@ -0,0 +1,338 @@
+"""Background SMS delivery through a durable outbox collection.
+
+Request handlers only ``enqueue`` a message (one insert); a small pool of worker
+threads claims due messages in batches, sends them through the configured
+provider under a shared rate limit, and retries failures with exponential
+backoff. Delivery status is written back to the order under ``sms.<kind>``.
+
+Messages claimed by a process that died mid-send are picked up again once
+their lease expires, so at-least-once delivery survives restarts. With a
+distributed shared state the send rate limit holds across all processes.
+"""
+import importlib.util
+import os
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from pymongo import UpdateOne
+
+from ordering_core.metrics import SMS_ENQUEUE_DURATION, SMS_SEND_DURATION
+from ordering_core.shared_state import SharedStateError
+
+
+def normalize_phone(phone_number):
+    if not phone_number.startswith('+'):
+        phone_number = '+1' + phone_number.replace('-', '').replace('(', '').replace(')', '').replace(' ', '')
+    return phone_number
+
+
+def placed_message(order):
+    return (f"Thank you {order['customer_name']}! Your order #{order['order_number']} has been placed. "
+            f"Total: ${order['total_price']:.2f}. We'll text you when it's ready!")
+
+
+def ready_message(order):
+    return f"Hi {order['customer_name']}! Your order #{order['order_number']} is ready for pickup!"
+
+
+class SmsProvider:
+    """Sends one message; raises on failure so the outbox can retry it"""
+
+    name = 'base'
+
+    def send(self, to, body):
+        raise NotImplementedError
+
+
+class TwilioProvider(SmsProvider):
+    name = 'twilio'
+
+    def __init__(self, account_sid, auth_token, from_number):
+        if importlib.util.find_spec('twilio') is None:
+            raise ImportError('the twilio package is not installed')
+        self.account_sid = account_sid
+        self.auth_token = auth_token
+        self.from_number = from_number
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        # twilio.rest takes longer to import than the rest of the SMS code; load it with the first message
+        with self._lock:
+            if self._client is None:
+                from twilio.rest import Client
+                self._client = Client(self.account_sid, self.auth_token)
+            return self._client
+
+    def send(self, to, body):
+        self.client.messages.create(body=body, from_=self.from_number, to=to)
+
+
+class LogProvider(SmsProvider):
+    """Prints messages instead of sending them (no Twilio credentials configured)"""
+
+    name = 'log'
+
+    def send(self, to, body):
+        print(f"SMS would be sent to {to}: {body}")
+
+
+class FakeProvider(SmsProvider):
+    """Offline provider for load tests: simulated latency and failure rate"""
+
+    name = 'fake'
+
+    def __init__(self, latency=0.05, failure_rate=0.0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.sent = []
+        self._lock = threading.Lock()
+
+    def send(self, to, body):
+        time.sleep(self.latency)
+        if random.random() < self.failure_rate:
+            raise RuntimeError('simulated provider failure')
+        with self._lock:
+            self.sent.append((to, body))
+
+
+def provider_from_env():
+    """SMS_PROVIDER=twilio|fake|log; defaults to Twilio when credentials are set"""
+    name = os.getenv('SMS_PROVIDER')
+    account_sid = os.getenv('TWILIO_ACCOUNT_SID')
+    auth_token = os.getenv('TWILIO_AUTH_TOKEN')
+    from_number = os.getenv('TWILIO_PHONE_NUMBER')
+    if name == 'fake':
+        return FakeProvider(latency=float(os.getenv('SMS_FAKE_LATENCY', '0.05')),
+                            failure_rate=float(os.getenv('SMS_FAKE_FAILURE_RATE', '0')))
+    if name in (None, 'twilio') and account_sid and auth_token and from_number:
+        try:
+            return TwilioProvider(account_sid, auth_token, from_number)
+        except Exception as e:
+            print(f"Twilio error: {e}")
+    return LogProvider()
+
+
+class RateLimiter:
+    """Token bucket shared by the worker threads of one process"""
+
+    def __init__(self, rate_per_second, burst=None):
+        self.rate = rate_per_second
+        self.capacity = burst or max(1, int(rate_per_second))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class SharedRateLimiter:
+    """Fixed-window counter in shared state, so every process together stays under the rate"""
+
+    def __init__(self, shared, name, rate_per_second):
+        self.shared = shared
+        self.name = name
+        self.window = max(1.0, 1.0 / rate_per_second)
+        self.limit = max(1, int(rate_per_second * self.window))
+
+    def acquire(self):
+        while True:
+            now = time.time()
+            window = int(now // self.window)
+            try:
+                count = self.shared.incr(f'rate:{self.name}:{window}', ttl=self.window * 2)
+            except SharedStateError as e:
+                # The provider still rejects excess sends, and those are retried
+                print(f"SMS rate limit unavailable: {e}")
+                return
+            if count <= self.limit:
+                return
+            time.sleep((window + 1) * self.window - now)
+
+
+class SmsOutbox:
+    def __init__(self, outbox, orders, provider, workers=2, rate_per_second=5.0, batch_size=10,
+                 max_attempts=5, base_delay=2.0, lease_seconds=60, poll_interval=1.0, limiter=None):
+        self.outbox = outbox
+        self.orders = orders
+        self.provider = provider
+        self.workers = workers
+        self.limiter = limiter or RateLimiter(rate_per_second)
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self._wake = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            for i in range(len(self._threads), self.workers):
+                thread = threading.Thread(target=self._work, name=f'sms-worker-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    @staticmethod
+    def _message(phone_number, message, order_id, kind, now):
+        return {
+            'to': normalize_phone(phone_number),
+            'body': message,
+            'order_id': order_id,
+            'kind': kind,
+            'status': 'queued',
+            'attempts': 0,
+            'next_attempt': now,
+            'created_at': now
+        }
+
+    def _queued(self, start, kind):
+        SMS_ENQUEUE_DURATION.observe(time.perf_counter() - start, kind=kind)
+        self.start()
+        self._wake.set()
+
+    def enqueue(self, phone_number, message, order_id=None, kind='notification'):
+        """Queue a message for delivery; returns False when there is no number to send to"""
+        if not phone_number:
+            return False
+        start = time.perf_counter()
+        self.outbox.insert_one(self._message(phone_number, message, order_id, kind, datetime.utcnow()))
+        self._queued(start, kind)
+        return True
+
+    async def enqueue_async(self, outbox, phone_number, message, order_id=None, kind='notification'):
+        """``enqueue`` for coroutines, inserting through the Motor collection ``outbox``"""
+        if not phone_number:
+            return False
+        start = time.perf_counter()
+        await outbox.insert_one(self._message(phone_number, message, order_id, kind, datetime.utcnow()))
+        self._queued(start, kind)
+        return True
+
+    def enqueue_many(self, messages, kind='notification', once=False):
+        """Queue ``(phone_number, message, order_id)`` tuples with one insert; returns how many were queued
+
+        With ``once``, orders that already have a message of this kind are skipped.
+        """
+        start = time.perf_counter()
+        now = datetime.utcnow()
+        messages = [(phone_number, message, order_id) for phone_number, message, order_id in messages if phone_number]
+        if once and messages:
+            queued = {m['order_id'] for m in self.outbox.find(
+                {'order_id': {'$in': [order_id for _, _, order_id in messages]}, 'kind': kind}, {'order_id': 1})}
+            messages = [message for message in messages if message[2] not in queued]
+        documents = [self._message(phone_number, message, order_id, kind, now)
+                     for phone_number, message, order_id in messages]
+        if not documents:
+            return 0
+        self.outbox.insert_many(documents)
+        self._queued(start, kind)
+        return len(documents)
+
+    def _claim_batch(self):
+        """Atomically mark up to batch_size due messages as ours"""
+        now = datetime.utcnow()
+        due = {'$or': [
+            {'status': 'queued', 'next_attempt': {'$lte': now}},
+            # Claimed by a worker that never reported back
+            {'status': 'sending', 'claimed_at': {'$lt': now - timedelta(seconds=self.lease_seconds)}}
+        ]}
+        ids = [m['_id'] for m in self.outbox.find(due, {'_id': 1}).sort('next_attempt', 1).limit(self.batch_size)]
+        if not ids:
+            return []
+        token = uuid.uuid4().hex
+        self.outbox.update_many({'_id': {'$in': ids}, **due},
+                                {'$set': {'status': 'sending', 'claimed_at': now, 'claim': token},
+                                 '$inc': {'attempts': 1}})
+        return list(self.outbox.find({'claim': token, 'status': 'sending'}))
+
+    def _renew_lease(self, token, owned):
+        """Restart the lease on a claimed batch; returns the ids in ``owned`` still claimed by ``token``"""
+        result = self.outbox.update_many({'claim': token, 'status': 'sending'},
+                                         {'$set': {'claimed_at': datetime.utcnow()}})
+        if result.matched_count == len(owned):
+            return owned
+        return {m['_id'] for m in self.outbox.find({'claim': token, 'status': 'sending'}, {'_id': 1})}
+
+    def _deliver(self, message):
+        """Send one message; returns the fields to record on it"""
+        now = datetime.utcnow()
+        start = time.perf_counter()
+        try:
+            self.provider.send(message['to'], message['body'])
+            SMS_SEND_DURATION.observe(time.perf_counter() - start, provider=self.provider.name, outcome='sent')
+            return {'status': 'sent', 'sent_at': now}
+        except Exception as e:
+            SMS_SEND_DURATION.observe(time.perf_counter() - start, provider=self.provider.name, outcome='error')
+            if message['attempts'] >= self.max_attempts:
+                print(f"SMS sending failed permanently: {e}")
+                return {'status': 'failed', 'last_error': str(e)}
+            delay = self.base_delay * 2 ** (message['attempts'] - 1) * random.uniform(0.8, 1.2)
+            return {'status': 'queued', 'last_error': str(e), 'next_attempt': now + timedelta(seconds=delay)}
+
+    def _process(self, batch):
+        outbox_updates = []
+        order_updates = []
+        token = batch[0]['claim']
+        owned = {message['_id'] for message in batch}
+        for message in batch:
+            self.limiter.acquire()
+            # A shared rate limit can hold a batch past its lease; renew it so no other
+            # worker reclaims these messages and sends them again
+            owned = self._renew_lease(token, owned)
+            if message['_id'] not in owned:
+                continue
+            result = self._deliver(message)
+            outbox_updates.append(UpdateOne({'_id': message['_id'], 'claim': message['claim']}, {'$set': result}))
+            if message.get('order_id') is not None:
+                order_updates.append(UpdateOne({'_id': message['order_id']}, {'$set': {
+                    f"sms.{message['kind']}": {'status': result['status'], 'attempts': message['attempts'],
+                                               'at': datetime.utcnow()}
+                }}))
+        if outbox_updates:
+            self.outbox.bulk_write(outbox_updates, ordered=False)
+        if order_updates:
+            self.orders.bulk_write(order_updates, ordered=False)
+
+    def _work(self):
+        while True:
+            try:
+                batch = self._claim_batch()
+                if batch:
+                    self._process(batch)
+                    continue
+            except Exception as e:
+                # Keep the worker alive; unfinished claims are retried once their lease expires
+                print(f"SMS outbox error: {e}")
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+
+def outbox_from_env(db, shared=None):
+    """SmsOutbox over db.sms_outbox, configured from SMS_* environment variables"""
+    rate_per_second = float(os.getenv('SMS_RATE_PER_SECOND', '5'))
+    limiter = None
+    if shared is not None and shared.distributed:
+        limiter = SharedRateLimiter(shared, 'sms', rate_per_second)
+    return SmsOutbox(
+        db.sms_outbox, db.orders, provider_from_env(),
+        workers=int(os.getenv('SMS_WORKERS', '2')),
+        rate_per_second=rate_per_second,
+        limiter=limiter
+    )
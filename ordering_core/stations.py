@@ -0,0 +1,282 @@
+"""Kitchen stations: order lines routed to per-station tickets, and the queue each station works from.
+
+When an order is placed its lines are split by menu category into one ticket
+per station (``STATIONS``), stored on the order::
+
+    'tickets': [{'station': 'grill', 'lines': [0, 2], 'units': 3, 'status': 'pending',
+                 'estimated_seconds': 600, 'start_by': ISODate(...)}]
+
+``lines`` index into the order's ``items``/``item_lines``. ``start_by`` is when
+the station should start so the ticket is ready by the order's target time: it
+folds the ticket's age, its estimated prep time and the order's size (catering
+orders get a longer target) into one value, and each station queue is simply
+sorted by it. The parent order moves to in_progress when its first ticket is
+started and to completed only when every ticket is done.
+
+Station queues are rebuilt in memory from the active order cache, once after
+each change rather than on every request, so a station screen costs the same
+however many orders are open: it gets the tickets being cooked and the first
+``limit`` queued ones.
+"""
+import hashlib
+import json
+import threading
+from datetime import datetime, timedelta
+
+from pymongo import ReturnDocument
+
+from ordering_core.active_orders import ACTIVE_STATUSES
+from ordering_core.order_deltas import revision_fields, revision_fields_async
+
+STATIONS = {
+    'grill': {'name': 'Grill', 'categories': ['main'], 'prep_seconds': 480},
+    'fryer': {'name': 'Fryer', 'categories': ['appetizer', 'side'], 'prep_seconds': 300},
+    'drinks': {'name': 'Drinks', 'categories': ['drink'], 'prep_seconds': 60},
+    'desserts': {'name': 'Desserts', 'categories': ['dessert'], 'prep_seconds': 120},
+}
+DEFAULT_STATION = 'grill'
+TICKET_STATUSES = ['pending', 'in_progress', 'done']
+# Tickets only move forward: the statuses a ticket may be in to move to each status
+TICKET_MOVES = {'in_progress': ['pending'], 'done': ['pending', 'in_progress']}
+# A ticket takes its longest line once, plus this share of every other unit (items cook side by side)
+EXTRA_UNIT_FACTOR = 0.25
+# Minutes from order to pickup the schedule aims for; catering-size orders are given longer
+TARGET_MINUTES = 15
+CATERING_UNITS = 12
+CATERING_TARGET_MINUTES = 40
+QUEUE_LIMIT = 20
+
+_CATEGORY_STATIONS = {category: station for station, config in STATIONS.items()
+                      for category in config['categories']}
+
+
+class TicketError(ValueError):
+    pass
+
+
+def station_for(category):
+    return _CATEGORY_STATIONS.get(category, DEFAULT_STATION)
+
+
+def estimate_seconds(lines, default_seconds, prep_seconds=None):
+    """Prep estimate for a set of lines: the longest unit once, plus a share of every other unit.
+
+    ``prep_seconds(item_id)`` gives an item's measured prep time (see
+    ready_times.PrepStats), or None to fall back on ``default_seconds``.
+    """
+    units = []
+    for line in lines:
+        seconds = (prep_seconds(line['item_id']) if prep_seconds else None) or default_seconds
+        units.extend([seconds] * line['quantity'])
+    if not units:
+        return 0
+    longest = max(units)
+    return round(longest + EXTRA_UNIT_FACTOR * (sum(units) - longest))
+
+
+class TicketRouter:
+    """Splits priced order lines into station tickets; built once per menu version"""
+
+    def __init__(self, menu_items):
+        self._stations = {str(item['_id']): station_for(item.get('category')) for item in menu_items}
+
+    def route(self, lines, order_time, prep_seconds=None):
+        grouped = {}
+        for index, line in enumerate(lines):
+            station = self._stations.get(line['item_id'], DEFAULT_STATION)
+            grouped.setdefault(station, []).append(index)
+        units = sum(line['quantity'] for line in lines)
+        target = timedelta(minutes=CATERING_TARGET_MINUTES if units >= CATERING_UNITS else TARGET_MINUTES)
+        tickets = []
+        for station in STATIONS:
+            if station not in grouped:
+                continue
+            station_lines = [lines[index] for index in grouped[station]]
+            estimate = estimate_seconds(station_lines, STATIONS[station]['prep_seconds'], prep_seconds)
+            tickets.append({
+                'station': station,
+                'lines': grouped[station],
+                'units': sum(line['quantity'] for line in station_lines),
+                'status': 'pending',
+                'estimated_seconds': estimate,
+                'start_by': order_time + target - timedelta(seconds=estimate)
+            })
+        return tickets
+
+
+def _ticket_update(order_id, station, status):
+    """Filter and $set fields that move ``station``'s ticket on an order forward to ``status``"""
+    if station not in STATIONS:
+        raise TicketError(f'Unknown station: {station}')
+    if status not in TICKET_STATUSES:
+        raise TicketError(f'Unknown ticket status: {status}')
+    if status not in TICKET_MOVES:
+        raise TicketError(f'Tickets cannot move back to {status}')
+    now = datetime.utcnow()
+    fields = {'tickets.$.status': status}
+    if status == 'in_progress':
+        fields['tickets.$.started_at'] = now
+    elif status == 'done':
+        fields['tickets.$.done_at'] = now
+    # $elemMatch makes the positional $ the ticket that matched station and status together
+    return ({'_id': order_id, 'status': {'$in': ACTIVE_STATUSES},
+             'tickets': {'$elemMatch': {'station': station, 'status': {'$in': TICKET_MOVES[status]}}}},
+            fields)
+
+
+def _order_update(order_id, status):
+    """Filter and $set fields that move the order along after one of its tickets moved to ``status``"""
+    if status == 'in_progress':
+        return {'_id': order_id, 'status': 'pending'}, {'status': 'in_progress'}
+    if status == 'done':
+        # Conditional on every ticket being done, so of two stations finishing at once exactly one completes it
+        return ({'_id': order_id, 'status': {'$in': ACTIVE_STATUSES},
+                 'tickets.status': {'$nin': ['pending', 'in_progress']}},
+                {'status': 'completed', 'completed_time': datetime.utcnow()})
+    return None
+
+
+def close_tickets(tickets, now):
+    """$set fields marking the open ``tickets`` of an order done, for an order completed from the dashboard.
+
+    They get ``closed_at`` rather than ``done_at``: when the order was completed
+    says nothing about how long the station took, so it is not a prep sample.
+    """
+    fields = {}
+    for index, ticket in enumerate(tickets):
+        if ticket.get('status') != 'done':
+            fields[f'tickets.{index}.status'] = 'done'
+            fields[f'tickets.{index}.closed_at'] = now
+    return fields
+
+
+def set_ticket_status(db, order_id, station, status):
+    """Move one ticket to ``status`` and roll the change up to its order.
+
+    Returns ``(order, completed)``: the order after the writes, and whether
+    this call was the one that completed it (all tickets done).
+    """
+    query, fields = _ticket_update(order_id, station, status)
+    result = db.orders.update_one(query, {'$set': {**fields, **revision_fields(db)}})
+    if not result.matched_count:
+        raise TicketError(f'No {station} ticket on this order can move to {status}')
+
+    order = None
+    order_update = _order_update(order_id, status)
+    if order_update is not None:
+        query, fields = order_update
+        order = db.orders.find_one_and_update(query, {'$set': {**fields, **revision_fields(db)}},
+                                              return_document=ReturnDocument.AFTER)
+        if order is not None and fields['status'] == 'completed':
+            return order, True
+    return order or db.orders.find_one({'_id': order_id}), False
+
+
+async def set_ticket_status_async(db, order_id, station, status):
+    """``set_ticket_status`` for coroutines, over a Motor database"""
+    query, fields = _ticket_update(order_id, station, status)
+    result = await db.orders.update_one(query, {'$set': {**fields, **await revision_fields_async(db)}})
+    if not result.matched_count:
+        raise TicketError(f'No {station} ticket on this order can move to {status}')
+
+    order = None
+    order_update = _order_update(order_id, status)
+    if order_update is not None:
+        query, fields = order_update
+        order = await db.orders.find_one_and_update(query, {'$set': {**fields, **await revision_fields_async(db)}},
+                                                    return_document=ReturnDocument.AFTER)
+        if order is not None and fields['status'] == 'completed':
+            return order, True
+    return order or await db.orders.find_one({'_id': order_id}), False
+
+
+def _isoformat(value):
+    return value.isoformat() if isinstance(value, datetime) else None
+
+
+def _ticket_view(order, ticket):
+    lines = order.get('item_lines') or []
+    tickets = order.get('tickets') or []
+    return {
+        'order_id': str(order['_id']),
+        'order_number': order['order_number'],
+        'customer_name': order['customer_name'],
+        'lines': [lines[index] for index in ticket['lines'] if index < len(lines)],
+        'units': ticket.get('units', 0),
+        'status': ticket['status'],
+        'estimated_seconds': ticket.get('estimated_seconds'),
+        'start_by': _isoformat(ticket.get('start_by')),
+        'started_at': _isoformat(ticket.get('started_at')),
+        'order_time': _isoformat(order.get('order_time')),
+        'tickets_done': sum(1 for t in tickets if t['status'] == 'done'),
+        'tickets_total': len(tickets)
+    }
+
+
+def _queue_key(entry):
+    return entry['start_by'] or '', entry['order_time'] or '', entry['order_id']
+
+
+class StationBoard:
+    """Per-station queues over an ActiveOrderCache, rebuilt lazily after the cache changes"""
+
+    def __init__(self, cache, limit=QUEUE_LIMIT):
+        self.cache = cache
+        self.limit = limit
+        self.rebuilds = 0
+        self._views = None
+        self._generation = 0
+        self._lock = threading.Lock()
+        cache.add_listener(self.invalidate)
+
+    def invalidate(self):
+        self._generation += 1
+        self._views = None
+
+    def _rebuild(self):
+        queues = {station: ([], []) for station in STATIONS}
+        for order in self.cache.orders(window_minutes=0):
+            for ticket in order.get('tickets') or []:
+                if ticket['station'] in queues and ticket['status'] != 'done':
+                    cooking, queued = queues[ticket['station']]
+                    (cooking if ticket['status'] == 'in_progress' else queued).append(_ticket_view(order, ticket))
+        views = {}
+        for station, (cooking, queued) in queues.items():
+            cooking.sort(key=lambda entry: (entry['started_at'] or '', entry['order_id']))
+            queued.sort(key=_queue_key)
+            view = {
+                'station': station,
+                'name': STATIONS[station]['name'],
+                'in_progress': cooking[:self.limit],
+                'queued': queued[:self.limit],
+                'in_progress_count': len(cooking),
+                'queued_count': len(queued)
+            }
+            body = json.dumps(view, separators=(',', ':'))
+            views[station] = (view, hashlib.sha1(body.encode()).hexdigest()[:16])
+        self.rebuilds += 1
+        return views
+
+    def view(self, station):
+        """``(payload, etag)`` for one station"""
+        if station not in STATIONS:
+            raise TicketError(f'Unknown station: {station}')
+        views = self._views
+        if views is None:
+            with self._lock:
+                views = self._views
+                if views is None:
+                    generation = self._generation
+                    views = self._rebuild()
+                    # A change that landed during the rebuild leaves the cache empty for the next caller
+                    if generation == self._generation:
+                        self._views = views
+        return views[station]
+
+    def summary(self):
+        """Queue lengths for every station"""
+        summary = []
+        for station in STATIONS:
+            view = self.view(station)[0]
+            summary.append({key: view[key] for key in ('station', 'name', 'in_progress_count', 'queued_count')})
+        return summary
@@ -2,32 +2,20 @@
 """
 Seed script to populate the database with sample menu items
 Run this script after starting the MongoDB container
+
+Items are upserted by name, so re-running it only adds the sample items that
+are missing; existing items, and any edits made to them, are left alone.
 """
 
-from pymongo import MongoClient
-from datetime import datetime
-import os
-from dotenv import load_dotenv
 
-load_dotenv()
+from ordering_core.config import database
+from ordering_core.menu_import import normalize, plan_import
 
 # Connect to MongoDB
-mongo_uri = os.environ.get('MONGO_URI', 'mongodb://localhost:27017/ordering_system')
-client = MongoClient(mongo_uri)
-db = client.get_database()
+db = database()
 
 print("🌱 Seeding database with sample menu items...")
 
-# Check if menu items already exist
-existing_count = db.menu_items.count_documents({})
-if existing_count > 0:
-    print(f"   Database already has {existing_count} menu items. Skipping seed.")
-    print("   To re-seed, delete all menu items first.")
-    client.close()
-    exit(0)
-
-print("   No existing menu items found. Adding sample data...")
-
 # Sample menu items
 sample_items = [
     {
@@ -42,8 +30,7 @@ sample_items = [
             {'name': 'Avocado', 'price': 1.50},
             {'name': 'No Onions', 'price': 0.00}
         ],
-        'active': True,
-        'created_at': datetime.utcnow()
+        'active': True
     },
     {
         'name': 'Margherita Pizza',
@@ -57,8 +44,7 @@ sample_items = [
             {'name': 'Mushrooms', 'price': 1.50},
             {'name': 'Olives', 'price': 1.00}
         ],
-        'active': True,
-        'created_at': datetime.utcnow()
+        'active': True
     },
     {
         'name': 'Caesar Salad',
@@ -71,8 +57,7 @@ sample_items = [
             {'name': 'Shrimp', 'price': 4.50},
             {'name': 'Extra Parmesan', 'price': 1.00}
         ],
-        'active': True,
-        'created_at': datetime.utcnow()
+        'active': True
     },
     {
         'name': 'Chicken Wings',
@@ -86,8 +71,7 @@ sample_items = [
             {'name': 'Honey Garlic', 'price': 0.00},
             {'name': 'Extra Spicy', 'price': 0.50}
         ],
-        'active': True,
-        'created_at': datetime.utcnow()
+        'active': True
     },
     {
         'name': 'French Fries',
@@ -100,8 +84,7 @@ sample_items = [
             {'name': 'Bacon Bits', 'price': 2.00},
             {'name': 'Cajun Seasoning', 'price': 0.50}
         ],
-        'active': True,
-        'created_at': datetime.utcnow()
+        'active': True
     },
     {
         'name': 'Onion Rings',
@@ -113,8 +96,7 @@ sample_items = [
             {'name': 'Ranch Dip', 'price': 0.50},
             {'name': 'Spicy Mayo', 'price': 0.50}
         ],
-        'active': True,
-        'created_at': datetime.utcnow()
+        'active': True
     },
     {
         'name': 'Coca-Cola',
@@ -127,8 +109,7 @@ sample_items = [
             {'name': 'Extra Ice', 'price': 0.00},
             {'name': 'No Ice', 'price': 0.00}
         ],
-        'active': True,
-        'created_at': datetime.utcnow()
+        'active': True
     },
     {
         'name': 'Lemonade',
@@ -141,8 +122,7 @@ sample_items = [
             {'name': 'Strawberry', 'price': 0.50},
             {'name': 'Mint', 'price': 0.50}
         ],
-        'active': True,
-        'created_at': datetime.utcnow()
+        'active': True
     },
     {
         'name': 'Chocolate Cake',
@@ -155,8 +135,7 @@ sample_items = [
             {'name': 'Whipped Cream', 'price': 1.00},
             {'name': 'Extra Chocolate Sauce', 'price': 0.50}
         ],
-        'active': True,
-        'created_at': datetime.utcnow()
+        'active': True
     },
     {
         'name': 'Apple Pie',
@@ -169,14 +148,18 @@ sample_items = [
             {'name': 'Caramel Sauce', 'price': 0.50},
             {'name': 'Warmed', 'price': 0.00}
         ],
-        'active': True,
-        'created_at': datetime.utcnow()
+        'active': True
     }
 ]
 
-# Insert menu items
-result = db.menu_items.insert_many(sample_items)
-print(f"✅ Successfully added {len(result.inserted_ids)} menu items!")
+# Upsert by name in one bulk write, creating only the items that are missing
+items = [normalize(item, row) for row, item in enumerate(sample_items, start=1)]
+plan = plan_import(db.menu_items, items, update_existing=False)
+if plan.changed:
+    plan.apply(db)
+    print(f"✅ Added {len(plan.create)} menu items ({len(plan.unchanged)} already present)")
+else:
+    print(f"   All {len(plan.unchanged)} sample items are already on the menu.")
 
 print("\n📋 Menu items by category:")
 for category in ['appetizer', 'main', 'side', 'drink', 'dessert']:
@@ -186,4 +169,4 @@ for category in ['appetizer', 'main', 'side', 'drink', 'dessert']:
 print("\n✨ Database seeding complete!")
 print("   You can now access the customer ordering page and admin menu page")
 
-client.close()
+db.client.close()
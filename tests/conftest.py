@@ -0,0 +1,24 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The services import ordering_core from the repository root; the benchmark harness loads them on mongomock
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+
+@pytest.fixture(scope='session')
+def services():
+    from harness import load_services
+    return load_services(mock=True)
+
+
+@pytest.fixture
+def db(services):
+    """The services' (shared mongomock) database, emptied"""
+    db = services['employee_service'].mongo.db
+    for name in db.list_collection_names():
+        db.drop_collection(name)
+    return db
@@ -0,0 +1,46 @@
+import json
+
+import pytest
+
+VALID = {'name': 'Burger', 'category': 'main', 'description': '', 'base_price': '9.99',
+         'customizations': json.dumps([{'name': 'Bacon', 'price': 1.5}])}
+
+
+def flashes(client):
+    with client.session_transaction() as session:
+        return session.get('_flashes', [])
+
+
+@pytest.fixture
+def client(services, db):
+    return services['employee_service'].app.test_client()
+
+
+def test_add_item(client, db):
+    assert client.post('/admin/menu/add', data=VALID).status_code == 302
+    item = db.menu_items.find_one({'name': 'Burger'})
+    assert item['base_price'] == 9.99
+    assert item['customizations'][0]['price'] == 1.5
+
+
+@pytest.mark.parametrize('field, value', [
+    ('base_price', 'nan'), ('base_price', 'inf'), ('base_price', '-1'), ('base_price', 'free'),
+    ('customizations', '[{"name": "Bacon", "price": NaN}]'),
+    ('customizations', '[{"name": "Bacon", "price": Infinity}]'),
+    ('customizations', '[{"name": "Bacon", "price": -2}]'),
+])
+def test_add_rejects_invalid_prices(client, db, field, value):
+    client.post('/admin/menu/add', data={**VALID, field: value})
+    assert db.menu_items.count_documents({}) == 0
+    assert flashes(client)[-1][0] == 'error'
+
+
+@pytest.mark.parametrize('field, value', [
+    ('base_price', 'inf'), ('customizations', '[{"name": "Bacon", "price": NaN}]'),
+])
+def test_edit_rejects_invalid_prices(client, db, field, value):
+    client.post('/admin/menu/add', data=VALID)
+    item = db.menu_items.find_one({'name': 'Burger'})
+    client.post(f"/admin/menu/edit/{item['_id']}", data={**VALID, field: value})
+    assert db.menu_items.find_one({'_id': item['_id']}) == item
+    assert flashes(client)[-1][0] == 'error'
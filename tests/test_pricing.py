@@ -0,0 +1,33 @@
+import pytest
+from bson.objectid import ObjectId
+
+from ordering_core.pricing import PriceIndex, PricingError
+
+
+def menu_item(name, base_price, customizations=()):
+    return {'_id': ObjectId(), 'name': name, 'base_price': base_price, 'customizations': list(customizations)}
+
+
+@pytest.mark.parametrize('bad_price', [float('nan'), float('inf'), -1.0, 'free', None])
+def test_corrupt_item_does_not_break_the_menu(bad_price):
+    burger = menu_item('Burger', 9.99, [{'id': 'c1', 'name': 'Bacon', 'price': 1.5}])
+    corrupt = menu_item('Corrupt', bad_price)
+    fries = menu_item('Fries', 3.49)
+    index = PriceIndex([burger, corrupt, fries])
+
+    assert index.skipped == [str(corrupt['_id'])]
+    lines, total = index.price([{'id': str(burger['_id']), 'quantity': 2, 'customization_ids': ['c1']},
+                                {'id': str(fries['_id']), 'quantity': 1}])
+    assert total == 2 * (999 + 150) + 349
+    assert [line['unit_cents'] for line in lines] == [1149, 349]
+    with pytest.raises(PricingError):
+        index.price([{'id': str(corrupt['_id']), 'quantity': 1}])
+
+
+def test_corrupt_customization_skips_its_item():
+    salad = menu_item('Salad', 7.5, [{'id': 'c1', 'name': 'Chicken', 'price': float('nan')}])
+    soup = menu_item('Soup', 4.25)
+    index = PriceIndex([salad, soup])
+
+    assert index.skipped == [str(salad['_id'])]
+    assert index.price([{'id': str(soup['_id']), 'quantity': 1}])[1] == 425
@@ -0,0 +1,33 @@
+from datetime import datetime, timedelta
+
+from ordering_core.ready_times import prep_samples
+from ordering_core.stations import close_tickets
+
+T0 = datetime(2024, 1, 1, 12)
+
+
+def order(tickets):
+    return {'items': [{'item_id': 'burger'}, {'item_id': 'cola'}], 'tickets': tickets,
+            'order_time': T0, 'completed_time': T0 + timedelta(minutes=30)}
+
+
+def test_ticket_start_to_done_is_the_sample():
+    samples = prep_samples(order([
+        {'station': 'grill', 'lines': [0], 'status': 'done',
+         'started_at': T0 + timedelta(minutes=5), 'done_at': T0 + timedelta(minutes=13)},
+        {'station': 'drinks', 'lines': [1], 'status': 'done',
+         'started_at': T0 + timedelta(minutes=1), 'done_at': T0 + timedelta(minutes=2)},
+    ]))
+    assert samples == {'burger': [480.0], 'cola': [60.0]}
+
+
+def test_dashboard_completion_adds_no_samples():
+    # Order to completion includes the queue and the wait for the dashboard, not cook time
+    tickets = [{'station': 'grill', 'lines': [0], 'status': 'in_progress', 'started_at': T0},
+               {'station': 'drinks', 'lines': [1], 'status': 'pending'}]
+    completed = order(tickets)
+    for key, value in close_tickets(tickets, completed['completed_time']).items():
+        _, index, field = key.split('.')
+        tickets[int(index)][field] = value
+    assert prep_samples(completed) == {}
+    assert prep_samples(order([])) == {}
@@ -0,0 +1,44 @@
+import time
+
+import pytest
+
+import resp_server
+from ordering_core.shared_state import LocalState, RedisState
+
+
+@pytest.fixture(params=['local', 'redis'])
+def state(request):
+    if request.param == 'local':
+        yield LocalState()
+        return
+    server = resp_server.start()
+    yield RedisState(f'redis://127.0.0.1:{server.server_address[1]}/0')
+    server.shutdown()
+
+
+def test_cached_loads_once_per_ttl(state):
+    calls = []
+    load = lambda: calls.append(1) or {'version': len(calls)}
+    assert state.cached('menu:version', 60, load) == {'version': 1}
+    assert state.cached('menu:version', 60, load) == {'version': 1}
+    assert len(calls) == 1
+
+
+def test_cached_with_zero_ttl_loads_every_time(state):
+    # MENU_VERSION_CHECK_SECONDS=0 means check every time, not cache forever
+    calls = []
+    load = lambda: calls.append(1) or {'version': len(calls)}
+    assert state.cached('menu:version', 0, load) == {'version': 1}
+    assert state.cached('menu:version', 0, load) == {'version': 2}
+    assert len(calls) == 2
+
+
+def test_set_with_zero_ttl_expires(state):
+    state.set('key', {'value': 1}, 0)
+    time.sleep(0.01)
+    assert state.get('key') is None
+
+
+def test_set_without_ttl_keeps(state):
+    state.set('key', {'value': 1})
+    assert state.get('key') == {'value': 1}
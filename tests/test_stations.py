@@ -0,0 +1,49 @@
+from datetime import datetime
+
+import pytest
+
+from ordering_core.stations import TicketError, set_ticket_status
+
+
+@pytest.fixture
+def order_id(db):
+    tickets = [{'station': station, 'lines': [index], 'units': 1, 'status': 'pending'}
+               for index, station in enumerate(['grill', 'drinks'])]
+    return db.orders.insert_one({'order_number': 1, 'customer_name': 'Ann', 'status': 'pending',
+                                 'order_time': datetime.utcnow(), 'tickets': tickets}).inserted_id
+
+
+def statuses(order):
+    return {ticket['station']: ticket['status'] for ticket in order['tickets']}
+
+
+def test_tickets_roll_up_to_the_order(db, order_id):
+    order, completed = set_ticket_status(db, order_id, 'grill', 'in_progress')
+    assert order['status'] == 'in_progress' and not completed
+    set_ticket_status(db, order_id, 'grill', 'done')
+    order, completed = set_ticket_status(db, order_id, 'drinks', 'done')
+    assert order['status'] == 'completed' and completed
+    assert statuses(order) == {'grill': 'done', 'drinks': 'done'}
+
+
+@pytest.mark.parametrize('moves, status', [
+    (['in_progress'], 'pending'),
+    (['done'], 'pending'),
+    (['done'], 'in_progress'),
+    (['in_progress'], 'in_progress'),
+    (['done'], 'done'),
+])
+def test_tickets_only_move_forward(db, order_id, moves, status):
+    for move in moves:
+        set_ticket_status(db, order_id, 'grill', move)
+    before = db.orders.find_one({'_id': order_id})
+    with pytest.raises(TicketError):
+        set_ticket_status(db, order_id, 'grill', status)
+    assert db.orders.find_one({'_id': order_id})['tickets'] == before['tickets']
+
+
+def test_restart_keeps_started_at(db, order_id):
+    started = set_ticket_status(db, order_id, 'grill', 'in_progress')[0]['tickets'][0]['started_at']
+    with pytest.raises(TicketError):
+        set_ticket_status(db, order_id, 'grill', 'in_progress')
+    assert db.orders.find_one({'_id': order_id})['tickets'][0]['started_at'] == started